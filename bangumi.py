@@ -0,0 +1,221 @@
+'''
+获取追番/追剧列表
+'''
+
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator, Optional
+
+import schemas
+from config import BiliAPI, DATA_DIR
+from crawler import BiliCrawler
+from records import BangumiRecord
+from utils import write_head
+
+
+class BangumiFollow(BiliCrawler):
+    '''
+    追番/追剧列表爬取类
+    '''
+    # 关注类型: 1=追番 2=追剧
+    FOLLOW_TYPES = {1: '追番', 2: '追剧'}
+    # 关注状态: 1=想看 2=在看 3=看过
+    FOLLOW_STATUSES = (1, 2, 3)
+    # 每页数量(接口最大30)
+    PAGE_SIZE = 30
+
+    def __init__(self, cookies: dict = None):
+        super().__init__(cookies=cookies)
+        self.data_dir = os.path.join(DATA_DIR, 'bangumi')
+        self.fingerprint_file = os.path.join(self.data_dir, 'fingerprints.json')
+        self._fingerprint_lock = threading.Lock()
+
+    def get_follow_page(self, mid: int, follow_type: int = 1, follow_status: int = 0,
+                        pn: int = 1) -> Optional[dict]:
+        """
+        获取追番/追剧列表(单页)
+        Args:
+            mid: 用户MID
+            follow_type: 1=追番 2=追剧
+            follow_status: 0=全部 1=想看 2=在看 3=看过
+            pn: 页码
+        Returns:
+            dict: 列表数据(list, total)
+        """
+        params = {
+            'vmid': mid,
+            'type': follow_type,
+            'follow_status': follow_status,
+            'pn': pn,
+            'ps': self.PAGE_SIZE,
+        }
+        resp = self._request(BiliAPI.BANGUMI_LIST, params=params, schema=schemas.BANGUMI_LIST)
+
+        if resp.get('code') != 0:
+            print(f"获取{self.FOLLOW_TYPES.get(follow_type)}列表失败: {resp.get('message')}")
+            return None
+
+        return resp['data']
+
+    @staticmethod
+    def _fingerprint(data: dict) -> str:
+        '''
+        第一页的指纹: 总数 + 第一页每一项的季度ID和观看进度
+
+        列表按最近更新排序, 有新增、删除或观看进度变化时第一页都会改变
+        '''
+        items = [
+            (item.get('season_id'), item.get('progress'))
+            for item in data.get('list') or []
+        ]
+        raw = json.dumps([data.get('total'), items], ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _load_fingerprints(self) -> dict:
+        if os.path.exists(self.fingerprint_file):
+            with open(self.fingerprint_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def _save_fingerprint(self, key: str, fingerprint: str):
+        with self._fingerprint_lock:
+            fingerprints = self._load_fingerprints()
+            fingerprints[key] = fingerprint
+            tmp_file = self.fingerprint_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(fingerprints, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.fingerprint_file)
+
+    def iter_follow(self, mid: int, follow_type: int = 1, follow_status: int = 0,
+                    first_page: dict = None) -> Generator[BangumiRecord, None, None]:
+        """
+        逐页迭代追番/追剧列表
+        Args:
+            mid: 用户MID
+            follow_type: 1=追番 2=追剧
+            follow_status: 0=全部 1=想看 2=在看 3=看过
+            first_page: 已经获取的第一页数据(避免重复请求)
+        Yields:
+            BangumiRecord: 单项
+        """
+        pn = 1
+        data = first_page
+        while True:
+            if data is None:
+                data = self.get_follow_page(mid, follow_type, follow_status, pn)
+            if not data or not data.get('list'):
+                return
+
+            for item in data['list']:
+                yield BangumiRecord.from_api(item, follow_type=follow_type, follow_status=follow_status)
+
+            if pn * self.PAGE_SIZE >= (data.get('total') or 0):
+                return
+            pn += 1
+            data = None
+            # 避免请求过快
+            time.sleep(0.3)
+
+    def category_file(self, mid: int, follow_type: int, follow_status: int) -> str:
+        '''
+        单个分类的保存路径
+        '''
+        return os.path.join(self.data_dir, f'{mid}_{follow_type}_{follow_status}.csv')
+
+    def crawl_category(self, mid: int, follow_type: int, follow_status: int,
+                       incremental: bool = True) -> tuple:
+        """
+        获取单个分类并边获取边写入CSV
+        Args:
+            mid: 用户MID
+            follow_type: 1=追番 2=追剧
+            follow_status: 1=想看 2=在看 3=看过
+            incremental: 第一页指纹未变化时跳过(只消耗一次请求)
+        Returns:
+            tuple: (写入条数, 是否跳过), 失败时写入条数为None
+        """
+        key = f'{mid}:{follow_type}:{follow_status}'
+        out_file = self.category_file(mid, follow_type, follow_status)
+
+        first_page = self.get_follow_page(mid, follow_type, follow_status, pn=1)
+        if first_page is None:
+            return None, False
+
+        fingerprint = self._fingerprint(first_page)
+        if incremental and os.path.exists(out_file) and \
+                self._load_fingerprints().get(key) == fingerprint:
+            return 0, True
+
+        # 先写入临时文件, 完整获取后再替换, 中断时保留旧数据
+        tmp_file = out_file + '.tmp'
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        write_head(tmp_file, BangumiRecord.HEADS)
+
+        count = 0
+        with open(tmp_file, mode='a', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            for record in self.iter_follow(mid, follow_type, follow_status, first_page=first_page):
+                writer.writerow(record.to_row())
+                count += 1
+
+        total = first_page.get('total') or 0
+        if count < total:
+            print(f"⚠️ {key} 只获取到 {count}/{total} 条, 保留旧数据")
+            os.remove(tmp_file)
+            return None, False
+
+        os.replace(tmp_file, out_file)
+        self._save_fingerprint(key, fingerprint)
+        return count, False
+
+    def crawl_all(self, mid: int = None, follow_types: tuple = (1, 2),
+                  incremental: bool = True, workers: int = 4) -> dict:
+        """
+        并发获取所有类型和状态的列表
+        Args:
+            mid: 用户MID, 默认为当前登录用户
+            follow_types: 要获取的关注类型
+            incremental: 第一页指纹未变化的分类跳过
+            workers: 并发数
+        Returns:
+            dict: {(类型, 状态): 写入条数}, 跳过的分类为0, 失败的为None
+        """
+        if mid is None:
+            mid = self.get_mid()
+            if not mid:
+                print("未登录")
+                return {}
+
+        os.makedirs(self.data_dir, exist_ok=True)
+        categories = [(t, s) for t in follow_types for s in self.FOLLOW_STATUSES]
+
+        results = {}
+        skipped = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self.crawl_category, mid, t, s, incremental): (t, s)
+                for t, s in categories
+            }
+            for future, (t, s) in futures.items():
+                count, was_skipped = future.result()
+                results[(t, s)] = count
+                skipped += was_skipped
+                name = f"{self.FOLLOW_TYPES[t]}-{BangumiRecord.STATUS_NAMES[s]}"
+                if was_skipped:
+                    print(f"  {name}: 未变化, 跳过")
+                elif count is not None:
+                    print(f"  {name}: {count} 条")
+
+        print(f"✓ 追番/追剧列表已保存到: {self.data_dir} (跳过 {skipped} 个未变化的分类)")
+        return results
+
+
+if __name__ == '__main__':
+    bangumi = BangumiFollow()
+    bangumi.crawl_all()
@@ -0,0 +1,228 @@
+'''
+性能基准测试
+
+用法:
+    python benchmark.py            # 运行全部基准
+    python benchmark.py records    # 只运行指定基准
+'''
+
+import sys
+import time
+import tracemalloc
+
+
+def _measure_alloc(factory, count: int) -> tuple:
+    '''
+    测量构建count条记录的内存占用和耗时
+
+    :param factory: 接收序号返回单条记录的函数
+    :param count: 记录数
+    :return: (每条记录平均字节数, 总耗时秒)
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    items = [factory(i) for i in range(count)]
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    return current / count, elapsed
+
+
+def _sample_reply(i: int) -> dict:
+    return {
+        'rpid': 100000000 + i,
+        'content': {'message': f'评论内容{i}'},
+        'member': {'mid': 20000 + i, 'uname': f'用户{i}'},
+        'like': i % 1000,
+        'rcount': i % 10,
+        'ctime': 1700000000 + i,
+    }
+
+
+def _sample_video(i: int) -> dict:
+    return {
+        'bvid': f'BV1xx411c7{i:03d}',
+        'aid': 170001 + i,
+        'title': f'视频标题{i}',
+        'desc': '简介',
+        'duration': 300 + i % 600,
+        'pubdate': 1700000000 + i,
+        'ctime': 1700000000 + i,
+        'owner': {'mid': 1000 + i, 'name': f'UP{i}', 'face': 'https://i0.hdslb.com/bfs/face/x.jpg'},
+        'stat': {'view': i * 10, 'danmaku': i, 'reply': i, 'favorite': i,
+                 'coin': i, 'share': i, 'like': i},
+        'pic': 'https://i0.hdslb.com/bfs/archive/x.jpg',
+        'tname': '日常',
+    }
+
+
+def _sample_history(i: int) -> dict:
+    return {
+        'title': f'视频标题{i}',
+        'author_name': f'UP{i}',
+        'author_mid': 1000 + i,
+        'view_at': 1700000000 + i,
+        'progress': i % 300,
+        'duration': 300,
+        'cover': 'https://i0.hdslb.com/bfs/archive/x.jpg',
+        'history': {'bvid': f'BV1xx411c7{i:03d}', 'business': 'archive'},
+    }
+
+
+def bench_records(count: int = 200000):
+    '''
+    对比嵌套字典和 __slots__ 记录类型的单条内存占用
+    '''
+    from records import CommentRecord, HistoryRecord, VideoRecord
+    from utils import timestamp_to_datetime
+
+    def comment_dict(i):
+        reply = _sample_reply(i)
+        return {
+            'rpid': reply.get('rpid'),
+            'content': reply.get('content', {}).get('message', ''),
+            'member': {
+                'mid': reply.get('member', {}).get('mid'),
+                'uname': reply.get('member', {}).get('uname'),
+            },
+            'like': reply.get('like', 0),
+            'rcount': reply.get('rcount', 0),
+            'ctime': reply.get('ctime'),
+        }
+
+    def video_dict(i):
+        data = _sample_video(i)
+        return {
+            'bvid': data.get('bvid'),
+            'aid': data.get('aid'),
+            'title': data.get('title'),
+            'desc': data.get('desc', ''),
+            'duration': data.get('duration', 0),
+            'pubdate': data.get('pubdate'),
+            'ctime': data.get('ctime'),
+            'owner': dict(data['owner']),
+            'stat': dict(data['stat']),
+            'pic': data.get('pic'),
+            'tname': data.get('tname'),
+        }
+
+    def history_dict(i):
+        item = _sample_history(i)
+        return {
+            'bvid': item['history'].get('bvid'),
+            'title': item.get('title'),
+            'author_name': item.get('author_name'),
+            'author_mid': item.get('author_mid'),
+            'view_at': item.get('view_at'),
+            'view_at_str': timestamp_to_datetime(item.get('view_at', 0)),
+            'progress': item.get('progress', 0),
+            'duration': item.get('duration', 0),
+            'cover': item.get('cover'),
+        }
+
+    cases = [
+        ('comment', comment_dict, lambda i: CommentRecord.from_api(_sample_reply(i), oid=1)),
+        ('video', video_dict, lambda i: VideoRecord.from_api(_sample_video(i))),
+        ('history', history_dict, lambda i: HistoryRecord.from_api(_sample_history(i))),
+    ]
+
+    print(f"记录类型内存占用 (每种 {count} 条):")
+    print(f"{'类型':<10}{'dict 字节/条':>14}{'record 字节/条':>16}{'节省':>8}")
+    for name, dict_factory, record_factory in cases:
+        dict_size, _ = _measure_alloc(dict_factory, count)
+        record_size, _ = _measure_alloc(record_factory, count)
+        saved = 1 - record_size / dict_size
+        print(f"{name:<10}{dict_size:>14.0f}{record_size:>16.0f}{saved:>8.0%}")
+
+
+def _synthetic_video_payload() -> bytes:
+    '''
+    构造一个接近真实 VIDEO_INFO 响应大小的负载(大量字段不会被爬虫用到)
+    '''
+    import json
+
+    data = _sample_video(1)
+    data.update({
+        'videos': 3, 'tid': 21, 'copyright': 1, 'state': 0, 'attribute': 16512,
+        'dynamic': '', 'cid': 123456, 'mission_id': 0, 'season_type': 0,
+        'is_ogv': False, 'ogv_info': None, 'rcmd_reason': '', 'enable_vt': 0,
+        'rights': {k: 0 for k in ('bp', 'elec', 'download', 'movie', 'pay', 'hd5',
+                                  'no_reprint', 'autoplay', 'ugc_pay', 'is_cooperation',
+                                  'ugc_pay_preview', 'no_background', 'clean_mode',
+                                  'is_stein_gate', 'is_360', 'no_share', 'arc_pay',
+                                  'free_watch')},
+        'dimension': {'width': 1920, 'height': 1080, 'rotate': 0},
+        'pages': [
+            {'cid': 123456 + i, 'page': i + 1, 'from': 'vupload', 'part': f'P{i + 1} 分P标题',
+             'duration': 300, 'vid': '', 'weblink': '', 'first_frame': 'https://i0.hdslb.com/bfs/x.jpg',
+             'dimension': {'width': 1920, 'height': 1080, 'rotate': 0}}
+            for i in range(30)
+        ],
+        'subtitle': {'allow_submit': False, 'list': []},
+        'staff': [
+            {'mid': 1000 + i, 'title': 'UP主', 'name': f'合作者{i}', 'face': 'https://i0.hdslb.com/x.jpg',
+             'vip': {'type': 2, 'status': 1, 'due_date': 0, 'vip_pay_type': 0, 'theme_type': 0,
+                     'label': {'path': '', 'text': '年度大会员', 'label_theme': 'annual_vip'}},
+             'official': {'role': 0, 'title': '', 'desc': '', 'type': -1}, 'follower': 10000 + i}
+            for i in range(10)
+        ],
+        'honor_reply': {'honor': [{'aid': 1, 'type': 4, 'desc': '热门', 'weekly_recommend_num': 0}]},
+        'user_garb': {'url_image_ani_cut': ''},
+        'desc_v2': [{'raw_text': '简介' * 100, 'type': 1, 'biz_id': 0}],
+    })
+    return json.dumps({'code': 0, 'message': '0', 'ttl': 1, 'data': data},
+                      ensure_ascii=False).encode('utf-8')
+
+
+def bench_decode(payload_dir: str = None, rounds: int = 2000):
+    '''
+    对比标准库 json、当前后端完整解码和按模式部分解码的耗时
+
+    录制的响应放在 payload_dir (默认 data/payloads) 下, 文件名为模式名, 如 VideoInfo.json
+    目录为空时使用构造的 VIDEO_INFO 负载
+    '''
+    import json
+    import os
+
+    import decoder
+    import schemas
+    from config import DATA_DIR
+
+    payload_dir = payload_dir or os.path.join(DATA_DIR, 'payloads')
+    payloads = []
+    if os.path.isdir(payload_dir):
+        for filename in sorted(os.listdir(payload_dir)):
+            name, ext = os.path.splitext(filename)
+            if ext == '.json' and name in schemas.ALL:
+                with open(os.path.join(payload_dir, filename), 'rb') as f:
+                    payloads.append((schemas.ALL[name], f.read()))
+    if not payloads:
+        payloads.append((schemas.VIDEO_INFO, _synthetic_video_payload()))
+
+    def timeit(func, raw):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func(raw)
+        return (time.perf_counter() - start) / rounds * 1e6
+
+    print(f"JSON解码 (后端: {decoder.BACKEND}, 每项 {rounds} 次):")
+    print(f"{'模式':<12}{'大小':>10}{'json us':>10}{'后端 us':>10}{'模式 us':>10}")
+    for schema, raw in payloads:
+        std = timeit(json.loads, raw)
+        backend = timeit(decoder.loads, raw)
+        partial = timeit(schema.decode, raw)
+        print(f"{schema.name:<12}{len(raw):>10}{std:>10.1f}{backend:>10.1f}{partial:>10.1f}")
+
+
+BENCHMARKS = {
+    'records': bench_records,
+    'decode': bench_decode,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print()
@@ -0,0 +1,126 @@
+'''
+按接口的熔断器
+
+连续失败达到阈值后熔断(open), 熔断期间的请求直接失败;
+冷却时间过后进入半开(half-open)状态, 放行少量探测请求, 成功则恢复, 失败则继续熔断
+'''
+
+import threading
+import time
+
+# 熔断状态
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 熔断时请求返回的业务code(本地定义, 不会与B站的code冲突)
+CIRCUIT_OPEN_CODE = -10001
+
+
+class CircuitBreaker:
+    '''
+    单个接口的熔断器
+    '''
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60.0,
+                 half_open_max: int = 1):
+        '''
+        :param failure_threshold: 连续失败多少次后熔断
+        :param recovery_timeout: 熔断后多久进入半开状态(秒)
+        :param half_open_max: 半开状态下同时放行的探测请求数
+        '''
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max = half_open_max
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        # 熔断期间被拒绝的请求数
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._update(time.monotonic())
+            return self._state
+
+    def _update(self, now: float):
+        if self._state == OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+
+    def allow(self) -> bool:
+        '''
+        是否放行请求
+        '''
+        with self._lock:
+            self._update(time.monotonic())
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_max:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    print(f"\n⚠️ 接口连续失败 {self._failures} 次, 熔断 {self.recovery_timeout:.0f} 秒")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+
+    def retry_in(self) -> float:
+        '''
+        距离进入半开状态还有多久(秒), 未熔断时为0
+        '''
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.recovery_timeout - time.monotonic())
+
+
+class BreakerRegistry:
+    '''
+    按接口管理熔断器
+    '''
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60.0,
+                 half_open_max: int = 1):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max = half_open_max
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        '''
+        获取接口的熔断器, 不存在时创建
+
+        :param endpoint: 接口url(不含参数)
+        '''
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(endpoint, CircuitBreaker(
+                    self.failure_threshold, self.recovery_timeout, self.half_open_max))
+        return breaker
+
+    def states(self) -> dict:
+        '''
+        所有接口的熔断状态
+
+        :return: {接口: 状态}
+        '''
+        return {endpoint: breaker.state for endpoint, breaker in list(self._breakers.items())}
@@ -0,0 +1,373 @@
+'''
+统一命令行入口
+
+各子命令只在执行时才导入需要的模块(requests、qrcode、numpy等), 查看帮助或执行轻量命令时启动很快
+
+用法:
+    reptile login
+    reptile user [MID ...]
+    reptile video BV... [--detail]
+    cat bvids.txt | reptile video -i - > videos.jsonl
+    reptile history --days 3 --detail
+    reptile comments BV... --count 50
+    reptile export history --detail
+    reptile --import-time video BV1xx411c7mD
+    reptile --profile data/profile/history history --days 1 --detail
+    reptile --proxies my_proxies.txt video -i bvids.txt
+
+不安装时也可以直接运行: python cli.py <子命令>
+查询类子命令(user/video/history/comments)把结果按JSON Lines输出到标准输出(或 -o 指定的文件),
+运行过程中的提示信息输出到标准错误, 方便在管道中使用
+'''
+
+import argparse
+import importlib
+import json
+import sys
+import time
+from contextlib import contextmanager, redirect_stdout
+
+_START = time.perf_counter()
+
+# 延迟导入的模块及耗时(秒): [(模块名, 耗时, 新导入的模块数), ...]
+_imports = []
+
+
+def _load(name: str):
+    '''
+    导入模块并记录耗时
+    '''
+    before = len(sys.modules)
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _imports.append((name, time.perf_counter() - start, len(sys.modules) - before))
+    return module
+
+
+def _report_imports(ready: float, finished: float):
+    out = sys.stderr
+    print(f"启动耗时: {ready * 1000:.1f}ms (解析参数完成)", file=out)
+    for name, seconds, count in _imports:
+        print(f"  导入 {name}: {seconds * 1000:.1f}ms ({count} 个模块)", file=out)
+    print(f"总耗时: {finished * 1000:.1f}ms, 已加载 {len(sys.modules)} 个模块", file=out)
+
+
+def _read_inputs(args) -> list:
+    '''
+    合并命令行参数和 -i 指定的文件/标准输入中的ID
+    '''
+    keys = list(args.ids)
+    if args.input:
+        keys.extend(_load('utils').read_keys(args.input))
+    return list(dict.fromkeys(keys))
+
+
+@contextmanager
+def _output(path: str):
+    '''
+    打开结果输出(JSON Lines), 输出到标准输出时把爬虫的提示信息重定向到标准错误
+
+    :param path: 输出文件, None或'-'表示标准输出
+    '''
+    if not path or path == '-':
+        out = sys.stdout
+        with redirect_stdout(sys.stderr):
+            yield lambda data: print(json.dumps(data, ensure_ascii=False), file=out, flush=True)
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        yield lambda data: f.write(json.dumps(data, ensure_ascii=False) + '\n')
+
+
+@contextmanager
+def _dedup(enabled: bool):
+    '''
+    打开跨运行去重索引(见 dedup_index.py), 没有开启时返回None
+    '''
+    if not enabled:
+        yield None
+        return
+    with _load('dedup_index').DedupIndex() as dedup:
+        yield dedup
+
+
+def _parse_date(value: str) -> int:
+    '''
+    解析日期(YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS)或时间戳
+    '''
+    from datetime import datetime
+    if value.isdigit():
+        return int(value)
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f'无法解析的时间: {value}')
+
+
+# ---------- 子命令 ----------
+
+def cmd_login(args) -> int:
+    login = _load('login')
+    return 0 if login.login(cookie_file=args.cookie_file) else 1
+
+
+def cmd_user(args) -> int:
+    user_info = _load('user_info')
+    mids = _read_inputs(args)
+    # 没有输入MID时获取当前登录用户, 请求之前不知道MID, 不做去重
+    with_dedup = args.dedup and bool(mids)
+    mids = mids or [None]
+    failed = 0
+    with _output(args.output) as emit, _dedup(with_dedup) as dedup:
+        crawler = user_info.UserInfo()
+        if dedup is not None:
+            mids = dedup.filter_new('mid', mids)
+        for mid in mids:
+            info = crawler.get_full_user_info(mid=int(mid) if mid else None)
+            if info:
+                emit(info.to_dict())
+                if dedup is not None:
+                    dedup.add('mid', info.mid)
+            else:
+                failed += 1
+    return 1 if failed else 0
+
+
+def cmd_video(args) -> int:
+    bvids = _read_inputs(args)
+    if not bvids:
+        print("没有输入BV号", file=sys.stderr)
+        return 2
+    video_info = _load('video_info')
+    failed = 0
+    with _output(args.output) as emit, _dedup(args.dedup) as dedup:
+        crawler = video_info.VideoInfo()
+        if dedup is not None:
+            bvids = dedup.filter_new('video', bvids)
+        # 评论只在详情中获取, --comments 隐含 --detail
+        detail = args.detail or args.comments > 0
+        for bvid in bvids:
+            if detail:
+                video = crawler.get_full_video_details(bvid=bvid, include_comments=args.comments > 0,
+                                                       comment_count=args.comments,
+                                                       include_desc=True)
+            else:
+                video = crawler.get_video_info(bvid=bvid)
+            if video:
+                emit(video.to_dict())
+                if dedup is not None:
+                    dedup.add('video', bvid)
+            else:
+                failed += 1
+    return 1 if failed else 0
+
+
+def cmd_history(args) -> int:
+    history_video = _load('history_video')
+    end_ts = args.until
+    start_ts = args.since if args.since is not None else int(time.time() - args.days * 86400)
+    with _output(args.output) as emit, _dedup(args.dedup) as dedup:
+        crawler = history_video.HistoryVideo()
+        crawler.dedup = dedup
+        for record in crawler.iter_records(start_ts=start_ts, end_ts=end_ts, business=args.business,
+                                           include_detail=args.detail,
+                                           include_comments=args.comments,
+                                           incremental=args.incremental):
+            emit(record.to_dict())
+    return 0
+
+
+def cmd_comments(args) -> int:
+    bvids = _read_inputs(args)
+    if not bvids:
+        print("没有输入BV号", file=sys.stderr)
+        return 2
+    video_info = _load('video_info')
+    with _output(args.output) as emit, _dedup(args.dedup) as dedup:
+        crawler = video_info.VideoInfo()
+        crawler.dedup = dedup
+        if dedup is not None:
+            bvids = dedup.filter_new('comments', bvids)
+        results = crawler.crawl_comments(bvids, sort=args.sort, count=args.count,
+                                         retry_failed=args.retry_failed)
+        for bvid in bvids:
+            if bvid not in results:
+                continue
+            for comment in results[bvid]:
+                emit({'bvid': bvid, **comment.to_dict()})
+            # 评论输出之后才记录, 中途退出时下一次运行会从检查点重新输出
+            if dedup is not None:
+                dedup.add('comments', bvid)
+    return 0 if len(results) == len(bvids) else 1
+
+
+def cmd_danmaku(args) -> int:
+    bvids = _read_inputs(args)
+    if not bvids:
+        print("没有输入BV号", file=sys.stderr)
+        return 2
+    danmaku = _load('danmaku').Danmaku()
+    failed = sum(danmaku.crawl_video(bvid, workers=args.workers) is None for bvid in bvids)
+    return 1 if failed else 0
+
+
+def cmd_export(args) -> int:
+    '''
+    导出到 data/ 目录(与各模块单独运行时相同)
+    '''
+    if args.target == 'history':
+        crawler = _load('history_video').HistoryVideo()
+        records = crawler.iter_week_history(include_detail=args.detail,
+                                            incremental=args.incremental)
+        return 0 if crawler.save_history(records, include_detail=args.detail) else 1
+    if args.target == 'user':
+        crawler = _load('user_info').UserInfo()
+        return 0 if crawler.save_user_info() else 1
+    if args.target == 'engagement':
+        collector = _load('engagement').EngagementCollector()
+        return 0 if collector.save(collector.collect(enrich=args.detail)) else 1
+    crawler = _load('bangumi').BangumiFollow()
+    crawler.crawl_all(incremental=args.incremental)
+    return 0
+
+
+# 直接转交给模块自己的 main(argv) 的子命令: 子命令 -> (模块, 说明)
+PASSTHROUGH = {
+    'serve': ('service', '启动常驻爬虫服务'),
+    'shard': ('shard_runner', '多进程分片爬取'),
+    'sample': ('stats_sampler', '定时采样视频统计数据'),
+    'search': ('search_index', '查询本地全文索引'),
+    'analyze': ('history_analytics', '观看历史统计分析'),
+}
+
+# 不发送请求或自己管理cookie刷新的子命令, 不为默认账号开启cookie自动刷新
+NO_REFRESH = {'login', 'serve', 'shard', 'search', 'analyze'}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='reptile', description='B站数据爬取工具')
+    parser.add_argument('--import-time', action='store_true', help='输出启动和模块导入耗时')
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='PREFIX',
+                        help='性能分析: 采样调用栈、统计各阶段耗时, 输出到 PREFIX.folded/.txt'
+                             '(默认为 data/profile/<时间>)')
+    parser.add_argument('--profile-interval', type=float, default=5.0, help='采样间隔(毫秒)')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='性能分析时同时统计内存分配(隐含 --profile; tracemalloc会使各阶段耗时成倍增加, 单独运行一次)')
+    parser.add_argument('--no-refresh', action='store_true',
+                        help='不自动刷新cookie(默认在cookie中有refresh_token时, 快过期或失效时自动续期)')
+    parser.add_argument('--proxies', default=None, metavar='FILE',
+                        help='代理列表文件(见 proxy_pool.py), 默认使用 PROXY_FILE 中的代理')
+    sub = parser.add_subparsers(dest='command', metavar='<子命令>')
+    sub.required = True
+
+    def batch(p, name: str):
+        p.add_argument('ids', nargs='*', help=name)
+        p.add_argument('-i', '--input', default=None, help=f"{name}列表文件, '-' 表示标准输入")
+
+    def output(p):
+        p.add_argument('-o', '--output', default=None, help='输出文件(JSON Lines), 默认为标准输出')
+        p.add_argument('--dedup', action='store_true', help='跳过之前运行已经输出过的数据(见 dedup_index.py)')
+
+    p = sub.add_parser('login', help='扫码登录')
+    p.add_argument('--cookie-file', default=None, help='cookie保存路径')
+    p.set_defaults(func=cmd_login)
+
+    p = sub.add_parser('user', help='获取用户信息(默认为当前登录用户)')
+    batch(p, 'MID')
+    output(p)
+    p.set_defaults(func=cmd_user)
+
+    p = sub.add_parser('video', help='获取视频信息')
+    batch(p, 'BV号')
+    output(p)
+    p.add_argument('--detail', action='store_true', help='包含标签和完整简介')
+    p.add_argument('--comments', type=int, default=0, help='同时获取的热门评论数(隐含--detail)')
+    p.set_defaults(func=cmd_video)
+
+    p = sub.add_parser('history', help='获取观看历史')
+    output(p)
+    p.add_argument('--days', type=float, default=7, help='最近几天(没有指定--since时)')
+    p.add_argument('--since', type=_parse_date, default=None, help='起始时间(日期或时间戳)')
+    p.add_argument('--until', type=_parse_date, default=None, help='结束时间(日期或时间戳)')
+    p.add_argument('--business', default='archive', help="业务类型, '' 表示全部")
+    p.add_argument('--detail', action='store_true', help='获取视频详情')
+    p.add_argument('--comments', action='store_true', help='获取评论(较慢)')
+    p.add_argument('--incremental', action='store_true', help='视频未变化时跳过标签和评论')
+    p.set_defaults(func=cmd_history)
+
+    p = sub.add_parser('comments', help='获取视频评论(带检查点)')
+    batch(p, 'BV号')
+    output(p)
+    p.add_argument('--count', type=int, default=20, help='每个视频的评论数')
+    p.add_argument('--sort', type=int, default=1, choices=(0, 1, 2), help='0=时间 1=热度 2=回复数')
+    p.add_argument('--retry-failed', action='store_true', help='重试上次失败的视频')
+    p.set_defaults(func=cmd_comments)
+
+    p = sub.add_parser('danmaku', help='获取视频弹幕(保存到 data/danmaku)')
+    batch(p, 'BV号')
+    p.add_argument('--workers', type=int, default=4, help='每个分P的并发数')
+    p.set_defaults(func=cmd_danmaku)
+
+    p = sub.add_parser('export', help='导出到data目录')
+    p.add_argument('target', choices=('history', 'user', 'engagement', 'bangumi'))
+    p.add_argument('--detail', action='store_true', help='包含视频详情')
+    p.add_argument('--incremental', action='store_true', help='只获取有变化的数据')
+    p.set_defaults(func=cmd_export)
+
+    for name, (module, help_text) in PASSTHROUGH.items():
+        p = sub.add_parser(name, help=help_text, add_help=False)
+        p.add_argument('args', nargs=argparse.REMAINDER)
+        p.set_defaults(module=module)
+
+    return parser
+
+
+def main(argv: list = None) -> int:
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if hasattr(args, 'module'):
+        # 转交的子命令的参数(包括 --help)全部交给模块自己解析
+        args.args += extra
+    elif extra:
+        parser.error(f"无法识别的参数: {' '.join(extra)}")
+    ready = time.perf_counter() - _START
+    profiler = None
+    if args.profile is not None or args.profile_memory:
+        profiler = _load('profiler').Profiler(output=args.profile or None,
+                                             interval=args.profile_interval / 1000,
+                                             trace_memory=args.profile_memory)
+        profiler.start()
+    pool = None
+    if args.proxies:
+        with redirect_stdout(sys.stderr):
+            pool = _load('crawler').BiliCrawler.use_proxies(args.proxies)
+        if pool is None:
+            print(f"⚠️ {args.proxies} 中没有代理, 直接连接", file=sys.stderr)
+    if not args.no_refresh and args.command not in NO_REFRESH:
+        # 所有使用默认账号的爬虫(包括内部创建的)共享同一个刷新器, 长时间的爬取不会因为cookie过期中断
+        with redirect_stdout(sys.stderr):
+            _load('crawler').BiliCrawler.use_session_refresh()
+    try:
+        if hasattr(args, 'module'):
+            code = _load(args.module).main(args.args) or 0
+        else:
+            code = args.func(args)
+    except KeyboardInterrupt:
+        print("\n已中断", file=sys.stderr)
+        code = 130
+    finally:
+        # 中断时也输出已经收集到的数据
+        if profiler is not None:
+            profiler.stop()
+            profiler.save()
+    if pool is not None:
+        with redirect_stdout(sys.stderr):
+            pool.report()
+    if args.import_time:
+        _report_imports(ready, time.perf_counter() - _START)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,6 +7,8 @@ import os
 CONFIG_DIR = os.path.dirname(os.path.abspath(__file__))
 ## COOKIE保存位置
 COOKIE_FILE = os.path.join(CONFIG_DIR, 'cookies.json')
+## 代理列表位置(每行一个代理, 可选在后面写每秒请求数)
+PROXY_FILE = os.path.join(CONFIG_DIR, 'proxies.txt')
 ## 数据保存位置
 DATA_DIR = os.path.join(CONFIG_DIR, 'data')
 
@@ -15,13 +17,15 @@ if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
 # 请求头配置
+# 不设置 Accept-Encoding: requests 默认只声明 urllib3 能解码的压缩格式(安装了 brotli/zstd 支持时
+# 才包括 br/zstd, pip install -e .[compress]), 这里写死的话服务端返回的 br 响应可能无法解析;
+# 也不在这里导入 urllib3 判断, 不需要发请求的命令(search/analyze)不用加载它
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
     'Referer': 'https://www.bilibili.com/',
     'Origin': 'https://www.bilibili.com',
     'Accept': 'application/json, text/plain, */*',
     'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-    'Accept-Encoding': 'gzip, deflate, br',
     'Connection': 'keep-alive',
     'Sec-Ch-Ua': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
     'Sec-Ch-Ua-Mobile': '?0',
@@ -43,6 +47,10 @@ class BiliAPI:
     QR_GENERATE = 'https://passport.bilibili.com/x/passport-login/web/qrcode/generate'  # 获取二维码
     QR_POLL = 'https://passport.bilibili.com/x/passport-login/web/qrcode/poll'  # 轮询登录状态
     NAV_INFO = 'https://api.bilibili.com/x/web-interface/nav'  # 获取用户导航信息
+    COOKIE_INFO = 'https://passport.bilibili.com/x/passport-login/web/cookie/info'  # 检查是否需要刷新cookie
+    CORRESPOND = 'https://www.bilibili.com/correspond/1'  # 获取refresh_csrf
+    COOKIE_REFRESH = 'https://passport.bilibili.com/x/passport-login/web/cookie/refresh'  # 刷新cookie
+    CONFIRM_REFRESH = 'https://passport.bilibili.com/x/passport-login/web/confirm/refresh'  # 确认刷新
     
     # 用户信息相关
     USER_INFO = 'https://api.bilibili.com/x/space/wbi/acc/info'  # 用户空间详细信息
@@ -71,6 +79,9 @@ class BiliAPI:
     # 评论相关
     REPLY_MAIN = 'https://api.bilibili.com/x/v2/reply/main'  # 评论列表
     REPLY_REPLY = 'https://api.bilibili.com/x/v2/reply/reply'  # 评论回复
+
+    # 弹幕相关
+    DANMAKU_SEG = 'https://api.bilibili.com/x/v2/dm/web/seg.so'  # 分段弹幕(protobuf)
     
     # 番剧订阅相关
     BANGUMI_LIST = 'https://api.bilibili.com/x/space/bangumi/follow/list'  # 追番列表
@@ -81,27 +92,56 @@ class BiliAPI:
 
 
 # 获取COOKIES
-def load_cookies():
+def load_cookies(path: str = None):
     '''
     从文件中加载COOKIE
+    args:
+        path: COOKIE文件路径, 默认为COOKIE_FILE(多账号时每个账号一个文件)
     returns: 
         dict: Cookie字典, 如果文件不存在就返回空字典
     '''
-
-    if os.path.exists(COOKIE_FILE):
-        with open(COOKIE_FILE, 'r', encoding='utf-8') as f :
+    path = path or COOKIE_FILE
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f :
             return json.load(f)
     return {}
 
 # 保存COOKIE到文件中
-def save_cookies(cookies: dict):
+def save_cookies(cookies: dict, path: str = None):
     '''
     获取到了cookies, 把他保存在COOKIE_FILE
     args:
         dict: 获取到的cookie字典
+        path: COOKIE文件路径, 默认为COOKIE_FILE
     '''
-    with open(COOKIE_FILE, 'w', encoding='utf-8') as f:
+    path = path or COOKIE_FILE
+    # 先写临时文件再替换, 写入中断时不会损坏原文件
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(cookies, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+# 加载代理列表
+def load_proxies(path: str = None):
+    '''
+    从文件中加载代理
+    args:
+        path: 代理文件路径, 默认为PROXY_FILE
+    returns:
+        list: [(代理url, 每秒请求数或None), ...], 文件不存在就返回空列表
+    '''
+    path = path or PROXY_FILE
+    proxies = []
+    if not os.path.exists(path):
+        return proxies
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split()
+            proxies.append((parts[0], float(parts[1]) if len(parts) > 1 else None))
+    return proxies
 
 # 获取用户的mid
 def get_mid():
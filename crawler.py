@@ -7,8 +7,19 @@ import time
 import hashlib
 import urllib.parse
 from functools import reduce
+from typing import Optional
 
-from config import HEADERS, REPLY_HEADERS, load_cookies, BiliAPI
+import schemas
+from config import HEADERS, REPLY_HEADERS, load_cookies, load_proxies, BiliAPI
+from breaker import CIRCUIT_OPEN_CODE, OPEN, BreakerRegistry
+from decoder import Schema, loads
+from profiler import span
+from retry import FATAL, OK, RETRY, RetryPolicy, parse_retry_after
+from singleflight import ResultCache, SingleFlight
+from transfer_stats import TransferStats
+from utils import format_duration
+
+# 代理池(proxy_pool)和cookie刷新(session_health, 会加载cryptography)只在用到时导入, 不拖慢每个命令的启动
 
 
 class BiliCrawler:
@@ -22,39 +33,338 @@ class BiliCrawler:
         22, 25, 54, 21, 56, 59, 6, 63, 57, 62, 11, 36, 20, 34, 44, 52
     ]
 
-    def __init__(self):
+    # 结果在一次运行内不会变化的接口, 成功的响应会被缓存
+    MEMO_ENDPOINTS = frozenset({
+        BiliAPI.NAV_INFO,
+        BiliAPI.VIDEO_INFO,
+        BiliAPI.VIDEO_TAGS,
+        BiliAPI.VIDEO_DESC,
+        BiliAPI.USER_INFO,
+        BiliAPI.USER_STAT,
+        BiliAPI.USER_UPSTAT,
+    })
+    # WBI签名参数, 每次请求都不同, 不参与请求去重
+    SIGN_PARAMS = ('wts', 'w_rid')
+
+    # 所有实例共享的重试策略(重试预算按时间窗口计算, 见 RetryPolicy.budget_window), 可以按实例覆盖
+    retry_policy = RetryPolicy()
+
+    # 所有实例共享的按接口熔断器, 一个接口被限流时快速失败, 不拖慢其他接口
+    breakers = BreakerRegistry(failure_threshold=5, recovery_timeout=60.0)
+
+    # 所有实例共享的按接口流量统计(传输/解压后字节数)
+    transfer_stats = TransferStats()
+
+    # 所有实例共享, 多个爬虫/线程发出的相同请求只会执行一次
+    _flight = SingleFlight()
+    _memo = ResultCache(maxsize=4096)
+
+    # 所有实例共享的代理池(每个代理的令牌桶和健康状态在所有爬虫间共用), 见 use_proxies
+    _shared_proxy_pool = None
+    _proxies_loaded = False
+
+    # 默认账号的cookie刷新器, 见 use_session_refresh
+    _shared_session_health = None
+
+    def __init__(self, cookies: dict = None):
+        '''
+        :param cookies: 使用的cookie, 不传入就从COOKIE_FILE加载(多账号时传入各自的cookie)
+        '''
         # 请求
         self.session = requests.Session()
         self.session.headers.update(HEADERS)
-        self.cookies = load_cookies()
+        shared_health = BiliCrawler._shared_session_health
+        if cookies is None and shared_health is not None:
+            cookies = shared_health.cookies
+        self.cookies = cookies if cookies is not None else load_cookies()
         self._img_key = None
         self._sub_key = None
+        # 是否启用结果缓存
+        self.use_memo = True
+        # 限速器(见 ratelimit.py), 为None时不限速
+        self.rate_limiter = None
+        # 登录状态维护(见 enable_session_refresh), 为None时不刷新cookie
+        # 使用默认账号cookie的爬虫(包括内部创建的爬虫)共享 use_session_refresh 开启的刷新器
+        self.session_health = None
+        if shared_health is not None and self.cookies is shared_health.cookies:
+            self.session_health = shared_health
+        # 代理池(见 proxy_pool.py), 设置后请求通过代理池中最健康的代理发出, 为None时直连
+        # 默认使用 PROXY_FILE 中的代理, 文件不存在或为空时直连
+        if not BiliCrawler._proxies_loaded:
+            BiliCrawler.use_proxies()
+        self.proxy_pool = BiliCrawler._shared_proxy_pool
+
+    @staticmethod
+    def use_proxies(path: str = None, **kwargs) -> 'ProxyPool':
+        '''
+        从代理文件创建所有爬虫共享的代理池, 之后创建的爬虫都通过它发送请求
+
+        :param path: 代理文件路径, 默认为PROXY_FILE
+        :param kwargs: 传给 ProxyPool.from_config 的其他参数
+        :return: 代理池, 文件中没有代理时返回None(直连)
+        '''
+        BiliCrawler._proxies_loaded = True
+        pool = None
+        if load_proxies(path):
+            from proxy_pool import ProxyPool
+            pool = ProxyPool.from_config(path, **kwargs)
+        BiliCrawler._shared_proxy_pool = pool
+        if pool is not None:
+            print(f"使用代理池: {len(pool.proxies)} 个代理")
+        return pool
+
+    @staticmethod
+    def use_session_refresh(**kwargs) -> Optional['SessionHealth']:
+        '''
+        为默认账号(COOKIE_FILE)开启cookie自动刷新, 之后不传入cookies创建的爬虫共享同一份cookie和刷新器
+
+        :param kwargs: 传给 SessionHealth 的其他参数
+        :return: SessionHealth, cookie中没有 refresh_token(ac_time_value) 或无法刷新时返回None
+        '''
+        cookies = load_cookies()
+        if not cookies.get('ac_time_value'):
+            return None
+        from session_health import SessionHealth
+        health = SessionHealth(cookies, **kwargs)
+        if not health.can_refresh:
+            print("⚠️ 无法自动刷新cookie(需要安装cryptography)")
+            return None
+        BiliCrawler._shared_session_health = health
+        return health
+
+    def enable_session_refresh(self, cookie_file: str = None, **kwargs) -> 'SessionHealth':
+        '''
+        开启cookie自动刷新: 快过期时主动刷新, 请求返回未登录时刷新后重试一次
+
+        :param cookie_file: 刷新后cookie的保存路径, 默认为COOKIE_FILE
+        :param kwargs: 传给 SessionHealth 的其他参数
+        :return: SessionHealth
+        '''
+        from session_health import SessionHealth
+        self.session_health = SessionHealth(self.cookies, cookie_file=cookie_file, **kwargs)
+        if not self.session_health.can_refresh:
+            print("⚠️ 无法刷新cookie(需要重新扫码登录保存refresh_token, 并安装cryptography)")
+        return self.session_health
 
-    def _request(self, url:str, params: dict=None, method: str='GET', **kwargs)->dict:
+    @classmethod
+    def clear_memo(cls):
+        '''
+        清空运行内的结果缓存
+        '''
+        cls._memo.clear()
+
+    def _request_key(self, url: str, params: dict, schema: Schema) -> tuple:
+        '''
+        生成请求的去重key(账号 + 接口 + 参数 + 解码模式)
+        '''
+        items = tuple(sorted(
+            (k, str(v)) for k, v in (params or {}).items() if k not in self.SIGN_PARAMS
+        ))
+        return (self.get_mid(), url, items, schema.name if schema else None)
+
+    def _request(self, url:str, params: dict=None, method: str='GET',
+                 schema: Schema=None, **kwargs)->dict:
         '''
         发送请求并返回json数据
         :param 
             url: 请求的url
             params: 请求的参数
             method: 请求的方法
+            schema: 部分解码模式(见 schemas.py), 不传入就完整解码
         :return
             dict: json数据
         '''
-        try:
-            if method.upper() == 'GET':
-                response = self.session.get(url, params=params, cookies=self.cookies, **kwargs)
+        # 只合并没有额外参数的GET请求
+        if method.upper() != 'GET' or kwargs:
+            return self._send(url, params=params, method=method, schema=schema, **kwargs)
+
+        return self._coalesce(
+            url, params, schema,
+            lambda: self._send(url, params=params, method=method, schema=schema),
+        )
+
+    def _coalesce(self, url: str, params: dict, schema: Schema, send) -> dict:
+        '''
+        合并相同的进行中请求, 并缓存 MEMO_ENDPOINTS 的成功结果
+
+        :param url: 请求url
+        :param params: 请求参数
+        :param schema: 部分解码模式
+        :param send: 实际发送请求的函数
+        :return: json数据(可能被多个调用方共享, 调用方不要修改)
+        '''
+        key = self._request_key(url, params, schema)
+        memo = self.use_memo and url in self.MEMO_ENDPOINTS
+        if memo:
+            cached = self._memo.get(key)
+            if cached is not None:
+                return cached
+
+        def fetch():
+            resp = send()
+            if memo and resp.get('code') == 0:
+                self._memo.set(key, resp)
+            return resp
+
+        return self._flight.do(key, fetch)
+
+    def _send(self, url: str, params: dict=None, method: str='GET',
+              schema: Schema=None, max_attempts: int=None, raw: bool=False, **kwargs) -> dict:
+        '''
+        实际发送请求(不经过合并和缓存), 按 retry_policy 重试
+        :param 
+            url: 请求的url
+            params: 请求的参数
+            method: 请求的方法
+            schema: 部分解码模式
+            max_attempts: 最多尝试次数, 默认使用 retry_policy.max_attempts
+            raw: 不解码响应体, 成功时返回 {'code': 0, 'data': 响应字节}(用于protobuf等二进制接口)
+        :return
+            dict: json数据, 失败时code不为0
+        '''
+        policy = self.retry_policy
+        breaker = self.breakers.get(url)
+        max_attempts = max_attempts or policy.max_attempts
+        attempt = 0
+        health = self.session_health
+        if health is not None:
+            health.ensure_fresh(self.session)
+        refreshed = False
+        while True:
+            generation = health.generation if health is not None else 0
+            # 接口熔断中, 直接失败
+            if not breaker.allow():
+                return self._circuit_open_resp(url)
+
+            attempt += 1
+            resp, verdict, retry_after = self._send_once(url, params=params, method=method,
+                                                         schema=schema, raw=raw, **kwargs)
+            # 只有可重试的错误(限流、网络等)说明接口不健康, 业务错误不计入
+            if verdict == RETRY:
+                breaker.record_failure()
             else:
-                response = self.session.post(url, data=params, cookies=self.cookies, **kwargs)
-            
-            response.raise_for_status()
-            return response.json()
+                breaker.record_success()
+
+            # 登录过期, 刷新cookie后重试一次
+            if health is not None and not refreshed and health.is_logged_out(resp):
+                refreshed = True
+                if health.refresh_after_failure(self.session, generation):
+                    continue
+
+            if verdict != RETRY or attempt >= max_attempts or not policy.should_retry(attempt):
+                # 业务错误由调用方处理, 这里只输出网络/HTTP层面的错误
+                if verdict != OK and resp.get('code') == -1:
+                    print(f"请求失败: {resp.get('message')}")
+                return resp
+
+            # 这次失败触发了熔断, 不再等待重试
+            if breaker.state == OPEN:
+                return self._circuit_open_resp(url)
+
+            delay = policy.delay(attempt, retry_after)
+            print(f"请求失败({resp.get('message')}), {delay:.1f} 秒后重试 ({attempt}/{max_attempts})...")
+            with span('throttle'):
+                time.sleep(delay)
+
+    def _circuit_open_resp(self, url: str) -> dict:
+        '''
+        熔断时返回的数据
+        '''
+        retry_in = self.breakers.get(url).retry_in()
+        return {'code': CIRCUIT_OPEN_CODE, 'message': f'接口熔断中, {retry_in:.0f} 秒后恢复'}
+
+    def is_circuit_open(self, url: str) -> bool:
+        '''
+        接口是否处于熔断状态
+
+        :param url: 接口url
+        '''
+        return self.breakers.get(url).state == OPEN
+
+    def _send_once(self, url: str, params: dict=None, method: str='GET',
+                   schema: Schema=None, raw: bool=False, **kwargs) -> tuple:
+        '''
+        发送一次请求, 并按重试策略判定结果
+
+        :return: (json数据, 判定结果 OK/RETRY/FATAL, 服务端要求的等待秒数)
+        '''
+        if self.rate_limiter is not None:
+            with span('throttle'):
+                self.rate_limiter.acquire()
+
+        pool = self.proxy_pool
+        if pool is None:
+            return self._send_via(self.session, url, params=params, method=method,
+                                  schema=schema, raw=raw, **kwargs)
+
+        with span('throttle'):
+            proxy = pool.acquire()
+        start = time.monotonic()
+        resp, verdict, retry_after = self._send_via(proxy.session, url, params=params, method=method,
+                                                    schema=schema, raw=raw, **kwargs)
+        from proxy_pool import is_blocked
+        blocked = is_blocked(resp)
+        pool.record(proxy, time.monotonic() - start, verdict, blocked=blocked)
+        # 被拦截的是这个代理的IP, 换一个代理重试时不需要按 Retry-After 等待
+        if blocked and pool.healthy_count():
+            retry_after = None
+        return resp, verdict, retry_after
+
+    def _send_via(self, session: requests.Session, url: str, params: dict=None, method: str='GET',
+                  schema: Schema=None, raw: bool=False, **kwargs) -> tuple:
+        '''
+        使用指定的会话发送一次请求
+
+        :return: (json数据, 判定结果 OK/RETRY/FATAL, 服务端要求的等待秒数)
+        '''
+        policy = self.retry_policy
+        try:
+            with span('fetch'):
+                if method.upper() == 'GET':
+                    response = session.get(url, params=params, cookies=self.cookies, **kwargs)
+                else:
+                    response = session.post(url, data=params, cookies=self.cookies, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # 网络错误可以重试
+            return {'code': -1, 'message': str(e)}, RETRY, None
         except requests.RequestException as e:
-            print(f"请求失败: {e}")
-            return {'code': -1, 'message': str(e)}
+            return {'code': -1, 'message': str(e)}, FATAL, None
+
+        self.transfer_stats.record(url, response)
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        verdict = policy.classify_status(response.status_code)
+        if verdict != OK:
+            message = f'HTTP {response.status_code} {response.reason}'
+            return {'code': -1, 'message': message, 'status': response.status_code}, verdict, retry_after
+
+        # 二进制接口出错时返回的是JSON
+        if raw and 'json' not in response.headers.get('Content-Type', ''):
+            return {'code': 0, 'data': response.content}, OK, retry_after
+
+        try:
+            with span('parse'):
+                resp = self._decode(response, schema)
         except ValueError as e:
-            # JSON 解析失败（空响应或非 JSON 内容）
-            print(f"请求失败: {e}")
-            return {'code': -1, 'message': f'JSON解析失败: {e}'}
+            # JSON 解析失败（空响应或非 JSON 内容）, 可能是被截断的响应, 可以重试
+            return {'code': -1, 'message': f'JSON解析失败: {e}'}, RETRY, retry_after
+
+        if not isinstance(resp, dict):
+            return {'code': -1, 'message': '响应格式错误'}, FATAL, None
+        return resp, policy.classify_code(resp.get('code')), retry_after
+
+    @staticmethod
+    def _decode(response: requests.Response, schema: Schema=None) -> dict:
+        '''
+        解码响应体
+
+        :param response: 响应
+        :param schema: 部分解码模式
+        :return: json数据
+        :raises ValueError: 空响应或非JSON内容
+        '''
+        if schema is not None:
+            return schema.decode(response.content)
+        return loads(response.content)
         
     def _get_mixin_key(self, orig: str) -> str:
         '''
@@ -71,7 +381,7 @@ class BiliCrawler:
         if self._img_key and self._sub_key:
             return self._img_key, self._sub_key
         
-        resp = self._request(BiliAPI.NAV_INFO)
+        resp = self._request(BiliAPI.NAV_INFO, schema=schemas.NAV_WBI)
         if resp.get('code') == 0:
             wbi_img = resp['data']['wbi_img']
             img_url = wbi_img['img_url']
@@ -93,22 +403,23 @@ class BiliCrawler:
         if not img_key or not sub_key:
             return params
 
-        mixin_key = self._get_mixin_key(img_key + sub_key)
-        curr_time = round(time.time())
-        params['wts'] = curr_time
+        with span('sign'):
+            mixin_key = self._get_mixin_key(img_key + sub_key)
+            curr_time = round(time.time())
+            params['wts'] = curr_time
 
-        # 按照key排序
-        params = dict(sorted(params.items()))
+            # 按照key排序
+            params = dict(sorted(params.items()))
 
-        # 过滤特殊字符
-        params = {
-            key : ''.join(filter(lambda c: c not in "!'()*", str(value))) for key, value in params.items()
-        }
+            # 过滤特殊字符
+            params = {
+                key : ''.join(filter(lambda c: c not in "!'()*", str(value))) for key, value in params.items()
+            }
 
-        # 生成签名
-        query = urllib.parse.urlencode(params)
-        wbi_sign = hashlib.md5((query + mixin_key).encode()).hexdigest()
-        params['w_rid'] = wbi_sign
+            # 生成签名
+            query = urllib.parse.urlencode(params)
+            wbi_sign = hashlib.md5((query + mixin_key).encode()).hexdigest()
+            params['w_rid'] = wbi_sign
 
         return params
     
@@ -129,7 +440,7 @@ class BiliCrawler:
     
     
     def _request_reply(self, url: str, params: dict = None, bvid: str = None, 
-                       retry_count: int = 3, **kwargs) -> dict:
+                       retry_count: int = 3, schema: Schema = None, **kwargs) -> dict:
         """
         发送评论相关请求（带重试和特殊处理）
         评论API对反爬更敏感，需要特殊处理
@@ -137,10 +448,22 @@ class BiliCrawler:
             url: 请求URL
             params: 请求参数  
             bvid: 视频BV号（用于设置Referer）
-            retry_count: 重试次数
+            retry_count: 最多尝试次数
+            schema: 部分解码模式
         Returns:
             dict: JSON响应数据
         """
+        return self._coalesce(
+            url, params, schema,
+            lambda: self._send_reply(url, params=params, bvid=bvid, retry_count=retry_count,
+                                     schema=schema, **kwargs),
+        )
+
+    def _send_reply(self, url: str, params: dict = None, bvid: str = None,
+                    retry_count: int = 3, schema: Schema = None, **kwargs) -> dict:
+        '''
+        实际发送评论请求(不经过合并和缓存), 重试由 retry_policy 处理
+        '''
         import random
         
         # 设置评论专用的 Referer
@@ -150,48 +473,16 @@ class BiliCrawler:
         else:
             headers.update(REPLY_HEADERS)
         
-        for attempt in range(retry_count):
-            try:
-                # 添加随机延迟，模拟真实用户行为
-                delay = random.uniform(0.8, 1.5)
-                time.sleep(delay)
-                
-                response = self.session.get(
-                    url, 
-                    params=params, 
-                    cookies=self.cookies,
-                    headers=headers,
-                    **kwargs
-                )
-                
-                # 如果是 412 错误，等待更长时间后重试
-                if response.status_code == 412:
-                    wait_time = (attempt + 1) * 2  # 递增等待时间
-                    print(f"遇到反爬限制，等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
-                    continue
-                    
-                response.raise_for_status()
-                return response.json()
-            
-            except ValueError as e:
-                # JSON 解析失败（空响应或非 JSON 内容）
-                if attempt < retry_count - 1:
-                    print(f"JSON解析失败, 重试中 ({attempt + 1}/{retry_count})...")
-                    time.sleep(1)
-                else:
-                    print(f"获取评论失败(JSON解析): {e}")
-                    return {'code': -1, 'message': f'JSON解析失败: {e}'}
-                
-            except requests.RequestException as e:
-                if attempt < retry_count - 1:
-                    print(f"请求失败，重试中 ({attempt + 1}/{retry_count})...")
-                    time.sleep(1)
-                else:
-                    print(f"获取评论失败: {e}")
-                    return {'code': -1, 'message': str(e)}
-        
-        return {'code': -1, 'message': '请求失败，已达到最大重试次数'}
+        # 熔断中不需要等待
+        if self.is_circuit_open(url):
+            return self._circuit_open_resp(url)
+
+        # 添加随机延迟，模拟真实用户行为
+        with span('throttle'):
+            time.sleep(random.uniform(0.8, 1.5))
+
+        return self._send(url, params=params, schema=schema, max_attempts=retry_count,
+                          headers=headers, **kwargs)
 
 
     def get_mid(self) -> str:
@@ -204,14 +495,10 @@ class BiliCrawler:
     @staticmethod
     def format_duration(seconds: int) -> str:
         '''
-        格式化时长
+        格式化时长(见 utils.format_duration)
         
         :param seconds: 秒数
 
         :return: 格式化之后的时长字符串
         '''
-        minutes, secs = divmod(seconds, 60)
-        hours, minutes = divmod(minutes, 60)
-        if hours > 0:
-            return f"{hours}:{minutes:02d}:{secs:02d}"
-        return f"{minutes:02d}:{secs:02d}"
\ No newline at end of file
+        return format_duration(seconds)
\ No newline at end of file
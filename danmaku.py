@@ -0,0 +1,210 @@
+'''
+获取视频弹幕
+
+弹幕按6分钟一段提供(protobuf格式), 同一个分P的各段并发获取, 按顺序边解析边写入CSV,
+大量弹幕的视频也不需要把全部数据放在内存中
+
+用法:
+    python danmaku.py BV1xx411c7mD [BV...]
+'''
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator, Optional
+
+from config import BiliAPI, DATA_DIR
+from crawler import BiliCrawler
+from records import DanmakuRecord
+from utils import read_varint, write_rows
+from video_info import VideoInfo
+
+# DanmakuElem 中的字符串字段: 6=midHash 7=content 10=action 12=idStr
+_STRING_FIELDS = (6, 7, 10, 12)
+
+
+def _parse_elem(buf: memoryview, pos: int, end: int, cid: int = None) -> DanmakuRecord:
+    '''
+    解析一条 DanmakuElem
+
+    :param buf: 整段数据
+    :param pos: 这条弹幕的起始位置
+    :param end: 这条弹幕的结束位置
+    '''
+    record = DanmakuRecord(dmid=0, cid=cid)
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = read_varint(buf, pos)
+            if field == 1:
+                record.dmid = value
+            elif field == 2:
+                record.progress = value
+            elif field == 3:
+                record.mode = value
+            elif field == 4:
+                record.fontsize = value
+            elif field == 5:
+                record.color = value
+            elif field == 8:
+                record.ctime = value
+            elif field == 11:
+                record.pool = value
+        elif wire_type == 2:
+            size, pos = read_varint(buf, pos)
+            if field in _STRING_FIELDS:
+                # 直接从memoryview解码, 不复制出中间的bytes
+                text = str(buf[pos:pos + size], 'utf-8', 'replace')
+                if field == 6:
+                    record.mid_hash = text
+                elif field == 7:
+                    record.content = text
+            pos += size
+        elif wire_type == 1:
+            pos += 8
+        elif wire_type == 5:
+            pos += 4
+        else:
+            raise ValueError(f'不支持的protobuf类型: {wire_type}')
+    return record
+
+
+def iter_segment(data: bytes, cid: int = None) -> Generator[DanmakuRecord, None, None]:
+    '''
+    逐条解析一段弹幕(DmSegMobileReply)
+
+    :param data: seg.so 返回的数据
+    :param cid: 所属分P的CID
+    :yields: DanmakuRecord
+    '''
+    buf = memoryview(data)
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 2:
+            size, pos = read_varint(buf, pos)
+            if field == 1:
+                yield _parse_elem(buf, pos, pos + size, cid)
+            pos += size
+        elif wire_type == 0:
+            _, pos = read_varint(buf, pos)
+        elif wire_type == 1:
+            pos += 8
+        elif wire_type == 5:
+            pos += 4
+        else:
+            raise ValueError(f'不支持的protobuf类型: {wire_type}')
+
+
+class Danmaku(BiliCrawler):
+    '''
+    弹幕爬取类
+    '''
+    # 每段弹幕的时长(秒)
+    SEGMENT_SECONDS = 360
+
+    def __init__(self, cookies: dict = None):
+        super().__init__(cookies=cookies)
+        self.video_info = VideoInfo(cookies=self.cookies)
+        self.data_dir = os.path.join(DATA_DIR, 'danmaku')
+
+    def get_segment(self, cid: int, index: int, aid: int = None) -> Optional[bytes]:
+        """
+        获取一段弹幕的原始数据
+        Args:
+            cid: 分P的CID
+            index: 段号(从1开始)
+            aid: 视频AV号
+        Returns:
+            bytes: protobuf数据, 失败返回None
+        """
+        params = {'type': 1, 'oid': cid, 'segment_index': index}
+        if aid:
+            params['pid'] = aid
+        resp = self._request(BiliAPI.DANMAKU_SEG, params=params, raw=True)
+        if resp.get('code') != 0:
+            print(f"获取弹幕失败(cid={cid}, 第{index}段): {resp.get('message')}")
+            return None
+        return resp['data']
+
+    def iter_danmaku(self, cid: int, duration: int, aid: int = None, workers: int = 4,
+                     failed: list = None) -> Generator[DanmakuRecord, None, None]:
+        """
+        按时间顺序逐条获取一个分P的弹幕
+
+        同时最多获取 workers 段, 前面的段解析完之后才会请求后面的段, 内存中最多保留 workers 段数据
+        Args:
+            cid: 分P的CID
+            duration: 分P时长(秒), 用来计算段数
+            aid: 视频AV号
+            workers: 并发数
+            failed: 传入列表时记录获取失败的段号(失败的段会被跳过)
+        Yields:
+            DanmakuRecord: 单条弹幕
+        """
+        segments = max(1, -(-duration // self.SEGMENT_SECONDS))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = []
+            next_index = 1
+            while pending or next_index <= segments:
+                while next_index <= segments and len(pending) < workers:
+                    pending.append(executor.submit(self.get_segment, cid, next_index, aid))
+                    next_index += 1
+                index = next_index - len(pending)
+                data = pending.pop(0).result()
+                if data is None:
+                    if failed is not None:
+                        failed.append(index)
+                elif data:
+                    yield from iter_segment(data, cid)
+
+    def crawl_video(self, bvid: str, out_file: str = None, workers: int = 4) -> Optional[int]:
+        """
+        获取视频所有分P的弹幕并边解析边写入CSV
+        Args:
+            bvid: 视频BV号
+            out_file: 保存路径, 默认为 data/danmaku/{bvid}.csv
+            workers: 每个分P的并发数
+        Returns:
+            int: 弹幕条数, 失败(包括有分段获取失败)返回None, 此时保留临时文件, 不覆盖已有文件
+        """
+        video = self.video_info.get_video_info(bvid=bvid)
+        if not video:
+            return None
+        pages = video.pages or [{'cid': video.cid, 'duration': video.duration}]
+
+        out_file = out_file or os.path.join(self.data_dir, f'{bvid}.csv')
+        # 先写入临时文件, 完成后再替换
+        tmp_file = out_file + '.tmp'
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+        failed = []
+
+        def rows():
+            for page in pages:
+                for record in self.iter_danmaku(page['cid'], page.get('duration') or 0,
+                                                aid=video.aid, workers=workers, failed=failed):
+                    yield record.to_row()
+
+        try:
+            count = write_rows(tmp_file, rows(), heads=DanmakuRecord.HEADS)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        if failed:
+            print(f"✗ {video.title}: {len(failed)} 段弹幕获取失败, 未覆盖已有文件(部分结果见 {tmp_file})")
+            return None
+        os.replace(tmp_file, out_file)
+        print(f"✓ {video.title}: {count} 条弹幕已保存到: {out_file}")
+        return count
+
+
+if __name__ == '__main__':
+    danmaku = Danmaku()
+    for bvid in sys.argv[1:] or ['BV1mnvxBqEvj']:
+        danmaku.crawl_video(bvid)
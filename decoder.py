@@ -0,0 +1,110 @@
+'''
+JSON解码后端
+
+优先使用已安装的 msgspec / orjson, 都没有时退回标准库 json
+配合 schemas.py 中按接口定义的部分解码模式(Schema), 在 msgspec 可用时只构建用到的字段
+'''
+
+import json
+from typing import Any, Optional
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    BACKEND = 'orjson'
+    _loads = orjson.loads
+elif msgspec is not None:
+    BACKEND = 'msgspec'
+    _loads = msgspec.json.decode
+else:
+    BACKEND = 'json'
+    _loads = json.loads
+
+
+def loads(data) -> Any:
+    '''
+    解码JSON数据
+
+    :param data: bytes 或 str
+    :return: 解码后的对象
+    :raises ValueError: JSON格式错误(包括空响应)
+    '''
+    return _loads(data)
+
+
+class Schema:
+    '''
+    部分解码模式
+
+    字段描述规则:
+        dict: 对象, 只保留列出的键, 值为子字段描述
+        [spec]: 由 spec 描述的元素组成的列表
+        None: 任意值, 原样保留
+    '''
+
+    def __init__(self, name: str, spec: dict):
+        self.name = name
+        self.spec = spec
+        self._decoder = None
+        if msgspec is not None:
+            self._decoder = msgspec.json.Decoder(self._build_type(spec, name))
+
+    def __repr__(self) -> str:
+        return f'Schema({self.name!r})'
+
+    @classmethod
+    def _build_type(cls, spec, name: str):
+        '''
+        把字段描述转换为 msgspec 类型
+        '''
+        if spec is None:
+            return Any
+        if isinstance(spec, list):
+            return Optional[list[cls._build_type(spec[0], name + 'Item')]]
+        fields = []
+        for key, sub in spec.items():
+            sub_type = cls._build_type(sub, name + key.title().replace('_', ''))
+            fields.append((key, sub_type | msgspec.UnsetType, msgspec.UNSET))
+        struct = msgspec.defstruct(name, fields)
+        return Optional[struct]
+
+    def decode(self, data) -> Any:
+        '''
+        按模式解码JSON数据
+
+        msgspec 不可用, 或者响应结构与模式不一致时, 退回完整解码
+
+        :param data: bytes 或 str
+        :return: 只包含模式字段的字典(完整解码时包含全部字段)
+        :raises ValueError: JSON格式错误(包括空响应)
+        '''
+        if self._decoder is None:
+            return _loads(data)
+        try:
+            return msgspec.to_builtins(self._decoder.decode(data))
+        except msgspec.ValidationError:
+            return _loads(data)
+
+
+def envelope(name: str, data_spec) -> Schema:
+    '''
+    构建B站标准响应 {code, message, data} 的解码模式
+
+    :param name: 模式名
+    :param data_spec: data 字段的描述
+    :return: Schema
+    '''
+    return Schema(name, {
+        'code': None,
+        'message': None,
+        'data': data_spec,
+    })
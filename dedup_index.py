@@ -0,0 +1,338 @@
+'''
+跨运行的去重索引
+
+记录已经处理过的BV号、MID、评论rpid等, 重新运行时在发请求之前判断"是否已经见过":
+    每个ID按 "类型:值" 计算8字节的blake2b哈希
+    前面是内存映射的布隆过滤器, 没见过的ID(绝大多数新数据)只需要查几个比特
+    布隆过滤器判断可能见过时, 再到有序的ID文件(内存映射, 二分查找)中精确确认
+    新加入的ID先追加到 pending.bin 并保存在内存中, 积累到一定数量后合并进有序文件
+
+默认容量5000万个ID, 误判率1%: 布隆过滤器约57MB, 有序文件每个ID 8字节(5000万个约400MB)
+安装numpy时合并有序文件更快(可选, pip install -e .[analytics])
+
+用法:
+    with DedupIndex() as dedup:
+        video_info.dedup = dedup
+        video_info.enrich_videos(bvids)  # 已经获取过的视频直接跳过
+'''
+
+import bisect
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from heapq import merge
+from typing import Iterable
+
+from config import DATA_DIR
+
+# 类型
+VIDEO = 'video'  # 已获取详情的视频(BV号)
+COMMENTS = 'comments'  # 已获取评论的视频(BV号)
+REPLY = 'rpid'  # 已保存的评论
+USER = 'mid'  # 已获取的用户
+HISTORY = 'history'  # 已保存的观看记录(业务:oid:观看时间)
+
+
+def make_id(kind: str, key) -> int:
+    '''
+    计算ID的64位哈希
+
+    :param kind: 类型
+    :param key: 值(BV号、MID、rpid等)
+    '''
+    digest = hashlib.blake2b(f'{kind}:{key}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class BloomFilter:
+    '''
+    内存映射文件中的布隆过滤器
+
+    文件头16字节: 魔数(4) + 哈希函数个数(4) + 比特数(8)
+    '''
+    MAGIC = b'BLM1'
+    HEADER = struct.Struct('<4sIQ')
+
+    def __init__(self, path: str, capacity: int = 50_000_000, error_rate: float = 0.01):
+        '''
+        :param path: 文件路径, 已存在时使用文件中的参数
+        :param capacity: 预计的ID数量(超过后误判率上升, 但结果仍然准确)
+        :param error_rate: 达到容量时的误判率
+        '''
+        if not os.path.exists(path) or os.path.getsize(path) < self.HEADER.size:
+            bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+            bits = -(-bits // 8) * 8
+            hashes = max(1, round(bits / capacity * math.log(2)))
+            with open(path, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, hashes, bits))
+                # 稀疏文件, 不会立即占用磁盘空间
+                f.truncate(self.HEADER.size + bits // 8)
+
+        self._file = open(path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, self.hashes, self.bits = self.HEADER.unpack_from(self._mm, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f'不是布隆过滤器文件: {path}')
+
+    def _positions(self, h: int) -> list:
+        # 双重哈希: 用64位哈希的高低两半生成k个比特位置
+        h1 = h & 0xffffffff
+        h2 = (h >> 32) | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def add(self, h: int) -> bool:
+        '''
+        :return: 是否设置了新的比特(是则h之前一定没有加入过)
+        '''
+        mm = self._mm
+        offset = self.HEADER.size
+        added = False
+        for pos in self._positions(h):
+            index = offset + (pos >> 3)
+            mask = 1 << (pos & 7)
+            byte = mm[index]
+            if not byte & mask:
+                mm[index] = byte | mask
+                added = True
+        return added
+
+    def __contains__(self, h: int) -> bool:
+        mm = self._mm
+        offset = self.HEADER.size
+        for pos in self._positions(h):
+            if not mm[offset + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def flush(self):
+        self._mm.flush()
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+class SortedIdSet:
+    '''
+    有序的64位ID文件(本机字节序), 内存映射后二分查找
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mm = None
+        self._view = None
+        self._open()
+
+    def _open(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= 8:
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mm).cast('Q')
+        else:
+            self._view = array('Q')
+
+    def close(self):
+        if self._mm is not None:
+            self._view.release()
+            self._mm.close()
+            self._mm = None
+        self._view = array('Q')
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+    def __contains__(self, h: int) -> bool:
+        view = self._view
+        i = bisect.bisect_left(view, h)
+        return i < len(view) and view[i] == h
+
+    def merge(self, ids: Iterable[int]):
+        '''
+        合并一批新ID(不能与已有ID重复), 写入新文件后替换
+
+        :param ids: 新ID
+        '''
+        new = sorted(ids)
+        if not new:
+            return
+        tmp_path = self.path + '.tmp'
+        try:
+            # 只在合并时需要, 不在模块导入时加载
+            import numpy as np
+        except ImportError:
+            np = None
+        if np is not None:
+            old = np.frombuffer(self._view, dtype=np.uint64) if len(self._view) else np.empty(0, np.uint64)
+            new_array = np.array(new, dtype=np.uint64)
+            merged = np.insert(old, np.searchsorted(old, new_array), new_array)
+            del old
+            merged.tofile(tmp_path)
+        else:
+            with open(tmp_path, 'wb') as f:
+                chunk = array('Q')
+                for h in merge(self._view, new):
+                    chunk.append(h)
+                    if len(chunk) >= 1 << 20:
+                        chunk.tofile(f)
+                        chunk = array('Q')
+                chunk.tofile(f)
+        # 替换前关闭映射(Windows上不能替换已映射的文件)
+        self.close()
+        os.replace(tmp_path, self.path)
+        self._open()
+
+
+class DedupIndex:
+    '''
+    布隆过滤器 + 有序ID文件的持久化去重索引(线程安全)
+    '''
+
+    def __init__(self, path: str = None, capacity: int = 50_000_000, error_rate: float = 0.01,
+                 compact_every: int = 500_000):
+        '''
+        :param path: 索引目录, 默认为 data/dedup
+        :param capacity: 布隆过滤器容量(只在第一次创建时使用)
+        :param error_rate: 布隆过滤器误判率
+        :param compact_every: 新ID积累到多少个时合并进有序文件
+        '''
+        self.path = path or os.path.join(DATA_DIR, 'dedup')
+        os.makedirs(self.path, exist_ok=True)
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+
+        self.bloom = BloomFilter(os.path.join(self.path, 'bloom.bin'), capacity, error_rate)
+        self.ids = SortedIdSet(os.path.join(self.path, 'ids.bin'))
+
+        # 还没有合并进有序文件的新ID
+        self._pending_file = os.path.join(self.path, 'pending.bin')
+        self._pending = set()
+        if os.path.exists(self._pending_file):
+            with open(self._pending_file, 'r+b') as f:
+                data = f.read()
+                # 去掉写入中断时不完整的结尾
+                usable = len(data) - len(data) % 8
+                if usable != len(data):
+                    f.truncate(usable)
+            pending = array('Q')
+            pending.frombytes(data[:usable])
+            for h in pending:
+                self.bloom.add(h)
+            self._pending.update(pending)
+        self._log = open(self._pending_file, 'ab')
+
+        # 统计: 布隆过滤器直接排除的次数 / 布隆过滤器误判的次数 / 新记录的ID数
+        self.bloom_rejects = 0
+        self.false_positives = 0
+        self.inserts = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self._pending)
+
+    def _contains(self, h: int) -> bool:
+        if h not in self.bloom:
+            self.bloom_rejects += 1
+            return False
+        if h in self._pending or h in self.ids:
+            return True
+        self.false_positives += 1
+        return False
+
+    def seen(self, kind: str, key) -> bool:
+        '''
+        是否已经记录过
+
+        :param kind: 类型(VIDEO/COMMENTS/REPLY/USER/HISTORY或自定义)
+        :param key: 值
+        '''
+        h = make_id(kind, key)
+        with self._lock:
+            return self._contains(h)
+
+    def add(self, kind: str, key) -> bool:
+        '''
+        记录一个ID
+
+        :return: 是否是新ID
+        '''
+        h = make_id(kind, key)
+        with self._lock:
+            if not self.bloom.add(h):
+                if h in self._pending or h in self.ids:
+                    return False
+                self.false_positives += 1
+            self.inserts += 1
+            self._pending.add(h)
+            self._log.write(h.to_bytes(8, sys.byteorder))
+            if len(self._pending) >= self.compact_every:
+                self._compact()
+            return True
+
+    def add_many(self, kind: str, keys: Iterable) -> int:
+        '''
+        记录一批ID
+
+        :return: 新ID的数量
+        '''
+        return sum(self.add(kind, key) for key in keys)
+
+    def filter_new(self, kind: str, keys: Iterable) -> list:
+        '''
+        过滤掉已经记录过的ID(不记录新ID)
+
+        :return: 没有记录过的值(保持顺序)
+        '''
+        return [key for key in keys if not self.seen(kind, key)]
+
+    def flush(self):
+        '''
+        把新ID和布隆过滤器写入磁盘
+        '''
+        with self._lock:
+            self._log.flush()
+            self.bloom.flush()
+
+    def compact(self):
+        '''
+        把新ID合并进有序文件
+        '''
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        if not self._pending:
+            return
+        self.bloom.flush()
+        self.ids.merge(self._pending)
+        self._pending.clear()
+        self._log.truncate(0)
+        self._log.flush()
+
+    def close(self):
+        with self._lock:
+            self._compact()
+            self._log.close()
+            self.bloom.close()
+            self.ids.close()
+
+    def stats(self) -> dict:
+        return {
+            'ids': len(self),
+            'pending': len(self._pending),
+            'bloom_bits': self.bloom.bits,
+            'bloom_hashes': self.bloom.hashes,
+            'bloom_rejects': self.bloom_rejects,
+            'false_positives': self.false_positives,
+            'inserts': self.inserts,
+        }
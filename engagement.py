@@ -0,0 +1,159 @@
+'''
+获取点赞和投币过的视频, 补全详情后导出(账号互动画像)
+'''
+
+import csv
+import os
+from typing import Optional
+
+import schemas
+from config import BiliAPI, DATA_DIR
+from crawler import BiliCrawler
+from records import VideoRecord
+from utils import write_rows
+from video_info import VideoInfo
+
+
+class EngagementCollector(BiliCrawler):
+    '''
+    点赞/投币视频爬取类
+    '''
+    # 来源名称
+    LIKE = '点赞'
+    COIN = '投币'
+
+    HEADS = ['来源'] + VideoRecord.HEADS
+
+    def __init__(self, cookies: dict = None):
+        super().__init__(cookies=cookies)
+        self.video_info = VideoInfo(cookies=self.cookies)
+        self.data_file = os.path.join(DATA_DIR, 'engagement_videos.csv')
+        self.history_file = os.path.join(DATA_DIR, 'history_videos.csv')
+
+    def _get_archives(self, url: str, mid: int, schema, name: str) -> Optional[list]:
+        '''
+        获取点赞/投币视频列表
+
+        :return: VideoRecord列表, 失败返回None
+        '''
+        if mid is None:
+            mid = self.get_mid()
+            if not mid:
+                print("未登录")
+                return None
+
+        resp = self._request(url, params={'vmid': mid}, schema=schema)
+        if resp.get('code') != 0:
+            print(f"获取{name}视频失败: {resp.get('message')}")
+            return None
+
+        # 不同接口的data可能是列表或 {list: [...]}
+        data = resp.get('data') or []
+        items = data if isinstance(data, list) else data.get('list') or []
+        return [VideoRecord.from_api(item) for item in items]
+
+    def get_like_videos(self, mid: int = None) -> Optional[list]:
+        """
+        获取最近点赞的视频
+        Args:
+            mid: 用户MID, 默认为当前登录用户
+        Returns:
+            list: VideoRecord列表(来自列表数据, 不含标签)
+        """
+        return self._get_archives(BiliAPI.LIKE_VIDEO, mid, schemas.LIKE_VIDEO, self.LIKE)
+
+    def get_coin_videos(self, mid: int = None) -> Optional[list]:
+        """
+        获取最近投币的视频
+        Args:
+            mid: 用户MID, 默认为当前登录用户
+        Returns:
+            list: VideoRecord列表(来自列表数据, 不含标签)
+        """
+        return self._get_archives(BiliAPI.COIN_VIDEO, mid, schemas.COIN_VIDEO, self.COIN)
+
+    def load_history_details(self) -> dict:
+        '''
+        读取已导出的观看历史(包含详情时)中每个视频的标签和简介
+
+        :return: {BV号: (标签列表, 简介)}, 文件不存在或没有导出详情时为空
+        '''
+        if not os.path.exists(self.history_file):
+            return {}
+        with open(self.history_file, 'r', newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            # 观看历史表头: 标题, BV号, 观看时间等6列, 包含详情时再加 播放, 点赞, 投币, 收藏, 标签, 简介
+            return {
+                row[1]: ([tag for tag in row[10].split(', ') if tag], row[11])
+                for row in reader if len(row) > 11
+            }
+
+    def collect(self, mid: int = None, enrich: bool = True, workers: int = 4) -> list:
+        """
+        获取点赞和投币的视频, 合并去重后补全详情
+
+        已经在观看历史导出(包含详情)中的视频不再重新请求详情, 使用列表数据和观看历史中的标签、简介
+        Args:
+            mid: 用户MID, 默认为当前登录用户
+            enrich: 是否补全详情(标签、完整简介等)
+            workers: 补全详情的并发数
+        Returns:
+            list: [(VideoRecord, 来源列表), ...]
+        """
+        videos = {}
+        sources = {}
+        for name, records in ((self.LIKE, self.get_like_videos(mid)),
+                              (self.COIN, self.get_coin_videos(mid))):
+            for record in records or []:
+                if not record.bvid:
+                    continue
+                videos.setdefault(record.bvid, record)
+                sources.setdefault(record.bvid, []).append(name)
+
+        print(f"点赞/投币视频共 {len(videos)} 个(去重后)")
+
+        if enrich and videos:
+            in_history = self.load_history_details()
+            todo = []
+            for bvid, record in videos.items():
+                if bvid not in in_history:
+                    todo.append(bvid)
+                    continue
+                tags, desc = in_history[bvid]
+                record.tags = tags
+                # 观看历史中的简介只保存了前100个字, 列表数据中有完整简介时优先使用
+                record.desc = record.desc or desc
+            print(f"  {len(videos) - len(todo)} 个已在观看历史中, 补全 {len(todo)} 个视频的详情...")
+            details = self.video_info.enrich_videos(todo, workers=workers)
+            videos.update(details)
+
+        return [(record, sources[bvid]) for bvid, record in videos.items()]
+
+    def save(self, collected: list = None) -> bool:
+        """
+        保存到CSV(与视频信息的导出格式相同, 第一列为来源)
+        Args:
+            collected: collect() 的结果, 不传入就自动获取
+        Returns:
+            bool: 是否成功
+        """
+        if collected is None:
+            collected = self.collect()
+        if not collected:
+            return False
+
+        if os.path.exists(self.data_file):
+            os.remove(self.data_file)
+        write_rows(
+            self.data_file,
+            ([', '.join(names)] + record.to_row() for record, names in collected),
+            heads=self.HEADS,
+        )
+        print(f"✓ 点赞/投币视频已保存到: {self.data_file}")
+        return True
+
+
+if __name__ == '__main__':
+    collector = EngagementCollector()
+    collector.save(collector.collect())
@@ -0,0 +1,368 @@
+'''
+观看历史统计分析
+
+把历史记录转换成NumPy列数组后批量计算: 完成率、按UP主/标签/小时统计观看时长、重复观看次数和排行,
+多年的历史记录也只需要几毫秒
+
+需要安装numpy(可选依赖): pip install -e .[analytics]
+
+用法:
+    python history_analytics.py [history_videos.csv ...] [--top 10]
+'''
+
+import argparse
+import csv
+import gc
+import itertools
+import os
+import sys
+import time
+from typing import Iterable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from config import DATA_DIR
+from records import WATCHED_TO_END
+from utils import format_number
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("统计分析需要numpy, 请先安装: pip install -e .[analytics]")
+
+
+def _codes(values: list) -> tuple:
+    '''
+    把字符串列编码成整数
+
+    :return: (编码数组, 去重后的值列表), 编码按第一次出现的顺序
+    '''
+    if not len(values):
+        return np.zeros(0, dtype=np.int64), []
+    unique, first, inverse = np.unique(np.asarray(values, dtype=str), return_index=True, return_inverse=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank[inverse.reshape(-1)], unique[order].tolist()
+
+
+def _parse_duration(values) -> 'np.ndarray':
+    '''
+    批量解析 "mm:ss" / "h:mm:ss" 格式的时长, 空字符串为0
+
+    字符串右对齐成字节矩阵后按列从右往左累加, 循环次数只和字符串长度有关
+    '''
+    raw = np.asarray(values, dtype=bytes)
+    result = np.zeros(len(raw), dtype=np.int64)
+    width = raw.dtype.itemsize
+    if not len(raw) or not width:
+        return result
+    chars = np.char.rjust(raw, width).view(np.uint8).reshape(len(raw), width).astype(np.int64)
+    # place: 当前数字在这一段中的位值, unit: 这一段的单位(1/60/3600秒)
+    place = np.ones(len(raw), dtype=np.int64)
+    unit = np.ones(len(raw), dtype=np.int64)
+    for column in chars.T[::-1]:
+        digit = (column >= ord('0')) & (column <= ord('9'))
+        result += np.where(digit, (column - ord('0')) * place * unit, 0)
+        place = np.where(digit, place * 10, place)
+        colon = column == ord(':')
+        unit = np.where(colon, unit * 60, unit)
+        place = np.where(colon, 1, place)
+    return result
+
+
+def _utc_offsets(timestamps) -> 'np.ndarray':
+    '''
+    每个时间戳在本地时区的UTC偏移(秒), 跨夏令时切换的记录各自使用当时的偏移
+
+    按天计算, 只有一天开始和结束时偏移不同(切换时区的那天)才按15分钟计算(切换都在整15分钟)
+    '''
+    def offsets_at(starts, span):
+        buckets, inverse = np.unique(starts // span, return_inverse=True)
+        offsets = np.fromiter((time.localtime(int(b) * span).tm_gmtoff for b in buckets),
+                              dtype=np.int64, count=len(buckets))
+        return offsets[inverse.reshape(-1)], buckets, inverse.reshape(-1)
+
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    result, days, inverse = offsets_at(timestamps, 86400)
+    ends = np.fromiter((time.localtime(int(d) * 86400 + 86399).tm_gmtoff for d in days),
+                       dtype=np.int64, count=len(days))
+    changed = (result != ends[inverse])
+    if changed.any():
+        result[changed] = offsets_at(timestamps[changed], 900)[0]
+    return result
+
+
+def _parse_local_time(values) -> 'np.ndarray':
+    '''
+    批量解析 "%Y-%m-%d %H:%M:%S" 格式的本地时间, 返回时间戳, 空字符串为0
+    '''
+    local = np.array(values, dtype='datetime64[s]')
+    missing = np.isnat(local)
+    local = np.where(missing, 0, local.astype(np.int64))
+    # 先按本地时间近似求出UTC偏移, 再用得到的时间戳修正一次(夏令时切换前后偏移不同)
+    timestamps = local - _utc_offsets(local)
+    timestamps = local - _utc_offsets(timestamps)
+    timestamps[missing] = 0
+    return timestamps
+
+
+class HistoryFrame:
+    '''
+    列式存储的观看历史
+
+    列:
+        view_at      观看时间戳
+        progress     观看进度(秒), -1 表示已看完
+        duration     视频时长(秒)
+        up           UP主编码(对应 up_names)
+        video        视频编码(对应 bvids/titles)
+        view/like/coin/favorite  视频统计数据, 没有详情时为0
+    标签展开为两列: tag_row(所属记录下标) 和 tag(标签编码, 对应 tag_names)
+    '''
+
+    def __init__(self, view_at, progress, duration, ups: list, bvids: list, titles: list,
+                 stats=None, tags: list = None):
+        _require_numpy()
+        n = len(bvids)
+        self.view_at = np.asarray(view_at, dtype=np.int64)
+        self.progress = np.asarray(progress, dtype=np.int64)
+        self.duration = np.asarray(duration, dtype=np.int64)
+        self.up, self.up_names = _codes(ups)
+        self.video, self.bvids = _codes(bvids)
+        # 同一个视频取第一次出现的标题
+        _, first = np.unique(self.video, return_index=True)
+        self.titles = [titles[i] for i in first.tolist()]
+
+        stats = np.asarray(stats if stats is not None else np.zeros((n, 4)), dtype=np.int64)
+        self.view, self.like, self.coin, self.favorite = stats.reshape(n, 4).T
+
+        tags = [names or [] for names in tags or []]
+        counts = np.fromiter(map(len, tags), dtype=np.int64, count=len(tags))
+        tag_values = np.asarray(list(itertools.chain.from_iterable(tags)), dtype=str)
+        keep = tag_values != ''
+        self.tag_row = np.repeat(np.arange(len(tags), dtype=np.int64), counts)[keep]
+        self.tag, self.tag_names = _codes(tag_values[keep])
+
+    def __len__(self):
+        return len(self.view_at)
+
+    @classmethod
+    def from_records(cls, records: Iterable) -> 'HistoryFrame':
+        '''
+        从HistoryRecord构建
+
+        :param records: HistoryRecord列表或迭代器
+        '''
+        view_at, progress, duration, ups, bvids, titles, stats, tags = [], [], [], [], [], [], [], []
+        for record in records:
+            view_at.append(record.view_at or 0)
+            progress.append(record.progress or 0)
+            duration.append(record.duration or 0)
+            ups.append(record.author_name or str(record.author_mid or ''))
+            bvids.append(record.bvid or '')
+            titles.append(record.title or '')
+            stat = record.stat
+            stats.append((stat.view, stat.like, stat.coin, stat.favorite) if stat else (0, 0, 0, 0))
+            tags.append(record.tags or [])
+        return cls(view_at, progress, duration, ups, bvids, titles, stats, tags)
+
+    @classmethod
+    def from_csv(cls, paths: list) -> 'HistoryFrame':
+        '''
+        从 save_history 导出的CSV构建, 可以传入多次导出的文件(用于统计重复观看)
+
+        :param paths: CSV文件路径列表
+        '''
+        columns = [[] for _ in range(6)]
+        stats = []
+        tags = []
+        # 读取时会创建大量的行列表, 暂停垃圾回收避免反复扫描它们(这些对象没有循环引用)
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for path in paths:
+                with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+                    reader = csv.reader(f)
+                    heads = next(reader, None) or []
+                    detail = len(heads) > 6
+                    rows = [row for row in reader if len(row) >= 6]
+                if detail:
+                    # 按列转置前补齐缺少的详情列, 否则 zip 会截掉所有行的详情
+                    rows = [row if len(row) >= 11 else row + [''] * (11 - len(row)) for row in rows]
+                file_columns = list(zip(*rows))
+                for column, values in zip(columns, file_columns):
+                    column.extend(values)
+                if detail:
+                    values = np.array(file_columns[6:10], dtype=str).reshape(4, len(rows)).T
+                    values[values == ''] = '0'
+                    stats.append(values.astype(np.int64))
+                    tags += [value.split(', ') if value else [] for value in file_columns[10]] if rows else []
+                else:
+                    stats.append(np.zeros((len(rows), 4), dtype=np.int64))
+                    tags += [[] for _ in rows]
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        titles, bvids, ups, view_at, progress, duration = columns
+        # 看完的进度(-1)导出为 WATCHED_TO_END, 还原成-1
+        progress = np.array(progress, dtype=str)
+        finished = progress == WATCHED_TO_END
+        progress = _parse_duration(np.where(finished, '', progress))
+        progress[finished] = -1
+        stats = np.concatenate(stats) if stats else None
+        return cls(_parse_local_time(view_at), progress, _parse_duration(duration), ups, bvids, titles,
+                   stats, tags)
+
+    def completion(self) -> 'np.ndarray':
+        '''
+        每条记录的完成率(0~1), 时长未知的为nan
+        '''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.clip(self.progress / self.duration, 0.0, 1.0)
+        ratio = np.where(self.progress < 0, 1.0, ratio)
+        return np.where(self.duration > 0, ratio, np.nan)
+
+    def watch_time(self) -> 'np.ndarray':
+        '''
+        每条记录的观看时长(秒), 看完的按视频时长计算
+        '''
+        return np.where(self.progress < 0, self.duration, np.minimum(self.progress, self.duration))
+
+    def _rank(self, codes, names: list, weights, top: int) -> list:
+        total = np.bincount(codes, weights=weights, minlength=len(names))
+        count = np.bincount(codes, minlength=len(names))
+        top = min(top, len(names))
+        if not top:
+            return []
+        order = np.argpartition(-total, top - 1)[:top]
+        order = order[np.argsort(-total[order], kind='stable')]
+        return [(names[i], int(count[i]), int(total[i])) for i in order]
+
+    def by_up(self, top: int = 10) -> list:
+        '''
+        观看时长最多的UP主
+
+        :return: [(UP主, 记录数, 观看秒数), ...]
+        '''
+        return self._rank(self.up, self.up_names, self.watch_time(), top)
+
+    def by_tag(self, top: int = 10) -> list:
+        '''
+        观看时长最多的标签(需要详情)
+
+        :return: [(标签, 记录数, 观看秒数), ...]
+        '''
+        return self._rank(self.tag, self.tag_names, self.watch_time()[self.tag_row], top)
+
+    def by_hour(self) -> 'np.ndarray':
+        '''
+        按本地时间小时统计观看时长
+
+        :return: 长度为24的数组, 第i项为i点观看的秒数
+        '''
+        hours = (self.view_at + _utc_offsets(self.view_at)) // 3600 % 24
+        return np.bincount(hours, weights=self.watch_time(), minlength=24).astype(np.int64)
+
+    def rewatches(self, top: int = 10) -> list:
+        '''
+        重复观看次数(同一个视频出现多个不同的观看时间, 需要合并多次导出的历史)
+
+        :return: [(BV号, 标题, 观看次数), ...], 只包含看过不止一次的视频
+        '''
+        # (视频, 观看时间) 合并成一个整数后去重
+        pairs = np.sort((self.video << 32) | (self.view_at & 0xffffffff))
+        pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))[:len(pairs)]]
+        counts = np.bincount(pairs >> 32, minlength=len(self.bvids))
+        repeated = np.flatnonzero(counts > 1)
+        repeated = repeated[np.argsort(-counts[repeated], kind='stable')][:top]
+        return [(self.bvids[i], self.titles[i], int(counts[i])) for i in repeated]
+
+    def top_videos(self, top: int = 10, by: str = 'view') -> list:
+        '''
+        按统计数据排行的视频(每个视频只算一次)
+
+        :param by: view/like/coin/favorite
+        :return: [(BV号, 标题, 数值), ...]
+        '''
+        values = getattr(self, by)
+        best = np.zeros(len(self.bvids), dtype=np.int64)
+        np.maximum.at(best, self.video, values)
+        top = min(top, len(best))
+        if not top:
+            return []
+        order = np.argpartition(-best, top - 1)[:top]
+        order = order[np.argsort(-best[order], kind='stable')]
+        return [(self.bvids[i], self.titles[i], int(best[i])) for i in order]
+
+    def summary(self) -> dict:
+        '''
+        总体统计
+        '''
+        completion = self.completion()
+        return {
+            'records': len(self),
+            'videos': len(self.bvids),
+            'ups': len(self.up_names),
+            'watch_seconds': int(self.watch_time().sum()),
+            'mean_completion': float(np.nanmean(completion)) if np.any(~np.isnan(completion)) else 0.0,
+            'finished': int(np.count_nonzero(completion >= 0.95)),
+        }
+
+    def print_report(self, top: int = 10):
+        '''
+        在终端输出统计报告
+        '''
+        s = self.summary()
+        print("=" * 50)
+        print("观看历史统计")
+        print("=" * 50)
+        print(f"记录数: {s['records']}  视频数: {s['videos']}  UP主数: {s['ups']}")
+        print(f"总观看时长: {s['watch_seconds'] / 3600:.1f} 小时")
+        print(f"平均完成率: {s['mean_completion']:.1%}  看完(>=95%): {s['finished']}")
+
+        print(f"\n观看时长最多的UP主:")
+        for name, count, seconds in self.by_up(top):
+            print(f"  {name}: {count} 个, {seconds / 60:.0f} 分钟")
+
+        if len(self.tag_names):
+            print(f"\n观看时长最多的标签:")
+            for name, count, seconds in self.by_tag(top):
+                print(f"  {name}: {count} 个, {seconds / 60:.0f} 分钟")
+
+        print(f"\n各时段观看时长(分钟):")
+        hours = self.by_hour()
+        peak = max(int(hours.max()), 1)
+        for hour, seconds in enumerate(hours.tolist()):
+            bar = '#' * round(seconds / peak * 30)
+            print(f"  {hour:02d}时 {seconds / 60:6.0f} {bar}")
+
+        rewatches = self.rewatches(top)
+        if rewatches:
+            print(f"\n重复观看:")
+            for bvid, title, count in rewatches:
+                print(f"  {title[:30]} ({bvid}): {count} 次")
+
+        if self.view.any():
+            print(f"\n播放量最高的视频:")
+            for bvid, title, view in self.top_videos(top):
+                print(f"  {title[:30]} ({bvid}): {format_number(view)}")
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='观看历史统计分析')
+    parser.add_argument('paths', nargs='*', metavar='CSV',
+                        help='save_history 导出的CSV, 可以传入多次导出的文件(默认为 data/history_videos.csv)')
+    parser.add_argument('--top', type=int, default=10, help='排行显示的数量')
+    args = parser.parse_args(argv)
+
+    paths = args.paths or [os.path.join(DATA_DIR, 'history_videos.csv')]
+    HistoryFrame.from_csv(paths).print_report(top=args.top)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
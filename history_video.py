@@ -5,12 +5,17 @@
 import os
 import time
 from datetime import datetime, timedelta
-from typing import Optional, Generator
+from typing import Callable, Optional, Generator, Iterable
 
+import schemas
 from crawler import BiliCrawler
+from dedup_index import HISTORY
+from profiler import span
 from config import BiliAPI, DATA_DIR
 from video_info import VideoInfo
-from utils import timestamp_to_datetime, write2csv, write_head
+from records import HistoryRecord
+from utils import timestamp_to_datetime, write_rows
+from work_queue import TaskQueue
 
 
 class HistoryVideo(BiliCrawler):
@@ -18,10 +23,12 @@ class HistoryVideo(BiliCrawler):
     观看历史爬取类
     '''
 
-    def __init__(self):
-        super().__init__()
-        self.video_info = VideoInfo()
+    def __init__(self, cookies: dict = None):
+        super().__init__(cookies=cookies)
+        self.video_info = VideoInfo(cookies=self.cookies)
         self.data_file = os.path.join(DATA_DIR, 'history_videos.csv')
+        # 跨运行去重索引(见 dedup_index.py), 设置后已经输出过的观看记录不再获取详情和输出
+        self.dedup = None
 
     def get_week_start_timestamp(self) -> int:
         """
@@ -49,7 +56,7 @@ class HistoryVideo(BiliCrawler):
             'ps': 20
         }
 
-        resp = self._request(BiliAPI.HISTORY, params=params)
+        resp = self._request(BiliAPI.HISTORY, params=params, schema=schemas.HISTORY)
 
         if resp.get('code') != 0:
             print(f"获取历史记录失败: {resp.get('message')}")
@@ -57,64 +64,155 @@ class HistoryVideo(BiliCrawler):
     
         return resp['data']
     
-    def iter_history(self, start_ts:int=None) -> Generator[dict, None, None]:
+    def iter_history_pages(self, max_ts: int = 0, view_at: int = 0,
+                           business: str = '') -> Generator[dict, None, None]:
         """
-        迭代获取历史记录
+        按页迭代历史记录
+        Args:
+            max_ts: 起始游标max
+            view_at: 起始游标view_at
+            business: 业务类型
+        Yields:
+            dict: 单页数据(包含 list 和 cursor), 请求失败时提前结束
+        Returns:
+            bool: 是否翻到了最后一页(请求失败时为False)
+        """
+        while True:
+            data = self.get_history(max_ts=max_ts, view_at=view_at, business=business)
+            if not data:
+                return False
+
+            yield data
+
+            # 如果数据list为[], 说明没有更多数据
+            if not data.get('list'):
+                return True
+
+            # 获取下一页的游标
+            cursor = data.get('cursor', {})
+            max_ts = cursor.get('max', 0)
+            view_at = cursor.get('view_at', 0)
+
+            # 没有数据
+            if max_ts == 0:
+                return True
+
+            # 避免请求过快
+            with span('throttle'):
+                time.sleep(0.5)
+
+    def iter_history(self, start_ts:int=None, end_ts:int=None,
+                     business:str='archive') -> Generator[dict, None, None]:
+        """
+        迭代获取 [start_ts, end_ts) 内的历史记录
+
+        有end_ts时直接用 view_at 游标从end_ts开始翻页, 不需要从最新的记录翻过去
         Args:
             start_ts: 起始时间戳(只获取在此时间之后的记录)
+            end_ts: 结束时间戳(只获取在此时间之前的记录)
+            business: 业务类型(archive=视频 pgc=番剧 live=直播 article=专栏), 空字符串表示全部
         Yields:
             dict: 单条历史记录
+        Returns:
+            bool: 是否完整获取了时间范围内的记录(翻页请求失败时为False)
         """
-        max_ts = 0
-        view_at = 0
-
+        pages = self.iter_history_pages(view_at=end_ts or 0, business=business)
         while True:
-            data = self.get_history(max_ts=max_ts, view_at=view_at)
-
-            # 如果没有数据, 或者数据list为[], 直接跳出while
-            if not data or not data.get('list'):
-                break
-        
+            try:
+                data = next(pages)
+            except StopIteration as stop:
+                return stop.value
             for item in data['list']:
-                # 只处理视频
-                if item.get('history', {}).get('business') != 'archive':
+                # 只处理指定的业务类型(接口已经按business筛选, 这里再确认一次)
+                if business and item.get('history', {}).get('business') != business:
                     continue
 
                 item_view_at = item.get('view_at', 0)
+                if end_ts and item_view_at >= end_ts:
+                    continue
 
                 # 如果记录时间早于起始时间, 停止迭代
                 if start_ts and item_view_at < start_ts:
-                    return
+                    pages.close()
+                    return True
                 
                 yield item
 
-            # 获取下一页的游标
-            cursor = data.get('cursor', {})
-            max_ts = cursor.get('max', 0)
-            view_at = cursor.get('view_at', 0)
+    def iter_records(self, start_ts: int = None, end_ts: int = None, business: str = 'archive',
+                     where: Callable[[HistoryRecord], bool] = None,
+                     include_detail: bool = False, include_comments: bool = False,
+                     incremental: bool = False) -> Generator[HistoryRecord, None, None]:
+        """
+        逐条获取时间范围内的观看历史, 筛选条件在获取详情之前执行
+        Args:
+            start_ts: 起始时间戳
+            end_ts: 结束时间戳(不包含), None表示到现在
+            business: 业务类型, 空字符串表示全部
+            where: 筛选函数, 返回False的记录不获取详情也不输出
+            include_detail: 是否获取视频详情(时长、点赞等)
+            include_comments: 是否获取评论
+            incremental: 视频指纹未变化时不再请求标签和评论(见 VideoInfo.get_full_video_details)
+        Yields:
+            HistoryRecord: 单条历史记录, 设置了 dedup 时只包含之前运行没有输出过的记录
+        """
+        dedup = self.dedup
+        for item in self.iter_history(start_ts=start_ts, end_ts=end_ts, business=business):
+            # 同一个视频每次观看(观看时间不同)算一条记录
+            history = item.get('history') or {}
+            key = f"{history.get('business')}:{history.get('oid') or history.get('bvid')}:{item.get('view_at')}"
+            if dedup is not None and dedup.seen(HISTORY, key):
+                continue
 
-            # 没有数据
-            if max_ts == 0:
-                break
+            record = HistoryRecord.from_api(item)
+            if where is not None and not where(record):
+                continue
 
-            # 避免请求过快
-            time.sleep(0.5)
+            # 获取更多视频详情
+            if include_detail and record.bvid:
+                with span('enrich'):
+                    detail = self.video_info.get_full_video_details(
+                        bvid=record.bvid,
+                        include_comments=include_comments,
+                        comment_count=10,
+                        incremental=incremental,
+                    )
+                if detail:
+                    record.apply_detail(detail, include_comments=include_comments)
+                
+                self._throttle(include_comments)
+            
+            print(f"  已获取: {(record.title or '')[:30]}...")
+            yield record
+            # 调用方处理完(如已写入文件)之后才记录
+            if dedup is not None:
+                dedup.add(HISTORY, key)
 
-    
-    def get_week_history(self, include_detail: bool = False, 
-                          include_comments: bool = False) -> list:
+        if dedup is not None:
+            dedup.flush()
+        if incremental:
+            self._save_fingerprints()
+
+    def iter_week_history(self, include_detail: bool = False,
+                          include_comments: bool = False,
+                          checkpoint: TaskQueue = None,
+                          incremental: bool = False) -> Generator[HistoryRecord, None, None]:
         """
-        获取过去一周的观看历史
+        逐条获取过去一周的观看历史(流式, 不在内存中累积)
         Args:
             include_detail: 是否获取视频详情(时长、点赞等)
             include_comments: 是否获取评论(评论API限制较严，建议单独获取)
-        Returns:
-            list: 历史记录列表
+            checkpoint: 检查点, 传入时中断后可以从停下的位置继续(见 crawl_week_history)
+            incremental: 视频指纹未变化时不再请求标签和评论(见 VideoInfo.get_full_video_details)
+        Yields:
+            HistoryRecord: 单条历史记录
         """
-        import random
-        
+        if checkpoint is not None:
+            yield from self._iter_week_history_checkpoint(
+                checkpoint, include_detail=include_detail, include_comments=include_comments,
+                incremental=incremental)
+            return
+
         week_start = self.get_week_start_timestamp()
-        history_list = []
         
         print(f"正在获取过去一周的观看历史...")
         print(f"起始时间: {timestamp_to_datetime(week_start)}")
@@ -124,108 +222,288 @@ class HistoryVideo(BiliCrawler):
             else:
                 print("📝 不获取评论（可设置 include_comments=True 开启）")
         
-        for item in self.iter_history(start_ts=week_start):
-            history = item.get('history', {})
-            
-            record = {
-                'bvid': history.get('bvid'),
-                'title': item.get('title'),
-                'author_name': item.get('author_name'),
-                'author_mid': item.get('author_mid'),
-                'view_at': item.get('view_at'),
-                'view_at_str': timestamp_to_datetime(item.get('view_at', 0)),
-                'progress': item.get('progress', 0),  # 观看进度(秒)
-                'duration': item.get('duration', 0),  # 视频时长
-                'cover': item.get('cover'),
-            }
-            
-            # 获取更多视频详情
-            if include_detail and record['bvid']:
-                detail = self.video_info.get_full_video_details(
-                    bvid=record['bvid'],
-                    include_comments=include_comments,
-                    comment_count=10
-                )
-                if detail:
-                    record['stat'] = detail.get('stat')
-                    record['tags'] = [t['tag_name'] for t in detail.get('tags', [])]
-                    record['desc'] = detail.get('desc', '')
-                    if include_comments:
-                        record['top_comments'] = detail.get('top_comments', [])
-                
-                # 避免请求过快，使用随机延迟
-                # 如果包含评论，延迟更长
-                if include_comments:
-                    time.sleep(random.uniform(2.0, 3.5))
-                else:
-                    time.sleep(random.uniform(0.3, 0.8))
-            
-            history_list.append(record)
-            print(f"  已获取: {record['title'][:30]}...")
+        yield from self.iter_records(
+            start_ts=week_start,
+            include_detail=include_detail,
+            include_comments=include_comments,
+            incremental=incremental,
+        )
+
+    def _save_fingerprints(self):
+        '''
+        保存视频指纹并输出跳过的请求数
+        '''
+        self.video_info.save_fingerprints()
+        skipped = self.video_info.skipped
+        print(f"未变化跳过: 标签 {skipped['tags']} 次, 评论 {skipped['comments']} 次")
+
+    def _throttle(self, include_comments: bool):
+        '''
+        获取详情后的随机延迟, 避免请求过快
+
+        包含评论时延迟更长, 但评论接口熔断期间不会请求评论, 使用普通延迟
+        '''
+        import random
+
+        with span('throttle'):
+            if include_comments and not self.video_info.is_circuit_open(BiliAPI.REPLY_MAIN):
+                time.sleep(random.uniform(2.0, 3.5))
+            else:
+                time.sleep(random.uniform(0.3, 0.8))
+
+    def _iter_week_history_checkpoint(self, checkpoint: TaskQueue, include_detail: bool,
+                                      include_comments: bool,
+                                      incremental: bool = False) -> Generator[HistoryRecord, None, None]:
+        """
+        带检查点获取过去一周的观看历史
+
+        1. 翻页列出历史记录, 每条记录作为一个任务保存, 每页结束时保存游标
+        2. 依次执行未完成的任务(获取详情), 结果保存到检查点
+        3. 按顺序输出所有记录, 获取详情失败的记录不带详情输出(可用 retry_failed 后重新运行)
+
+        全部任务完成(或失败次数达到上限)后, 下一次运行会清空检查点重新开始;
+        时间范围已经变化(不是同一天开始的任务)时也重新开始
+        """
+        state = checkpoint.get_state('listing') or {}
+        window_changed = ('start_ts' in state and
+                          datetime.fromtimestamp(state['start_ts']).date() !=
+                          datetime.fromtimestamp(self.get_week_start_timestamp()).date())
+        if checkpoint.get_state('finished') or window_changed:
+            checkpoint.reset()
+            state = {}
+
+        if 'start_ts' not in state:
+            # 起始时间在第一次运行时确定, 续爬时保持不变
+            state = {'start_ts': self.get_week_start_timestamp(), 'max': 0, 'view_at': 0, 'done': False}
+            checkpoint.set_state('listing', state)
+        start_ts = state['start_ts']
+
+        if not state['done']:
+            print(f"正在列出观看历史(起始时间: {timestamp_to_datetime(start_ts)})...")
+            for data in self.iter_history_pages(max_ts=state['max'], view_at=state['view_at'],
+                                                business='archive'):
+                cursor = data.get('cursor', {})
+                reached_start = False
+                with checkpoint.transaction():
+                    for item in data['list']:
+                        if item.get('history', {}).get('business') != 'archive':
+                            continue
+                        if item.get('view_at', 0) < start_ts:
+                            reached_start = True
+                            break
+                        record = HistoryRecord.from_api(item)
+                        checkpoint.add(
+                            key=f'{record.view_at}:{record.bvid}',
+                            endpoint=BiliAPI.VIDEO_INFO,
+                            params={'bvid': record.bvid},
+                            payload=record.to_dict(),
+                        )
+                    state['max'] = cursor.get('max', 0)
+                    state['view_at'] = cursor.get('view_at', 0)
+                    state['done'] = reached_start or not data['list'] or state['max'] == 0
+                    checkpoint.set_state('listing', state)
+                if reached_start:
+                    break
+            if not state['done']:
+                print("⚠️ 获取历史记录列表中断, 重新运行可以继续")
+
+        def enrich(task):
+            record = HistoryRecord.from_dict(task.payload)
+            if include_detail and record.bvid:
+                with span('enrich'):
+                    detail = self.video_info.get_full_video_details(
+                        bvid=record.bvid,
+                        include_comments=include_comments,
+                        comment_count=10,
+                        incremental=incremental,
+                    )
+                self._throttle(include_comments)
+                if not detail:
+                    return None
+                # 评论接口熔断时任务记为失败, 重新运行时再获取
+                if include_comments and record.bvid in self.video_info.deferred_comments:
+                    return None
+                record.apply_detail(detail, include_comments=include_comments)
+            print(f"  已获取: {(record.title or '')[:30]}...")
+            return record.to_dict()
+
+        counts = checkpoint.run(enrich)
+        if incremental:
+            self._save_fingerprints()
+        if counts['failed'] or counts['pending']:
+            print(f"⚠️ {counts['failed'] + counts['pending']} 条记录获取详情失败")
+        # 失败次数达到上限的任务(视频已删除等)不会再成功, 不阻止任务结束
+        if state['done'] and not counts['pending']:
+            checkpoint.set_state('finished', True)
+
+        for task, result in checkpoint.results():
+            yield HistoryRecord.from_dict(result if result is not None else task.payload)
+
+    def crawl_week_history(self, include_detail: bool = False, include_comments: bool = False,
+                           checkpoint_file: str = None, retry_failed: bool = False,
+                           incremental: bool = False) -> list:
+        """
+        带检查点获取过去一周的观看历史, 异常或Ctrl-C中断后重新运行会从停下的位置继续
+        Args:
+            include_detail: 是否获取视频详情
+            include_comments: 是否获取评论
+            checkpoint_file: 检查点文件, 默认为 data/checkpoint.sqlite3
+            retry_failed: 是否重试上次失败的任务
+            incremental: 视频指纹未变化时不再请求标签和评论
+        Returns:
+            list: 历史记录列表(HistoryRecord)
+        """
+        checkpoint_file = checkpoint_file or os.path.join(DATA_DIR, 'checkpoint.sqlite3')
+        job = f"week_history:{self.get_mid()}:{int(include_detail)}{int(include_comments)}"
+        with TaskQueue(checkpoint_file, job) as checkpoint:
+            if retry_failed:
+                checkpoint.retry_failed()
+                checkpoint.set_state('finished', False)
+            return list(self.iter_week_history(
+                include_detail=include_detail,
+                include_comments=include_comments,
+                checkpoint=checkpoint,
+                incremental=incremental,
+            ))
+
+    def get_week_history(self, include_detail: bool = False, 
+                          include_comments: bool = False) -> list:
+        """
+        获取过去一周的观看历史
+        Args:
+            include_detail: 是否获取视频详情(时长、点赞等)
+            include_comments: 是否获取评论(评论API限制较严，建议单独获取)
+        Returns:
+            list: 历史记录列表(HistoryRecord)
+        """
+        history_list = list(self.iter_week_history(
+            include_detail=include_detail,
+            include_comments=include_comments,
+        ))
         
         print(f"\n共获取 {len(history_list)} 条观看记录")
+        deferred = self.video_info.deferred_comments
+        if deferred:
+            print(f"⚠️ 评论接口熔断, {len(deferred)} 个视频的评论被跳过(见 video_info.deferred_comments)")
         return history_list
     
 
-    def save_history(self, history_list: list = None, include_detail: bool = False) -> bool:
+    def _crawl_partition(self, start_ts: int, end_ts: int, business: str) -> tuple:
+        '''
+        获取一个时间分区 [start_ts, end_ts) 内的历史记录
+
+        :return: (记录列表, 是否完整获取)
+        '''
+        items = []
+        history = self.iter_history(start_ts=start_ts, end_ts=end_ts, business=business)
+        while True:
+            try:
+                items.append(next(history))
+            except StopIteration as stop:
+                return items, bool(stop.value)
+
+    def backfill(self, start_ts: int = None, end_ts: int = None, years: int = 3,
+                 partitions: int = 8, workers: int = 4, business: str = 'archive',
+                 where: Callable[[HistoryRecord], bool] = None) -> list:
+        """
+        按时间分区并发获取全部观看历史
+
+        把时间轴切成若干分区, 每个分区用 view_at 游标直接定位到分区的结束时间后独立翻页,
+        最后按时间拼接, 同一个视频只保留最近一次观看(翻页期间重新观看的视频会出现在两个分区)
+        Args:
+            start_ts: 起始时间戳, None表示不限制(最早的分区没有下限)
+            end_ts: 结束时间戳, 默认为现在
+            years: start_ts为None时, 用于划分分区的时间跨度(年)
+            partitions: 分区数
+            workers: 并发数
+            business: 业务类型, 空字符串表示全部
+            where: 筛选函数, 返回False的记录不输出
+        Returns:
+            list: 历史记录列表(HistoryRecord), 按观看时间从新到旧
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        end_ts = end_ts or int(time.time()) + 1
+        low = start_ts or end_ts - years * 365 * 86400
+        step = max(1, (end_ts - low) // partitions)
+        bounds = []
+        hi = end_ts
+        for i in range(partitions):
+            lo = low if i == partitions - 1 else hi - step
+            bounds.append((lo, hi))
+            hi = lo
+        # 没有起始时间时, 最早的分区一直翻到底
+        if start_ts is None:
+            bounds[-1] = (None, bounds[-1][1])
+
+        print(f"按 {len(bounds)} 个分区获取观看历史(并发 {workers})...")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda b: self._crawl_partition(b[0], b[1], business), bounds))
+
+        records = []
+        seen = set()
+        for (lo, hi), (items, complete) in zip(bounds, results):
+            begin = timestamp_to_datetime(lo) if lo else '最早'
+            status = '' if complete else ' (未完整获取)'
+            print(f"  {begin} ~ {timestamp_to_datetime(hi)}: {len(items)} 条{status}")
+            # 分区从新到旧, 重复的视频保留先出现(更新)的那一条
+            for item in items:
+                history = item.get('history', {})
+                key = (history.get('business'), history.get('oid') or history.get('bvid'))
+                if key in seen:
+                    continue
+                seen.add(key)
+                record = HistoryRecord.from_api(item)
+                if where is None or where(record):
+                    records.append(record)
+
+        print(f"共获取 {len(records)} 条观看记录")
+        return records
+
+    def save_history(self, history_list: Iterable[HistoryRecord] = None, include_detail: bool = False,
+                     index=None) -> bool:
         """
         保存观看历史到CSV
         Args:
-            history_list: 历史记录列表
+            history_list: 历史记录(列表或迭代器), 不传入就流式获取并边爬边写
             include_detail: 是否包含详情
+            index: 全文索引(SearchIndex), 传入时边写边加入索引
         Returns:
             bool: 是否成功
         """
         if history_list is None:
-            history_list = self.get_week_history(include_detail=include_detail)
-        
-        if not history_list:
+            history_list = self.iter_week_history(include_detail=include_detail)
+        elif not history_list:
             return False
         
         # 写入表头
-        if include_detail:
-            heads = ['标题', 'BV号', 'UP主', '观看时间', '观看进度', '时长', 
-                     '播放', '点赞', '投币', '收藏', '标签', '简介']
-        else:
-            heads = ['标题', 'BV号', 'UP主', '观看时间', '观看进度', '时长']
+        heads = HistoryRecord.DETAIL_HEADS if include_detail else HistoryRecord.HEADS
         
-        # 删除已有文件重新写入
-        if os.path.exists(self.data_file):
-            os.remove(self.data_file)
+        # 先写入临时文件, 获取到记录后再替换已有文件(爬取失败时保留上一次的结果)
+        tmp_file = self.data_file + '.tmp'
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
         
-        write_head(self.data_file, heads)
-        
-        for record in history_list:
-            duration_str = self.format_duration(record.get('duration', 0))
-            progress_str = self.format_duration(record.get('progress', 0))
-            
-            if include_detail:
-                stat = record.get('stat', {})
-                row = [
-                    record['title'],
-                    record['bvid'],
-                    record['author_name'],
-                    record['view_at_str'],
-                    progress_str,
-                    duration_str,
-                    stat.get('view', ''),
-                    stat.get('like', ''),
-                    stat.get('coin', ''),
-                    stat.get('favorite', ''),
-                    ', '.join(record.get('tags', [])),
-                    record.get('desc', '')[:100],  # 限制简介长度
-                ]
-            else:
-                row = [
-                    record['title'],
-                    record['bvid'],
-                    record['author_name'],
-                    record['view_at_str'],
-                    progress_str,
-                    duration_str,
-                ]
-            
-            write2csv(self.data_file, row)
+        def rows():
+            for record in history_list:
+                if index is not None:
+                    index.add_history(record)
+                yield record.to_row(include_detail=include_detail)
+
+        try:
+            count = write_rows(tmp_file, rows(), heads=heads)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        finally:
+            if index is not None:
+                index.flush()
+
+        if not count:
+            os.remove(tmp_file)
+            return False
+        os.replace(tmp_file, self.data_file)
         
         print(f"✓ 观看历史已保存到: {self.data_file}")
         return True
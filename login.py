@@ -2,34 +2,59 @@
 扫码登录板块
 '''
 
-import requests
+import asyncio
+import inspect
 import time
-import qrcode
-from io import BytesIO
+from typing import Callable, Optional
+
+import requests
+
 from config import HEADERS, BiliAPI, save_cookies, load_cookies
 
+# 二维码状态码
+QR_SUCCESS = 0
+QR_NOT_SCANNED = 86101
+QR_SCANNED = 86090
+QR_EXPIRED = 86038
+QR_CANCELLED = 86083
+
+# 接口返回的未登录错误码
+NOT_LOGGED_IN = -101
+
 
 class BiliLogin:
     '''
     扫码登录类
     '''
 
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update(HEADERS)
+    def __init__(self, cookie_file: str = None, session: requests.Session = None):
+        '''
+        :param cookie_file: cookie保存路径, 默认为COOKIE_FILE(多账号时每个账号一个文件)
+        :param session: 使用的会话, 默认新建
+        '''
+        if session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+        self.session = session
+        self.cookie_file = cookie_file
         self.qrcode_key = None
         self.cookies = {}
 
-    def generate_qrcode(self) -> str:
+    def generate_qrcode(self) -> Optional[str]:
         '''
-        :returns: str: 二维码的url
+        :returns: str: 二维码的url, 获取失败返回None
         '''
-        response = self.session.get(BiliAPI.QR_GENERATE)
-        # 获取数据的json形式
-        data = response.json()
+        # 网络错误或返回的不是JSON时按获取失败处理
+        try:
+            response = self.session.get(BiliAPI.QR_GENERATE, timeout=10)
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"获取二维码失败: {e}")
+            return None
 
-        if data['code'] != 0:
-            raise Exception(f"获取二维码失败: {data['message']}")
+        if data.get('code') != 0 or not isinstance(data.get('data'), dict):
+            print(f"获取二维码失败: {data.get('message')}")
+            return None
         
         self.qrcode_key = data['data']['qrcode_key']
         qr_url = data['data']['url']
@@ -41,6 +66,8 @@ class BiliLogin:
         在终端中显示二维码
         :params: url: 二维码的内容url
         '''
+        # 只有登录时才需要, 不在模块导入时加载
+        import qrcode
 
         qr = qrcode.QRCode(
             version=1,
@@ -60,6 +87,7 @@ class BiliLogin:
         :param url: 二维码的url
         :param filename: 保存的文件名字
         """
+        import qrcode
         qr = qrcode.QRCode(
             version=1,
             error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -82,13 +110,33 @@ class BiliLogin:
         params = {
             'qrcode_key': self.qrcode_key,
         }
-        response = self.session.get(BiliAPI.QR_POLL, params=params)
-        data = response.json()
+        # 网络错误或返回的不是JSON时按未扫码处理, 下次轮询再试
+        try:
+            response = self.session.get(BiliAPI.QR_POLL, params=params, timeout=10)
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            return {'code': -1, 'message': str(e), 'data': {'code': QR_NOT_SCANNED}}
+        if not isinstance(data.get('data'), dict):
+            return {'code': data.get('code', -1), 'message': data.get('message'),
+                    'data': {'code': QR_NOT_SCANNED}}
 
         # 更新cookies
         self.cookies.update(requests.utils.dict_from_cookiejar(response.cookies))
 
         return data
+
+    def finish_login(self, result: dict):
+        '''
+        登录成功后提取并保存cookies
+
+        :param result: 登录成功时的轮询结果
+        '''
+        # 从url中提取额外的cookies
+        self._parse_url_cookies(result['data'].get('url') or '')
+        # 刷新cookie时需要 refresh_token(见 session_health.py)
+        if result['data'].get('refresh_token'):
+            self.cookies['ac_time_value'] = result['data']['refresh_token']
+        save_cookies(self.cookies, self.cookie_file)
     
 
     def _parse_url_cookies(self, url: str):
@@ -123,6 +171,8 @@ class BiliLogin:
         # 生成二维码
         print("\n 正在获取二维码...")
         qr_url = self.generate_qrcode()
+        if not qr_url:
+            return False
 
         # 显示二维码
         if show_in_terminal:
@@ -134,70 +184,191 @@ class BiliLogin:
 
         print("\n等待扫码")        
 
-        # 轮询登录状态
-        while True:
-            result = self.poll_login_status()
-            code = result['data']['code']
-
-            if code == 0:
-                # 登录成功
+        def on_event(event: str, data):
+            if event == LoginFlow.SCANNED:
+                print("\r已扫码, 请在手机上确认登录...", end='', flush=True)
+            elif event == LoginFlow.SUCCESS:
                 print("\n登录成功!")
-
-                # 从url中提取额外的cookies
-                url = result['data']['url']
-                self._parse_url_cookies(url)
-
-                # 保存cookies
-                save_cookies(self.cookies)
                 print("\ncookies已保存")
-
-                return True
-
-            elif code == 86101:
-                # 未扫码
-                pass
-
-            elif code == 86090:
-                # 已扫码, 等待确认
-                print("\r已扫码, 请在手机上确认登录...", end='', flush=True)
-
-            elif code == 86038:
-                # 二维码已过期
+            elif event == LoginFlow.EXPIRED:
                 print("\n二维码已过期, 请重新登录")
-                return False
-            
-            elif code == 86083:
-                # 扫码被拒绝
+            elif event == LoginFlow.CANCELLED:
                 print("\n 登录已被取消")
-                return False
+            elif event == LoginFlow.UNKNOWN:
+                print(f"\n未知状态码:{data}")
 
-            else:
-                print("\n未知状态码:{code}")
-            
-            time.sleep(1)
+        # 二维码已经生成, 复用同一个流程轮询登录状态
+        flow = LoginFlow(login=self, on_event=on_event)
+        return asyncio.run(flow.wait())
 
-    def check_login_status(self) -> dict :
+    def check_login_status(self, cookies: dict = None) -> dict :
         '''
         检查当前登录的状态
+        :param cookies: 要检查的cookies, 默认从cookie_file读取
         :return:
-            dict: 用户信息, 如果未登录就返回None
+            dict: 用户信息, 如果未登录就返回None;
+            网络错误或接口返回其他错误码(无法确定是否登录)时返回False
         '''
-        cookies = load_cookies()
+        if cookies is None:
+            cookies = load_cookies(self.cookie_file)
         if not cookies:
             return None
         
-        response = self.session.get(BiliAPI.NAV_INFO, cookies=cookies)
-        data = response.json()
+        try:
+            response = self.session.get(BiliAPI.NAV_INFO, cookies=cookies, timeout=10)
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"检查登录状态失败: {e}")
+            return False
+
+        code = data.get('code')
+        info = data.get('data') or {}
+        if code == 0:
+            return info if info.get('isLogin') else None
+        if code == NOT_LOGGED_IN:
+            return None
+        print(f"检查登录状态失败: {code} {data.get('message')}")
+        return False
 
-        if data['code'] == 0 and data['data']['isLogin']:
-            return data['data']
-        return None
-    
-def login():
+
+class LoginFlow:
+    '''
+    异步扫码登录流程
+
+    请求在线程池中执行, 轮询间隔使用 asyncio.sleep, 多个账号可以在同一个事件循环中并发登录,
+    不会为每个账号占用一个阻塞的线程; 二维码和状态变化通过 on_event(event, data) 回调通知
+    '''
+    # 事件
+    QRCODE = 'qrcode'        # 已生成二维码, data为二维码url
+    ERROR = 'error'          # 获取二维码失败
+    SCANNED = 'scanned'      # 已扫码, 等待确认
+    SUCCESS = 'success'      # 登录成功, data为cookies
+    EXPIRED = 'expired'      # 二维码已过期
+    CANCELLED = 'cancelled'  # 扫码被拒绝
+    TIMEOUT = 'timeout'      # 超时未完成
+    UNKNOWN = 'unknown'      # 未知状态码, data为状态码
+
+    def __init__(self, cookie_file: str = None, on_event: Callable = None,
+                 poll_interval: float = 1.0, timeout: float = 180.0, login: BiliLogin = None):
+        '''
+        :param cookie_file: 登录成功后cookie的保存路径
+        :param on_event: 事件回调 on_event(event, data), 可以是普通函数或协程函数
+        :param poll_interval: 轮询间隔(秒)
+        :param timeout: 最长等待时间(秒)
+        :param login: 使用的BiliLogin, 默认新建
+        '''
+        self.login = login or BiliLogin(cookie_file=cookie_file)
+        self.on_event = on_event
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        # 最后一个事件
+        self.state = None
+
+    async def _emit(self, event: str, data=None):
+        self.state = event
+        if self.on_event is None:
+            return
+        result = self.on_event(event, data)
+        if inspect.isawaitable(result):
+            await result
+
+    async def run(self) -> bool:
+        '''
+        生成二维码并等待登录完成
+
+        :return: 是否登录成功
+        '''
+        qr_url = await asyncio.to_thread(self.login.generate_qrcode)
+        if not qr_url:
+            await self._emit(self.ERROR)
+            return False
+        await self._emit(self.QRCODE, qr_url)
+        return await self.wait()
+
+    async def wait(self) -> bool:
+        '''
+        轮询已生成的二维码直到登录成功、失败或超时
+
+        :return: 是否登录成功
+        '''
+        deadline = time.monotonic() + self.timeout
+        scanned = False
+        while time.monotonic() < deadline:
+            result = await asyncio.to_thread(self.login.poll_login_status)
+            code = result['data'].get('code')
+
+            if code == QR_SUCCESS:
+                await asyncio.to_thread(self.login.finish_login, result)
+                await self._emit(self.SUCCESS, self.login.cookies)
+                return True
+            elif code == QR_SCANNED:
+                if not scanned:
+                    scanned = True
+                    await self._emit(self.SCANNED)
+            elif code == QR_EXPIRED:
+                await self._emit(self.EXPIRED)
+                return False
+            elif code == QR_CANCELLED:
+                await self._emit(self.CANCELLED)
+                return False
+            elif code != QR_NOT_SCANNED:
+                await self._emit(self.UNKNOWN, code)
+
+            await asyncio.sleep(self.poll_interval)
+
+        await self._emit(self.TIMEOUT)
+        return False
+
+
+async def check_accounts(cookie_files: list) -> dict:
+    '''
+    并发检查多个账号的登录状态
+
+    :param cookie_files: 各账号的cookie文件
+    :return: {cookie文件: 用户信息}, 未登录或已过期的为None, 检查失败的为False
+    '''
+    checks = [asyncio.to_thread(BiliLogin(cookie_file=path).check_login_status)
+              for path in cookie_files]
+    return dict(zip(cookie_files, await asyncio.gather(*checks)))
+
+
+async def watch_accounts(cookie_files: list, on_expired: Callable, interval: float = 3600.0,
+                         rounds: int = None) -> None:
+    '''
+    定时检查多个账号的登录状态, 确认未登录时调用 on_expired(cookie_file)
+
+    on_expired 可以是协程函数, 例如启动 LoginFlow(cookie_file=...).run() 重新登录;
+    同一轮中多个账号的回调并发执行, 全部结束后才开始等待下一轮;
+    网络错误等无法确定登录状态的账号留到下一轮再检查, 某个账号的回调出错不影响其他账号
+
+    :param cookie_files: 各账号的cookie文件
+    :param on_expired: 账号未登录/已过期时的回调
+    :param interval: 检查间隔(秒)
+    :param rounds: 检查轮数, None表示一直检查
+    '''
+    async def relogin(path):
+        try:
+            result = on_expired(path)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"账号 {path} 重新登录失败: {type(e).__name__}: {e}")
+
+    done = 0
+    while rounds is None or done < rounds:
+        expired = [path for path, info in (await check_accounts(cookie_files)).items() if info is None]
+        await asyncio.gather(*(relogin(path) for path in expired))
+        done += 1
+        if rounds is None or done < rounds:
+            await asyncio.sleep(interval)
+
+
+def login(cookie_file: str = None):
     '''
     login主函数
+    :param cookie_file: cookie保存路径, 默认为COOKIE_FILE
     '''
-    bililogin = BiliLogin()
+    bililogin = BiliLogin(cookie_file=cookie_file)
 
     # 先检查是否已经登录
     print("检查登录状态...")
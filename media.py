@@ -0,0 +1,227 @@
+'''
+封面、头像等图片的并发下载
+
+图片边下载边写入临时文件并计算sha256, 按内容哈希命名保存(相同图片只保存一份);
+url到文件的对应关系记录在 index.tsv 中, 已经下载过的url直接跳过
+'''
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+import requests
+
+from config import DATA_DIR
+from crawler import BiliCrawler
+from retry import FATAL, OK, RETRY
+
+
+class MediaFetcher:
+    '''
+    图片下载器, 使用爬虫的会话、限速器和重试策略
+    '''
+    # B站图片服务器支持的格式
+    FORMATS = ('jpg', 'png', 'webp', 'avif')
+    CHUNK_SIZE = 64 * 1024
+
+    # 记录中图片url所在的属性
+    URL_FIELDS = ('pic', 'cover', 'face', 'owner_face')
+
+    def __init__(self, crawler: BiliCrawler = None, store_dir: str = None, workers: int = 8):
+        '''
+        :param crawler: 共享会话的爬虫, 默认新建
+        :param store_dir: 保存目录, 默认为 data/media
+        :param workers: 并发数
+        '''
+        self.crawler = crawler or BiliCrawler()
+        self.store_dir = store_dir or os.path.join(DATA_DIR, 'media')
+        self.workers = workers
+        self.index_file = os.path.join(self.store_dir, 'index.tsv')
+        self._lock = threading.Lock()
+        # url -> 相对路径
+        self._index = {}
+        # 下载统计
+        self.downloaded = 0
+        self.skipped = 0
+        self.deduped = 0
+        self.failed = 0
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    url, _, path = line.rstrip('\n').partition('\t')
+                    if path:
+                        self._index[url] = path
+
+    @classmethod
+    def variant_url(cls, url: str, width: int = None, height: int = None, fmt: str = None) -> str:
+        '''
+        生成缩放后的图片url(在url后面加上 @{宽}w_{高}h.{格式})
+
+        :param url: 原图url
+        :param width: 宽度, None表示按高度等比缩放
+        :param height: 高度, None表示按宽度等比缩放
+        :param fmt: 图片格式 jpg/png/webp/avif, None表示保持原格式
+        :return: 图片url
+        '''
+        url = url.strip()
+        if url.startswith('//'):
+            url = 'https:' + url
+        elif url.startswith('http://'):
+            url = 'https://' + url[len('http://'):]
+        # 去掉已有的缩放参数
+        url = url.split('@', 1)[0]
+
+        parts = []
+        if width:
+            parts.append(f'{width}w')
+        if height:
+            parts.append(f'{height}h')
+        if not parts and not fmt:
+            return url
+        if fmt and fmt not in cls.FORMATS:
+            raise ValueError(f'不支持的图片格式: {fmt}')
+        return f"{url}@{'_'.join(parts)}{'.' + fmt if fmt else ''}"
+
+    def path_of(self, url: str) -> Optional[str]:
+        '''
+        已下载的url对应的文件路径, 没有下载过返回None
+        '''
+        path = self._index.get(url)
+        return os.path.join(self.store_dir, path) if path else None
+
+    def fetch(self, url: str, width: int = None, height: int = None, fmt: str = None) -> Optional[str]:
+        '''
+        下载一张图片
+
+        :param url: 图片url
+        :param width: 缩放宽度
+        :param height: 缩放高度
+        :param fmt: 图片格式
+        :return: 保存的文件路径, 失败返回None
+        '''
+        if not url:
+            return None
+        url = self.variant_url(url, width, height, fmt)
+
+        path = self.path_of(url)
+        if path and os.path.exists(path):
+            with self._lock:
+                self.skipped += 1
+            return path
+
+        policy = self.crawler.retry_policy
+        attempt = 0
+        while True:
+            attempt += 1
+            result, verdict = self._download(url)
+            if verdict != RETRY or attempt >= policy.max_attempts or not policy.should_retry(attempt):
+                break
+            time.sleep(policy.delay(attempt))
+
+        if result is None:
+            with self._lock:
+                self.failed += 1
+            print(f"下载图片失败: {url} ({verdict})")
+        return result
+
+    def _download(self, url: str) -> tuple:
+        '''
+        下载一次
+
+        :return: (文件路径, 判定结果 OK/RETRY/FATAL)
+        '''
+        crawler = self.crawler
+        if crawler.rate_limiter is not None:
+            crawler.rate_limiter.acquire()
+
+        tmp_path = os.path.join(self.store_dir, f'.{threading.get_ident()}.tmp')
+        digest = hashlib.sha256()
+        try:
+            with crawler.session.get(url, stream=True, timeout=30,
+                                     headers={'Accept': 'image/avif,image/webp,image/*,*/*;q=0.8'}) as response:
+                verdict = crawler.retry_policy.classify_status(response.status_code)
+                if verdict != OK:
+                    return None, verdict
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(self.CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+                content_type = response.headers.get('Content-Type', '')
+        except (requests.ConnectionError, requests.Timeout):
+            self._discard(tmp_path)
+            return None, RETRY
+        except requests.RequestException:
+            self._discard(tmp_path)
+            return None, FATAL
+
+        ext = self._extension(url, content_type)
+        name = digest.hexdigest()
+        rel_path = os.path.join(name[:2], name + ext)
+        path = os.path.join(self.store_dir, rel_path)
+
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                self.deduped += 1
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                self.downloaded += 1
+            self._index[url] = rel_path
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(f'{url}\t{rel_path}\n')
+        return path, OK
+
+    @staticmethod
+    def _discard(tmp_path: str):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    @staticmethod
+    def _extension(url: str, content_type: str) -> str:
+        # 优先使用缩放参数中的格式, 其次是url的扩展名, 最后是Content-Type
+        match = re.search(r'\.(\w+)$', url.split('?', 1)[0])
+        if match:
+            return '.' + match.group(1).lower()
+        ext = mimetypes.guess_extension(content_type.split(';', 1)[0].strip())
+        return ext or ''
+
+    def fetch_many(self, urls: Iterable[str], width: int = None, height: int = None,
+                   fmt: str = None) -> dict:
+        '''
+        并发下载多张图片
+
+        :param urls: 图片url
+        :param width: 缩放宽度
+        :param height: 缩放高度
+        :param fmt: 图片格式
+        :return: {原url: 文件路径}, 失败的为None
+        '''
+        unique = list(dict.fromkeys(u for u in urls if u))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            paths = list(executor.map(lambda u: self.fetch(u, width, height, fmt), unique))
+        print(f"图片下载完成: 新下载 {self.downloaded}, 已存在 {self.skipped}, "
+              f"内容重复 {self.deduped}, 失败 {self.failed}")
+        return dict(zip(unique, paths))
+
+    def fetch_records(self, records: Iterable, width: int = None, height: int = None,
+                      fmt: str = None) -> dict:
+        '''
+        下载记录(VideoRecord/HistoryRecord/UserRecord/BangumiRecord)中的封面和头像
+
+        :return: {原url: 文件路径}
+        '''
+        urls = []
+        for record in records:
+            for field in self.URL_FIELDS:
+                url = getattr(record, field, None)
+                if url:
+                    urls.append(url)
+        return self.fetch_many(urls, width, height, fmt)
@@ -0,0 +1,242 @@
+'''
+爬取过程的性能分析
+
+包含三部分:
+    采样: 后台线程定时读取所有线程的调用栈(sys._current_frames), 输出火焰图使用的折叠格式
+          (每行 "函数;函数;... 次数", 可以用 flamegraph.pl 或 speedscope 打开)
+    阶段耗时: 爬虫在各阶段调用 span() 记录墙钟时间:
+          fetch(网络请求) parse(解析响应) sign(WBI签名) enrich(获取详情) write(写入文件) throttle(限速/延迟)
+    内存: 使用 tracemalloc 统计峰值和分配最多的代码位置(需要单独开启, 会使阶段耗时明显变长,
+          不要和阶段耗时在同一次运行中比较)
+
+没有开启时 span() 几乎没有开销
+
+用法:
+    reptile --profile history --days 1
+    reptile --profile --profile-memory history --days 1
+
+    with Profiler('data/profile/run'):
+        history.save_history()
+'''
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+# 当前开启的分析器
+_active = None
+_null = nullcontext()
+
+
+class _Span:
+    '''
+    一次阶段计时
+    '''
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.record_span(self.name, time.perf_counter() - self.start)
+
+
+def span(name: str):
+    '''
+    记录一个阶段的耗时(同一阶段嵌套或在多个线程中同时执行时分别累计)
+
+    :param name: 阶段名称
+    :return: 上下文管理器
+    '''
+    profiler = _active
+    if profiler is None:
+        return _null
+    return _Span(profiler, name)
+
+
+class Profiler:
+    '''
+    采样分析器 + 阶段计时 + 内存统计
+    '''
+
+    def __init__(self, output: str = None, interval: float = 0.005, trace_memory: bool = False,
+                 memory_frames: int = 1):
+        '''
+        :param output: 输出文件前缀, 生成 {output}.folded 和 {output}.txt, 默认为 data/profile/<时间>
+        :param interval: 采样间隔(秒)
+        :param trace_memory: 是否统计内存分配(会使程序变慢很多, 默认关闭)
+        :param memory_frames: 内存分配记录的调用栈深度
+        '''
+        if output is None:
+            # utils 也会导入本模块, 这里不在导入时加载config
+            from config import DATA_DIR
+            output = os.path.join(DATA_DIR, 'profile', time.strftime('%Y%m%d_%H%M%S'))
+        self.output = output
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.memory_frames = memory_frames
+
+        self.stacks = Counter()
+        self.samples = 0
+        # 阶段 -> [次数, 总耗时]
+        self.spans = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = 0.0
+        self.wall = 0.0
+        self._snapshot = None
+        self._peak = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        self.save()
+
+    def record_span(self, name: str, seconds: float):
+        with self._lock:
+            entry = self.spans.get(name)
+            if entry is None:
+                self.spans[name] = [1, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+
+    def start(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError('已经有分析器在运行')
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.start(self.memory_frames)
+        self._started = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+        self._thread.start()
+        _active = self
+
+    def stop(self):
+        global _active
+        if _active is not self:
+            return
+        _active = None
+        self._stop.set()
+        self._thread.join()
+        self.wall = time.perf_counter() - self._started
+        if self.trace_memory:
+            import tracemalloc
+            self._snapshot = tracemalloc.take_snapshot()
+            self._peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            threads = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    name = names.get(code)
+                    if name is None:
+                        name = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+                        names[code] = name.replace(';', ',')
+                        name = names[code]
+                    stack.append(name)
+                    frame = frame.f_back
+                stack.append(threads.get(ident, str(ident)).replace(';', ','))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top_functions(self, limit: int = 15) -> list:
+        '''
+        采样次数最多的函数
+
+        :return: [(函数, 自身次数, 包含子函数的次数), ...], 按自身次数排序
+        '''
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [(name, count, total[name]) for name, count in own.most_common(limit)]
+
+    def top_allocations(self, limit: int = 10) -> list:
+        '''
+        分配内存最多的代码位置
+
+        :return: [(位置, 字节数, 次数), ...]
+        '''
+        if self._snapshot is None:
+            return []
+        import tracemalloc
+        stats = self._snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        )).statistics('lineno')
+        return [(f'{os.path.basename(s.traceback[0].filename)}:{s.traceback[0].lineno}', s.size, s.count)
+                for s in stats[:limit]]
+
+    def summary(self) -> str:
+        '''
+        生成汇总表
+        '''
+        wall = self.wall or (time.perf_counter() - self._started)
+        lines = [f"总耗时 {wall:.2f} 秒, 采样 {self.samples} 次(间隔 {self.interval * 1000:.0f}ms)", '',
+                 '阶段耗时(各线程累计, 嵌套阶段重复计算):',
+                 f"  {'阶段':<10}{'次数':>8}{'总耗时(秒)':>12}{'平均(ms)':>10}{'占比':>8}"]
+        with self._lock:
+            spans = sorted(self.spans.items(), key=lambda kv: -kv[1][1])
+        for name, (count, seconds) in spans:
+            lines.append(f"  {name:<10}{count:>8}{seconds:>12.3f}{seconds / count * 1000:>10.2f}"
+                         f"{seconds / wall if wall else 0:>8.1%}")
+
+        lines += ['', '采样最多的函数(自身 / 包含子函数):']
+        total = sum(self.stacks.values()) or 1
+        for name, own, inclusive in self.top_functions():
+            lines.append(f"  {own / total:6.1%} {inclusive / total:6.1%}  {name}")
+
+        if self.trace_memory and self._snapshot is not None:
+            lines += ['', f"内存峰值: {self._peak / 1024 / 1024:.1f}MB, 分配最多的位置:"]
+            for where, size, count in self.top_allocations():
+                lines.append(f"  {size / 1024:10.1f}KB {count:>8} 次  {where}")
+        return '\n'.join(lines)
+
+    def save(self) -> tuple:
+        '''
+        保存折叠调用栈和汇总表, 并输出汇总表
+
+        :return: (折叠调用栈文件, 汇总表文件)
+        '''
+        dir_path = os.path.dirname(self.output)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        folded_file = self.output + '.folded'
+        summary_file = self.output + '.txt'
+        with open(folded_file, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        summary = self.summary()
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            f.write(summary + '\n')
+        print(summary, file=sys.stderr)
+        print(f"\n火焰图数据已保存到: {folded_file}", file=sys.stderr)
+        return folded_file, summary_file
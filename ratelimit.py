@@ -0,0 +1,71 @@
+'''
+令牌桶限速器
+'''
+
+import threading
+import time
+
+
+class TokenBucket:
+    '''
+    线程安全的令牌桶
+
+    每秒补充 rate 个令牌, 最多积攒 burst 个, 每次请求消耗一个
+    '''
+
+    def __init__(self, rate: float, burst: int = 1):
+        '''
+        :param rate: 每秒允许的请求数
+        :param burst: 允许的突发请求数
+        '''
+        if rate <= 0:
+            raise ValueError('rate 必须大于0')
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        # 累计等待时间(秒), 用于判断限速是否成为瓶颈
+        self.waited = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self) -> bool:
+        '''
+        尝试获取一个令牌, 不等待
+
+        :return: 是否获取成功
+        '''
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def wait_time(self) -> float:
+        '''
+        距离下一个令牌可用还需要等待的秒数, 有令牌时返回0
+        '''
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def acquire(self):
+        '''
+        获取一个令牌, 没有令牌时阻塞等待
+        '''
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
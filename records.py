@@ -0,0 +1,583 @@
+'''
+爬取结果的记录类型
+
+使用 __slots__ 数据类代替逐条构建的嵌套字典, 降低大批量爬取(如百万级评论)时的内存占用
+每个类型都提供 to_dict() (兼容原来的嵌套字典结构, 用于JSON导出) 和 to_row() (用于CSV导出)
+'''
+
+from dataclasses import dataclass
+from typing import Optional
+
+from utils import format_duration as _format_duration, timestamp_to_datetime
+
+
+# 观看进度为-1(已看完)时CSV中的值
+WATCHED_TO_END = '已看完'
+
+
+@dataclass(slots=True)
+class VideoStat:
+    '''
+    视频统计数据
+    '''
+    view: int = 0  # 播放
+    danmaku: int = 0  # 弹幕
+    reply: int = 0  # 评论
+    favorite: int = 0  # 收藏
+    coin: int = 0  # 投币
+    share: int = 0  # 分享
+    like: int = 0  # 点赞
+
+    FIELDS = ('view', 'danmaku', 'reply', 'favorite', 'coin', 'share', 'like')
+
+    @classmethod
+    def from_api(cls, stat: Optional[dict]) -> 'VideoStat':
+        '''
+        从API返回的stat字典构建
+
+        :param stat: API中的stat字段
+        :return: VideoStat
+        '''
+        if not stat:
+            return cls()
+        return cls(
+            stat.get('view', 0),
+            stat.get('danmaku', 0),
+            stat.get('reply', 0),
+            stat.get('favorite', 0),
+            stat.get('coin', 0),
+            stat.get('share', 0),
+            stat.get('like', 0),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            'view': self.view,
+            'danmaku': self.danmaku,
+            'reply': self.reply,
+            'favorite': self.favorite,
+            'coin': self.coin,
+            'share': self.share,
+            'like': self.like,
+        }
+
+    def to_tuple(self) -> tuple:
+        return (self.view, self.danmaku, self.reply, self.favorite,
+                self.coin, self.share, self.like)
+
+
+@dataclass(slots=True)
+class CommentRecord:
+    '''
+    单条评论
+    '''
+    rpid: int
+    content: str = ''
+    mid: Optional[int] = None  # 评论者MID
+    uname: Optional[str] = None  # 评论者昵称
+    like: int = 0
+    rcount: int = 0  # 回复数
+    ctime: Optional[int] = None
+    oid: Optional[int] = None  # 所属视频的AV号
+
+    HEADS = ['评论ID', 'AV号', '用户MID', '用户名', '内容', '点赞', '回复数', '发布时间']
+
+    @classmethod
+    def from_api(cls, reply: dict, oid: int = None) -> 'CommentRecord':
+        '''
+        从评论API返回的reply构建
+
+        :param reply: 单条评论数据
+        :param oid: 所属视频的AV号
+        :return: CommentRecord
+        '''
+        member = reply.get('member') or {}
+        return cls(
+            rpid=reply.get('rpid'),
+            content=(reply.get('content') or {}).get('message', ''),
+            mid=member.get('mid'),
+            uname=member.get('uname'),
+            like=reply.get('like', 0),
+            rcount=reply.get('rcount', 0),
+            ctime=reply.get('ctime'),
+            oid=oid,
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CommentRecord':
+        '''
+        从 to_dict() 的结果还原
+        '''
+        member = data.get('member') or {}
+        return cls(
+            rpid=data.get('rpid'),
+            content=data.get('content', ''),
+            mid=member.get('mid'),
+            uname=member.get('uname'),
+            like=data.get('like', 0),
+            rcount=data.get('rcount', 0),
+            ctime=data.get('ctime'),
+            oid=data.get('oid'),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            'rpid': self.rpid,
+            'content': self.content,
+            'member': {
+                'mid': self.mid,
+                'uname': self.uname,
+            },
+            'like': self.like,
+            'rcount': self.rcount,
+            'ctime': self.ctime,
+            'oid': self.oid,
+        }
+
+    def to_row(self) -> list:
+        return [
+            self.rpid,
+            self.oid,
+            self.mid,
+            self.uname,
+            self.content,
+            self.like,
+            self.rcount,
+            timestamp_to_datetime(self.ctime) if self.ctime else '',
+        ]
+
+
+@dataclass(slots=True)
+class VideoRecord:
+    '''
+    视频详细信息
+    '''
+    bvid: Optional[str]
+    aid: Optional[int] = None
+    title: Optional[str] = None
+    desc: str = ''
+    duration: int = 0  # 秒
+    pubdate: Optional[int] = None
+    ctime: Optional[int] = None
+    owner_mid: Optional[int] = None
+    owner_name: Optional[str] = None
+    owner_face: Optional[str] = None
+    stat: Optional[VideoStat] = None
+    pic: Optional[str] = None  # 封面
+    tname: Optional[str] = None  # 分区名
+    tags: Optional[list] = None  # 标签名列表
+    top_comments: Optional[list] = None  # CommentRecord列表
+    cid: Optional[int] = None  # 第一个分P的CID
+    pages: Optional[list] = None  # 分P列表 [{'cid', 'page', 'part', 'duration'}, ...]
+
+    HEADS = ['标题', 'BV号', 'AV号', 'UP主', '时长', '发布时间',
+             '播放', '点赞', '投币', '收藏', '分区', '标签', '简介']
+
+    @classmethod
+    def from_api(cls, data: dict) -> 'VideoRecord':
+        '''
+        从视频详情API返回的data构建
+
+        :param data: VIDEO_INFO 返回的 data
+        :return: VideoRecord
+        '''
+        owner = data.get('owner') or {}
+        return cls(
+            bvid=data.get('bvid'),
+            aid=data.get('aid'),
+            title=data.get('title'),
+            desc=data.get('desc', ''),
+            duration=data.get('duration', 0),
+            pubdate=data.get('pubdate'),
+            ctime=data.get('ctime'),
+            owner_mid=owner.get('mid'),
+            owner_name=owner.get('name'),
+            owner_face=owner.get('face'),
+            stat=VideoStat.from_api(data.get('stat')),
+            pic=data.get('pic'),
+            tname=data.get('tname'),
+            cid=data.get('cid'),
+            pages=[
+                {'cid': p.get('cid'), 'page': p.get('page'), 'part': p.get('part'),
+                 'duration': p.get('duration', 0)}
+                for p in data['pages']
+            ] if data.get('pages') else None,
+        )
+
+    @property
+    def duration_str(self) -> str:
+        return _format_duration(self.duration)
+
+    def to_dict(self) -> dict:
+        result = {
+            'bvid': self.bvid,
+            'aid': self.aid,
+            'title': self.title,
+            'desc': self.desc,
+            'duration': self.duration,
+            'duration_str': self.duration_str,
+            'pubdate': self.pubdate,
+            'ctime': self.ctime,
+            'owner': {
+                'mid': self.owner_mid,
+                'name': self.owner_name,
+                'face': self.owner_face,
+            },
+            'stat': self.stat.to_dict() if self.stat else {},
+            'pic': self.pic,
+            'tname': self.tname,
+            'cid': self.cid,
+        }
+        if self.pages is not None:
+            result['pages'] = [dict(p) for p in self.pages]
+        if self.tags is not None:
+            result['tags'] = list(self.tags)
+        if self.top_comments is not None:
+            result['top_comments'] = [c.to_dict() for c in self.top_comments]
+        return result
+
+    def to_row(self) -> list:
+        stat = self.stat or VideoStat()
+        return [
+            self.title,
+            self.bvid,
+            self.aid,
+            self.owner_name,
+            self.duration_str,
+            timestamp_to_datetime(self.pubdate) if self.pubdate else '',
+            stat.view,
+            stat.like,
+            stat.coin,
+            stat.favorite,
+            self.tname,
+            ', '.join(self.tags or []),
+            (self.desc or '')[:100],  # 限制简介长度
+        ]
+
+
+@dataclass(slots=True)
+class DanmakuRecord:
+    '''
+    单条弹幕
+    '''
+    dmid: int
+    cid: Optional[int] = None  # 所属分P的CID
+    progress: int = 0  # 出现时间(毫秒)
+    mode: int = 1  # 1-3=滚动 4=底部 5=顶部 6=逆向 7=高级 8=代码 9=BAS
+    fontsize: int = 25
+    color: int = 0xffffff
+    mid_hash: str = ''  # 发送者MID的哈希
+    content: str = ''
+    ctime: int = 0  # 发送时间
+    pool: int = 0  # 0=普通 1=字幕 2=特殊
+
+    HEADS = ['弹幕ID', 'CID', '出现时间', '模式', '字号', '颜色', '用户哈希', '内容', '发送时间']
+
+    @property
+    def progress_str(self) -> str:
+        seconds, ms = divmod(self.progress or 0, 1000)
+        return f'{_format_duration(seconds)}.{ms:03d}'
+
+    def to_dict(self) -> dict:
+        return {
+            'dmid': self.dmid,
+            'cid': self.cid,
+            'progress': self.progress,
+            'mode': self.mode,
+            'fontsize': self.fontsize,
+            'color': self.color,
+            'mid_hash': self.mid_hash,
+            'content': self.content,
+            'ctime': self.ctime,
+            'pool': self.pool,
+        }
+
+    def to_row(self) -> list:
+        return [
+            self.dmid,
+            self.cid,
+            self.progress_str,
+            self.mode,
+            self.fontsize,
+            f'#{self.color:06x}',
+            self.mid_hash,
+            self.content,
+            timestamp_to_datetime(self.ctime) if self.ctime else '',
+        ]
+
+
+@dataclass(slots=True)
+class UserRecord:
+    '''
+    用户空间信息
+    '''
+    mid: Optional[int]
+    name: Optional[str] = None
+    sex: Optional[str] = None
+    face: Optional[str] = None  # 头像
+    sign: Optional[str] = None  # 签名
+    level: Optional[int] = None  # 等级
+    silence: Optional[int] = None  # 是否被封禁
+    vip_type: Optional[int] = None  # 0=无 1=月度 2=年度
+    vip_status: Optional[int] = None  # 0=无 1=有
+    vip_label: str = ''
+    official_role: Optional[int] = None
+    official_title: Optional[str] = None
+    birthday: Optional[str] = None
+    school: str = ''
+    profession: str = ''
+    stat: Optional[dict] = None  # 关系统计
+    up_stat: Optional[dict] = None  # UP主统计
+
+    HEADS = ['MID', '昵称', '性别', '等级', '会员', '认证', '签名']
+
+    @classmethod
+    def from_api(cls, data: dict) -> 'UserRecord':
+        '''
+        从用户空间API返回的data构建
+
+        :param data: USER_INFO 返回的 data
+        :return: UserRecord
+        '''
+        vip = data.get('vip') or {}
+        official = data.get('official') or {}
+        return cls(
+            mid=data.get('mid'),
+            name=data.get('name'),
+            sex=data.get('sex'),
+            face=data.get('face'),
+            sign=data.get('sign'),
+            level=data.get('level'),
+            silence=data.get('silence'),
+            vip_type=vip.get('type'),
+            vip_status=vip.get('status'),
+            vip_label=(vip.get('label') or {}).get('text', ''),
+            official_role=official.get('role'),
+            official_title=official.get('title'),
+            birthday=data.get('birthday'),
+            school=data.get('school', {}).get('name', '') if data.get('school') else '',
+            profession=data.get('profession', {}).get('name', '') if data.get('profession') else '',
+        )
+
+    def to_dict(self) -> dict:
+        result = {
+            'mid': self.mid,
+            'name': self.name,
+            'sex': self.sex,
+            'face': self.face,
+            'sign': self.sign,
+            'level': self.level,
+            'silence': self.silence,
+            'vip': {
+                'type': self.vip_type,
+                'status': self.vip_status,
+                'label': self.vip_label,
+            },
+            'official': {
+                'role': self.official_role,
+                'title': self.official_title,
+            },
+            'birthday': self.birthday,
+            'school': self.school,
+            'profession': self.profession,
+        }
+        if self.stat is not None:
+            result['stat'] = self.stat
+        if self.up_stat is not None:
+            result['up_stat'] = self.up_stat
+        return result
+
+    def to_row(self) -> list:
+        return [
+            self.mid,
+            self.name,
+            self.sex,
+            self.level,
+            self.vip_label if self.vip_status else '',
+            self.official_title or '',
+            self.sign or '',
+        ]
+
+
+@dataclass(slots=True)
+class HistoryRecord:
+    '''
+    单条观看历史
+    '''
+    bvid: Optional[str]
+    title: Optional[str] = None
+    author_name: Optional[str] = None
+    author_mid: Optional[int] = None
+    view_at: int = 0
+    progress: int = 0  # 观看进度(秒)
+    duration: int = 0  # 视频时长
+    cover: Optional[str] = None
+    stat: Optional[VideoStat] = None
+    tags: Optional[list] = None
+    desc: Optional[str] = None
+    top_comments: Optional[list] = None
+
+    HEADS = ['标题', 'BV号', 'UP主', '观看时间', '观看进度', '时长']
+    DETAIL_HEADS = HEADS + ['播放', '点赞', '投币', '收藏', '标签', '简介']
+
+    @classmethod
+    def from_api(cls, item: dict) -> 'HistoryRecord':
+        '''
+        从历史记录API返回的单条item构建
+
+        :param item: HISTORY 返回的 list 中的一项
+        :return: HistoryRecord
+        '''
+        history = item.get('history') or {}
+        return cls(
+            bvid=history.get('bvid'),
+            title=item.get('title'),
+            author_name=item.get('author_name'),
+            author_mid=item.get('author_mid'),
+            view_at=item.get('view_at', 0),
+            progress=item.get('progress', 0),
+            duration=item.get('duration', 0),
+            cover=item.get('cover'),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'HistoryRecord':
+        '''
+        从 to_dict() 的结果还原
+        '''
+        stat = data.get('stat')
+        comments = data.get('top_comments')
+        return cls(
+            bvid=data.get('bvid'),
+            title=data.get('title'),
+            author_name=data.get('author_name'),
+            author_mid=data.get('author_mid'),
+            view_at=data.get('view_at', 0),
+            progress=data.get('progress', 0),
+            duration=data.get('duration', 0),
+            cover=data.get('cover'),
+            stat=VideoStat.from_api(stat) if stat is not None else None,
+            tags=data.get('tags'),
+            desc=data.get('desc'),
+            top_comments=[CommentRecord.from_dict(c) for c in comments] if comments is not None else None,
+        )
+
+    @property
+    def view_at_str(self) -> str:
+        return timestamp_to_datetime(self.view_at or 0)
+
+    def apply_detail(self, detail: VideoRecord, include_comments: bool = False):
+        '''
+        把视频详情合并到历史记录中
+
+        :param detail: 视频详情
+        :param include_comments: 是否包含评论
+        '''
+        self.stat = detail.stat
+        self.tags = detail.tags or []
+        self.desc = detail.desc or ''
+        if include_comments:
+            self.top_comments = detail.top_comments or []
+
+    def to_dict(self) -> dict:
+        result = {
+            'bvid': self.bvid,
+            'title': self.title,
+            'author_name': self.author_name,
+            'author_mid': self.author_mid,
+            'view_at': self.view_at,
+            'view_at_str': self.view_at_str,
+            'progress': self.progress,
+            'duration': self.duration,
+            'cover': self.cover,
+        }
+        if self.stat is not None:
+            result['stat'] = self.stat.to_dict()
+        if self.tags is not None:
+            result['tags'] = list(self.tags)
+        if self.desc is not None:
+            result['desc'] = self.desc
+        if self.top_comments is not None:
+            result['top_comments'] = [c.to_dict() for c in self.top_comments]
+        return result
+
+    def to_row(self, include_detail: bool = False) -> list:
+        row = [
+            self.title,
+            self.bvid,
+            self.author_name,
+            self.view_at_str,
+            WATCHED_TO_END if self.progress == -1 else _format_duration(self.progress or 0),
+            _format_duration(self.duration or 0),
+        ]
+        if include_detail:
+            stat = self.stat
+            row += [
+                stat.view if stat else '',
+                stat.like if stat else '',
+                stat.coin if stat else '',
+                stat.favorite if stat else '',
+                ', '.join(self.tags or []),
+                (self.desc or '')[:100],  # 限制简介长度
+            ]
+        return row
+
+
+@dataclass(slots=True)
+class BangumiRecord:
+    '''
+    追番/追剧列表中的一项
+    '''
+    season_id: Optional[int]
+    media_id: Optional[int] = None
+    title: Optional[str] = None
+    season_type_name: Optional[str] = None  # 番剧/国创/电影/电视剧/纪录片
+    follow_type: int = 1  # 1=追番 2=追剧
+    follow_status: int = 0  # 1=想看 2=在看 3=看过
+    progress: str = ''  # 观看进度, 如"看到第3话"
+    total_count: int = 0  # 总集数, -1 表示未完结未知
+    is_finish: int = 0
+    new_ep: str = ''  # 最新一集
+    score: Optional[float] = None  # 评分
+    cover: Optional[str] = None
+
+    HEADS = ['标题', '季度ID', '类型', '状态', '观看进度', '总集数', '完结', '最新', '评分']
+    STATUS_NAMES = {1: '想看', 2: '在看', 3: '看过'}
+
+    @classmethod
+    def from_api(cls, item: dict, follow_type: int = 1, follow_status: int = 0) -> 'BangumiRecord':
+        '''
+        从追番列表API返回的单项构建
+
+        :param item: BANGUMI_LIST 返回的 list 中的一项
+        :param follow_type: 1=追番 2=追剧
+        :param follow_status: 1=想看 2=在看 3=看过
+        :return: BangumiRecord
+        '''
+        return cls(
+            season_id=item.get('season_id'),
+            media_id=item.get('media_id'),
+            title=item.get('title'),
+            season_type_name=item.get('season_type_name'),
+            follow_type=follow_type,
+            follow_status=follow_status,
+            progress=item.get('progress') or '',
+            total_count=item.get('total_count', 0),
+            is_finish=item.get('is_finish', 0),
+            new_ep=(item.get('new_ep') or {}).get('index_show', ''),
+            score=(item.get('rating') or {}).get('score'),
+            cover=item.get('cover'),
+        )
+
+    def to_row(self) -> list:
+        return [
+            self.title,
+            self.season_id,
+            self.season_type_name,
+            self.STATUS_NAMES.get(self.follow_status, ''),
+            self.progress,
+            self.total_count,
+            '是' if self.is_finish else '否',
+            self.new_ep,
+            self.score if self.score is not None else '',
+        ]
@@ -0,0 +1,149 @@
+'''
+请求重试策略
+
+指数退避 + 全抖动(full jitter), 按HTTP状态码和B站业务code区分可重试/不可重试的错误,
+遵守 Retry-After 响应头, 并限制每个时间窗口内的总重试次数(重试预算, 窗口结束后恢复)
+'''
+
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# 判定结果
+OK = 'ok'
+RETRY = 'retry'
+FATAL = 'fatal'
+
+
+@dataclass
+class RetryPolicy:
+    '''
+    重试策略
+    '''
+    # 单个请求最多尝试次数(包括第一次)
+    max_attempts: int = 4
+    # 退避基数和上限(秒), 第n次重试等待 random(0, min(max_delay, base_delay * 2^n))
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    # Retry-After 最多等待多久(秒)
+    max_retry_after: float = 120.0
+    # 每个时间窗口内允许的总重试次数, None表示不限制
+    budget: Optional[int] = 200
+    # 重试预算的时间窗口(秒), 窗口结束后预算恢复; None表示整个进程共用一份预算
+    budget_window: Optional[float] = 600.0
+    # 可重试的HTTP状态码
+    retry_statuses: frozenset = frozenset({412, 429, 500, 502, 503, 504})
+    # 可重试的业务code
+    retry_codes: frozenset = frozenset({
+        -352,  # 风控校验失败
+        -412,  # 请求被拦截
+        -500,  # 服务器错误
+        -503,  # 过载保护
+        -509,  # 请求过于频繁
+        -799,  # 请求过于频繁
+    })
+    # 不可重试的业务code(其余未列出的非0 code也按不可重试处理)
+    fatal_codes: frozenset = frozenset({
+        -101,  # 未登录
+        -400,  # 请求错误
+        -403,  # 访问权限不足
+        -404,  # 不存在
+        62002,  # 稿件不可见
+        62004,  # 稿件审核中
+        12002,  # 评论区已关闭
+        12061,  # UP主已关闭评论区
+    })
+    _spent: int = field(default=0, init=False, repr=False)
+    _window_start: float = field(default_factory=time.monotonic, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def classify_status(self, status: int) -> str:
+        '''
+        按HTTP状态码判定
+        '''
+        if status < 400:
+            return OK
+        return RETRY if status in self.retry_statuses else FATAL
+
+    def classify_code(self, code) -> str:
+        '''
+        按业务code判定
+        '''
+        if code == 0:
+            return OK
+        return RETRY if code in self.retry_codes else FATAL
+
+    def should_retry(self, attempt: int) -> bool:
+        '''
+        第attempt次尝试失败后是否还能重试(会消耗重试预算)
+
+        :param attempt: 已尝试次数(从1开始)
+        '''
+        if attempt >= self.max_attempts:
+            return False
+        with self._lock:
+            self._refill()
+            if self.budget is not None and self._spent >= self.budget:
+                return False
+            self._spent += 1
+        return True
+
+    def _refill(self):
+        # 进入新的时间窗口时恢复预算(调用时已持有锁)
+        if self.budget_window is None:
+            return
+        now = time.monotonic()
+        if now - self._window_start >= self.budget_window:
+            self._window_start = now
+            self._spent = 0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        '''
+        第attempt次失败后的等待时间
+
+        :param attempt: 已尝试次数(从1开始)
+        :param retry_after: 服务端要求的等待时间
+        :return: 秒
+        '''
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            return max(backoff, min(retry_after, self.max_retry_after))
+        return backoff
+
+    @property
+    def spent(self) -> int:
+        '''
+        当前时间窗口内已消耗的重试次数
+        '''
+        with self._lock:
+            self._refill()
+            return self._spent
+
+    def reset_budget(self):
+        '''
+        立即恢复重试预算并开始新的时间窗口
+        '''
+        with self._lock:
+            self._window_start = time.monotonic()
+            self._spent = 0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    '''
+    解析 Retry-After 响应头(秒数或HTTP日期)
+
+    :param value: 响应头的值
+    :return: 需要等待的秒数, 无法解析返回None
+    '''
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
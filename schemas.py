@@ -0,0 +1,192 @@
+'''
+各接口的部分解码模式
+
+只列出爬虫实际用到的字段, 新增字段使用时需要同步在这里添加
+'''
+
+from decoder import envelope
+
+
+_STAT = {
+    'view': None,
+    'danmaku': None,
+    'reply': None,
+    'favorite': None,
+    'coin': None,
+    'share': None,
+    'like': None,
+}
+
+# 导航信息(只用于获取WBI密钥)
+NAV_WBI = envelope('NavWbi', {
+    'wbi_img': {
+        'img_url': None,
+        'sub_url': None,
+    },
+})
+
+# 视频详情
+VIDEO_INFO = envelope('VideoInfo', {
+    'bvid': None,
+    'aid': None,
+    'title': None,
+    'desc': None,
+    'duration': None,
+    'pubdate': None,
+    'ctime': None,
+    'owner': {
+        'mid': None,
+        'name': None,
+        'face': None,
+    },
+    'stat': _STAT,
+    'pic': None,
+    'tname': None,
+    'cid': None,
+    'pages': [{
+        'cid': None,
+        'page': None,
+        'part': None,
+        'duration': None,
+    }],
+})
+
+# 视频统计数据(定时采样只需要stat)
+VIDEO_STAT = envelope('VideoStat', {
+    'bvid': None,
+    'stat': _STAT,
+})
+
+# 视频标签
+VIDEO_TAGS = envelope('VideoTags', [{
+    'tag_id': None,
+    'tag_name': None,
+}])
+
+# 评论列表
+REPLY_MAIN = envelope('ReplyMain', {
+    'replies': [{
+        'rpid': None,
+        'content': {
+            'message': None,
+        },
+        'member': {
+            'mid': None,
+            'uname': None,
+        },
+        'like': None,
+        'rcount': None,
+        'ctime': None,
+    }],
+})
+
+# 观看历史
+HISTORY = envelope('History', {
+    'cursor': {
+        'max': None,
+        'view_at': None,
+        'business': None,
+        'ps': None,
+    },
+    'list': [{
+        'title': None,
+        'cover': None,
+        'author_name': None,
+        'author_mid': None,
+        'view_at': None,
+        'progress': None,
+        'duration': None,
+        'history': {
+            'oid': None,
+            'bvid': None,
+            'cid': None,
+            'business': None,
+        },
+    }],
+})
+
+# 用户空间信息
+USER_INFO = envelope('UserInfo', {
+    'mid': None,
+    'name': None,
+    'sex': None,
+    'face': None,
+    'sign': None,
+    'level': None,
+    'silence': None,
+    'vip': {
+        'type': None,
+        'status': None,
+        'label': {
+            'text': None,
+        },
+    },
+    'official': {
+        'role': None,
+        'title': None,
+    },
+    'birthday': None,
+    'school': {
+        'name': None,
+    },
+    'profession': {
+        'name': None,
+    },
+})
+
+# 追番/追剧列表
+BANGUMI_LIST = envelope('BangumiList', {
+    'list': [{
+        'season_id': None,
+        'media_id': None,
+        'title': None,
+        'season_type_name': None,
+        'progress': None,
+        'total_count': None,
+        'is_finish': None,
+        'new_ep': {
+            'index_show': None,
+        },
+        'rating': {
+            'score': None,
+        },
+        'cover': None,
+    }],
+    'pn': None,
+    'ps': None,
+    'total': None,
+})
+
+# 点赞/投币视频列表中的稿件
+_ARCHIVE = {
+    'aid': None,
+    'bvid': None,
+    'title': None,
+    'desc': None,
+    'duration': None,
+    'pubdate': None,
+    'ctime': None,
+    'owner': {
+        'mid': None,
+        'name': None,
+        'face': None,
+    },
+    'stat': _STAT,
+    'pic': None,
+    'tname': None,
+}
+
+# 最近点赞的视频
+LIKE_VIDEO = envelope('LikeVideo', {
+    'list': [_ARCHIVE],
+})
+
+# 最近投币的视频(data 直接是列表)
+COIN_VIDEO = envelope('CoinVideo', [_ARCHIVE])
+
+# 所有模式, 按名称索引(基准测试按名称匹配录制的响应)
+ALL = {
+    schema.name: schema
+    for schema in (NAV_WBI, VIDEO_INFO, VIDEO_STAT, VIDEO_TAGS, REPLY_MAIN, HISTORY, USER_INFO, BANGUMI_LIST,
+                   LIKE_VIDEO, COIN_VIDEO)
+}
@@ -0,0 +1,647 @@
+'''
+评论、视频标题/简介/标签的本地全文索引
+
+中文按相邻两个字切分(bigram), 英文和数字按单词切分; 查询时所有词都要出现, 按BM25排序,
+可以按视频、UP主MID、时间范围和文档类型筛选
+
+索引是追加写入的: 新文档先放在内存中, 达到一定数量或调用 flush 时写成一个段(segment),
+段数过多时合并最小的几个段(大小相近的段逐级合并, 每个文档被重写的次数与段数的对数成正比);
+同一个文档再次添加时旧的会被标记删除; 查询只读取已经写入磁盘的段
+
+每个段由四个文件组成:
+    {段名}.docs   文档信息(时间、MID、长度、类型、正文偏移量)和文档key
+    {段名}.text   正文
+    {段名}.terms  词典: 词 -> (文档数, 倒排表偏移量, 倒排表字节数)
+    {段名}.post   倒排表: 每个词依次是 文档序号(uint32) 词频(uint16) 每块的最大词频(uint16) 每块的最短文档长度(uint32),
+                  每 _BLOCK 个文档为一块, 查询时用块的得分上限跳过不可能进入前k名的块
+
+段的文档数和总长度保存在 manifest.json 中(计算BM25的平均文档长度)
+
+用法:
+    python search_index.py 关键词 [--bvid BV...] [--mid 123] [--kind comment]
+'''
+
+import argparse
+import array
+import bisect
+import heapq
+import itertools
+import json
+import math
+import os
+import re
+import sys
+import threading
+from collections import Counter
+
+from config import DATA_DIR
+from utils import read_varint, write_varint
+
+# 文档类型
+VIDEO = 'video'
+HISTORY = 'history'
+COMMENT = 'comment'
+KINDS = (VIDEO, HISTORY, COMMENT)
+
+# 中日韩文字连续片段, 或者英文/数字单词
+_TOKEN_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+|[0-9a-z]+')
+
+_MAGIC = b'BSI2'
+# 旧格式(倒排表为varint), 打开时转换, 合并后改写为新格式
+_MAGIC_V1 = b'BSI1'
+# 倒排表每块的文档数
+_BLOCK = 128
+
+
+def tokenize(text: str) -> list:
+    '''
+    切分文本
+
+    中文等连续片段按相邻两个字切分(单个字的片段保留单字), 英文和数字按单词切分, 统一小写
+
+    :param text: 文本
+    :return: 词列表(可能重复)
+    '''
+    tokens = []
+    for run in _TOKEN_RE.findall((text or '').lower()):
+        if run[0] < '\u0080' or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _block_bounds(docs: array.array, tfs: array.array, length: array.array) -> tuple:
+    '''
+    倒排表每块的最大词频和最短文档长度(用于计算块内文档得分的上限)
+
+    :return: (最大词频数组, 最短长度数组)
+    '''
+    block_tf = array.array('H')
+    block_len = array.array('I')
+    for start in range(0, len(docs), _BLOCK):
+        block_tf.append(max(tfs[start:start + _BLOCK]))
+        block_len.append(min(length[doc] for doc in docs[start:start + _BLOCK]))
+    return block_tf, block_len
+
+
+class _SegmentBuilder:
+    '''
+    内存中的段, 写入磁盘后成为 _Segment
+    '''
+
+    def __init__(self):
+        self.ts = array.array('q')
+        self.mid = array.array('q')
+        self.length = array.array('I')
+        self.kind = array.array('B')
+        self.keys = []
+        self.bvids = []
+        self.texts = []
+        self.postings = {}  # 词 -> [(文档序号, 词频), ...]
+        self.deleted = set()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, kind: str, key: str, text: str, bvid: str, mid: int, ts: int) -> int:
+        doc = len(self.keys)
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, []).append((doc, tf))
+        self.ts.append(ts or 0)
+        self.mid.append(mid or 0)
+        self.length.append(len(tokens))
+        self.kind.append(KINDS.index(kind))
+        self.keys.append(key)
+        self.bvids.append(bvid or '')
+        self.texts.append(text.encode('utf-8'))
+        return doc
+
+    def write(self, path: str):
+        '''
+        写入磁盘
+
+        :param path: 段文件路径(不含扩展名)
+        '''
+        offsets = array.array('Q', [0])
+        with open(path + '.text', 'wb') as f:
+            for text in self.texts:
+                f.write(text)
+                offsets.append(offsets[-1] + len(text))
+
+        with open(path + '.docs', 'wb') as f:
+            f.write(_MAGIC)
+            f.write(len(self.keys).to_bytes(4, 'little'))
+            for arr in (self.ts, self.mid, self.length, self.kind, offsets):
+                f.write(arr.tobytes())
+            f.write('\n'.join(f'{k}\t{b}' for k, b in zip(self.keys, self.bvids)).encode('utf-8'))
+
+        terms = bytearray()
+        length = self.length
+        with open(path + '.post', 'wb') as f:
+            offset = 0
+            for term in sorted(self.postings):
+                postings = self.postings[term]
+                docs = array.array('I', [doc for doc, _ in postings])
+                tfs = array.array('H', [min(tf, 0xffff) for _, tf in postings])
+                block_tf, block_len = _block_bounds(docs, tfs, length)
+                buf = docs.tobytes() + tfs.tobytes() + block_tf.tobytes() + block_len.tobytes()
+                f.write(buf)
+
+                raw = term.encode('utf-8')
+                write_varint(terms, len(raw))
+                terms += raw
+                write_varint(terms, len(postings))
+                write_varint(terms, offset)
+                write_varint(terms, len(buf))
+                offset += len(buf)
+
+        with open(path + '.terms', 'wb') as f:
+            f.write(terms)
+
+
+class _Segment:
+    '''
+    磁盘上的只读段
+    '''
+
+    def __init__(self, path: str, deleted: set = None, total_length: int = None):
+        '''
+        :param path: 段文件路径(不含扩展名)
+        :param deleted: 已删除的文档序号
+        :param total_length: 所有文档的总长度(清单中保存的统计), 没有时从文档长度计算
+        '''
+        self.path = path
+        self.deleted = deleted or set()
+
+        with open(path + '.docs', 'rb') as f:
+            data = f.read()
+        if data[:4] not in (_MAGIC, _MAGIC_V1):
+            raise ValueError(f'索引段格式错误: {path}')
+        self.version = 1 if data[:4] == _MAGIC_V1 else 2
+        n = int.from_bytes(data[4:8], 'little')
+        pos = 8
+        arrays = []
+        for typecode, count in (('q', n), ('q', n), ('I', n), ('B', n), ('Q', n + 1)):
+            arr = array.array(typecode)
+            size = arr.itemsize * count
+            arr.frombytes(data[pos:pos + size])
+            arrays.append(arr)
+            pos += size
+        self.ts, self.mid, self.length, self.kind, self.offsets = arrays
+        self.total_length = total_length if total_length is not None else sum(self.length)
+        self.keys = []
+        self.bvids = []
+        if n:
+            for line in data[pos:].decode('utf-8').split('\n'):
+                key, bvid = line.split('\t')
+                self.keys.append(key)
+                self.bvids.append(bvid)
+
+        self.terms = {}
+        with open(path + '.terms', 'rb') as f:
+            data = f.read()
+        pos = 0
+        while pos < len(data):
+            size, pos = read_varint(data, pos)
+            term = data[pos:pos + size].decode('utf-8')
+            pos += size
+            df, pos = read_varint(data, pos)
+            offset, pos = read_varint(data, pos)
+            nbytes, pos = read_varint(data, pos)
+            self.terms[term] = (df, offset, nbytes)
+
+        self._post = open(path + '.post', 'rb')
+        self._text = open(path + '.text', 'rb')
+        self._lock = threading.Lock()
+        # 按视频/UP主筛选用的文档序号表, 第一次筛选时建立
+        self._by_bvid = None
+        self._by_mid = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def close(self):
+        self._post.close()
+        self._text.close()
+
+    def postings(self, term: str) -> tuple:
+        '''
+        :return: (文档序号数组, 词频数组, 每块最大词频数组, 每块最短文档长度数组), 文档序号递增;
+                 不包含这个词时返回None
+        '''
+        entry = self.terms.get(term)
+        if entry is None:
+            return None
+        df, offset, nbytes = entry
+        with self._lock:
+            self._post.seek(offset)
+            data = self._post.read(nbytes)
+
+        if self.version == 1:
+            docs = array.array('I')
+            tfs = array.array('H')
+            pos = 0
+            doc = 0
+            for _ in range(df):
+                delta, pos = read_varint(data, pos)
+                tf, pos = read_varint(data, pos)
+                doc += delta
+                docs.append(doc)
+                tfs.append(min(tf, 0xffff))
+            return (docs, tfs) + _block_bounds(docs, tfs, self.length)
+
+        blocks = -(-df // _BLOCK)
+        result = []
+        pos = 0
+        for typecode, count in (('I', df), ('H', df), ('H', blocks), ('I', blocks)):
+            arr = array.array(typecode)
+            size = arr.itemsize * count
+            arr.frombytes(data[pos:pos + size])
+            result.append(arr)
+            pos += size
+        return tuple(result)
+
+    def docs_with(self, bvid: str = None, mid: int = None):
+        '''
+        属于某个视频/UP主的文档序号(递增)
+
+        :return: 文档序号列表, 不筛选时返回None
+        '''
+        with self._lock:
+            if bvid and self._by_bvid is None:
+                self._by_bvid = {}
+                for doc, value in enumerate(self.bvids):
+                    self._by_bvid.setdefault(value, []).append(doc)
+            if mid and self._by_mid is None:
+                self._by_mid = {}
+                for doc, value in enumerate(self.mid):
+                    self._by_mid.setdefault(value, []).append(doc)
+        docs = None
+        if bvid:
+            docs = self._by_bvid.get(bvid, [])
+        if mid:
+            by_mid = self._by_mid.get(mid, [])
+            docs = by_mid if docs is None else sorted(set(docs).intersection(by_mid))
+        return docs
+
+    def text(self, doc: int) -> str:
+        with self._lock:
+            self._text.seek(self.offsets[doc])
+            return self._text.read(self.offsets[doc + 1] - self.offsets[doc]).decode('utf-8')
+
+
+class SearchIndex:
+    '''
+    可追加的全文索引
+    '''
+
+    def __init__(self, path: str = None, flush_docs: int = 20000, max_segments: int = 8,
+                 merge_factor: int = 4):
+        '''
+        :param path: 索引目录, 默认为 data/search_index
+        :param flush_docs: 内存中积累多少文档后写入一个段
+        :param max_segments: 段数超过时合并最小的段
+        :param merge_factor: 每次合并多少个段
+        '''
+        self.path = path or os.path.join(DATA_DIR, 'search_index')
+        os.makedirs(self.path, exist_ok=True)
+        self.manifest_file = os.path.join(self.path, 'manifest.json')
+        self.flush_docs = flush_docs
+        self.max_segments = max_segments
+        self.merge_factor = max(2, merge_factor)
+        self._lock = threading.RLock()
+
+        manifest = {'segments': [], 'next': 0, 'deleted': {}}
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        self._next = manifest['next']
+        # 段名 -> [文档数, 总长度], 旧的清单中没有时打开段时计算
+        stats = manifest.get('stats', {})
+        self._segments = {
+            name: _Segment(os.path.join(self.path, name), set(manifest['deleted'].get(name, [])),
+                           total_length=stats[name][1] if name in stats else None)
+            for name in manifest['segments']
+        }
+        # (类型, key) -> (段名, 文档序号), 段名为None表示在内存中; 第一次添加文档时才建立
+        self._doc_map = None
+        self._buffer = _SegmentBuilder()
+
+    @property
+    def _docs(self) -> dict:
+        if self._doc_map is None:
+            docs = {}
+            for name, segment in self._segments.items():
+                for doc, key in enumerate(segment.keys):
+                    if doc not in segment.deleted:
+                        docs[(KINDS[segment.kind[doc]], key)] = (name, doc)
+            self._doc_map = docs
+        return self._doc_map
+
+    def close(self):
+        self.flush()
+        for segment in self._segments.values():
+            segment.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return sum(len(s) - len(s.deleted) for s in self._segments.values()) + \
+            len(self._buffer) - len(self._buffer.deleted)
+
+    def add(self, kind: str, key, text: str, bvid: str = '', mid: int = 0, ts: int = 0):
+        '''
+        添加一个文档, 已存在的同类型同key文档会被替换
+
+        :param kind: 文档类型 VIDEO/HISTORY/COMMENT
+        :param key: 文档key(视频为BV号, 评论为评论ID)
+        :param text: 正文
+        :param bvid: 所属视频
+        :param mid: UP主MID
+        :param ts: 时间戳(视频为发布时间, 观看历史为观看时间, 评论为发布时间)
+        '''
+        key = str(key)
+        with self._lock:
+            old = self._docs.get((kind, key))
+            if old is not None:
+                name, doc = old
+                (self._segments[name] if name else self._buffer).deleted.add(doc)
+            doc = self._buffer.add(kind, key, text or '', bvid, mid, ts)
+            self._docs[(kind, key)] = (None, doc)
+            if len(self._buffer) >= self.flush_docs:
+                self.flush()
+
+    def add_video(self, record):
+        '''
+        添加视频(标题、标签、简介), 同时添加其中的热门评论
+
+        :param record: VideoRecord
+        '''
+        text = '\n'.join([record.title or '', ' '.join(record.tags or []), record.desc or ''])
+        self.add(VIDEO, record.bvid, text, bvid=record.bvid, mid=record.owner_mid, ts=record.pubdate)
+        if record.top_comments:
+            self.add_comments(record.top_comments, bvid=record.bvid, owner_mid=record.owner_mid)
+
+    def add_history(self, record):
+        '''
+        添加观看历史(标题、标签、简介), 同时添加其中的热门评论
+
+        :param record: HistoryRecord
+        '''
+        text = '\n'.join([record.title or '', ' '.join(record.tags or []), record.desc or ''])
+        self.add(HISTORY, f'{record.view_at}:{record.bvid}', text, bvid=record.bvid,
+                 mid=record.author_mid, ts=record.view_at)
+        if record.top_comments:
+            self.add_comments(record.top_comments, bvid=record.bvid, owner_mid=record.author_mid)
+
+    def add_comments(self, comments: list, bvid: str = '', owner_mid: int = 0):
+        '''
+        添加评论
+
+        :param comments: CommentRecord列表
+        :param bvid: 所属视频
+        :param owner_mid: 所属视频的UP主MID
+        '''
+        for comment in comments:
+            self.add(COMMENT, comment.rpid, comment.content, bvid=bvid, mid=owner_mid, ts=comment.ctime)
+
+    def flush(self):
+        '''
+        把内存中的文档写成一个段
+        '''
+        with self._lock:
+            if not len(self._buffer):
+                return
+            name = f'seg{self._next:06d}'
+            self._next += 1
+            buffer = self._buffer
+            buffer.write(os.path.join(self.path, name))
+            self._segments[name] = _Segment(os.path.join(self.path, name), set(buffer.deleted))
+            for doc, key in enumerate(buffer.keys):
+                if doc not in buffer.deleted:
+                    self._docs[(KINDS[buffer.kind[doc]], key)] = (name, doc)
+            self._buffer = _SegmentBuilder()
+
+            while len(self._segments) > self.max_segments:
+                self._merge(self._smallest_segments())
+            self._save_manifest()
+
+    def compact(self):
+        '''
+        合并所有段并清除已删除的文档
+        '''
+        with self._lock:
+            self.flush()
+            if len(self._segments) > 1 or any(s.deleted for s in self._segments.values()):
+                self._merge()
+                self._save_manifest()
+
+    def _smallest_segments(self) -> list:
+        '''
+        文档数最少的 merge_factor 个段(新写入的段大小相同, 合并后进入下一级)
+        '''
+        def live(name):
+            segment = self._segments[name]
+            return len(segment) - len(segment.deleted)
+        return sorted(self._segments, key=live)[:self.merge_factor]
+
+    def _merge(self, names: list = None):
+        '''
+        把指定的段(默认为全部)合并成一个新段, 并清除其中已删除的文档
+
+        :param names: 要合并的段名
+        '''
+        names = list(self._segments) if names is None else names
+        builder = _SegmentBuilder()
+        for name in names:
+            segment = self._segments[name]
+            for doc in range(len(segment)):
+                if doc in segment.deleted:
+                    continue
+                builder.add(KINDS[segment.kind[doc]], segment.keys[doc], segment.text(doc),
+                            segment.bvids[doc], segment.mid[doc], segment.ts[doc])
+
+        name = f'seg{self._next:06d}'
+        self._next += 1
+        builder.write(os.path.join(self.path, name))
+        old = [(old_name, self._segments.pop(old_name)) for old_name in names]
+        self._segments[name] = _Segment(os.path.join(self.path, name))
+        if self._doc_map is not None:
+            for doc, key in enumerate(builder.keys):
+                self._doc_map[(KINDS[builder.kind[doc]], key)] = (name, doc)
+        # 先保存新的清单再删除旧段, 中断时最多留下没用的文件
+        self._save_manifest()
+        for old_name, segment in old:
+            segment.close()
+            for ext in ('.docs', '.text', '.terms', '.post'):
+                os.remove(os.path.join(self.path, old_name + ext))
+
+    def _save_manifest(self):
+        manifest = {
+            'segments': list(self._segments),
+            'next': self._next,
+            'deleted': {name: sorted(s.deleted) for name, s in self._segments.items() if s.deleted},
+            'stats': {name: [len(s), s.total_length] for name, s in self._segments.items()},
+        }
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_file, self.manifest_file)
+
+    def search(self, query: str, limit: int = 20, kind: str = None, bvid: str = None,
+               mid: int = None, start_ts: int = None, end_ts: int = None) -> list:
+        '''
+        查询包含所有关键词的文档, 按BM25得分排序
+
+        :param query: 查询文本
+        :param limit: 返回数量
+        :param kind: 只查询指定类型的文档
+        :param bvid: 只查询指定视频的文档
+        :param mid: 只查询指定UP主的文档
+        :param start_ts: 起始时间戳
+        :param end_ts: 结束时间戳(不包含)
+        :return: [{'score', 'kind', 'key', 'bvid', 'mid', 'ts', 'text'}, ...]
+        '''
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        # 只读取已经写入的段, 查询前需要看到的新文档由添加方调用 flush
+        with self._lock:
+            segments = list(self._segments.values())
+
+        total_docs = sum(len(s) - len(s.deleted) for s in segments)
+        if not total_docs:
+            return []
+        avgdl = sum(s.total_length for s in segments) / sum(len(s) for s in segments) or 1.0
+        df = {t: sum(s.terms[t][0] for s in segments if t in s.terms) for t in terms}
+        if not all(df.values()):
+            return []
+        idf = {t: math.log(1 + (total_docs - df[t] + 0.5) / (df[t] + 0.5)) for t in terms}
+        # 先处理文档数少的词, 尽早缩小候选集合
+        terms.sort(key=lambda t: df[t])
+        weights = [idf[t] for t in terms]
+        kind_code = KINDS.index(kind) if kind else None
+        k1, b = 1.2, 0.75
+        base = k1 * (1 - b)
+        per_len = k1 * b / avgdl
+
+        def impact(tf, length):
+            # BM25中词频的部分, 词频越大、文档越短越高
+            return tf * (k1 + 1) / (tf + base + per_len * length)
+
+        # 得分最高的 limit 个文档, 堆顶是其中得分最低的: (得分, 序号, 段, 文档序号)
+        top = []
+        counter = itertools.count()
+
+        def offer(score, segment, doc):
+            if len(top) < limit:
+                heapq.heappush(top, (score, next(counter), segment, doc))
+            elif score > top[0][0]:
+                heapq.heapreplace(top, (score, next(counter), segment, doc))
+
+        for segment in segments:
+            if any(t not in segment.terms for t in terms):
+                continue
+            lists = [segment.postings(t) for t in terms]
+            deleted = segment.deleted
+            kinds = segment.kind
+            times = segment.ts
+            lengths = segment.length
+
+            def accept(doc):
+                if doc in deleted:
+                    return False
+                if kind_code is not None and kinds[doc] != kind_code:
+                    return False
+                ts = times[doc]
+                return not ((start_ts and ts < start_ts) or (end_ts and ts >= end_ts))
+
+            allowed = segment.docs_with(bvid, mid)
+            if allowed is not None:
+                # 按视频/UP主筛选时候选文档很少, 直接在每个词的倒排表中二分查找
+                for doc in allowed:
+                    score = 0.0
+                    for weight, (docs, tfs, _, _) in zip(weights, lists):
+                        i = bisect.bisect_left(docs, doc)
+                        if i == len(docs) or docs[i] != doc:
+                            break
+                        score += weight * impact(tfs[i], lengths[doc])
+                    else:
+                        if accept(doc):
+                            offer(score, segment, doc)
+                continue
+
+            # 以文档数最少的词驱动, 按块遍历; 块内最高可能得分都进不了前 limit 名时整块跳过,
+            # 单个文档的第一个词得分加上其余词的上限进不了前 limit 名时不再查找其余的词
+            first_docs, first_tfs, block_tf, block_len = lists[0]
+            first_weight = weights[0] * (k1 + 1)
+            rest = [(weight * (k1 + 1), docs, tfs) for weight, (docs, tfs, _, _) in zip(weights[1:], lists[1:])]
+            rest_bound = sum(w * impact(max(bt), min(bl)) for w, (_, _, bt, bl) in zip(weights[1:], lists[1:]))
+            cursors = [0] * len(rest)
+            threshold = top[0][0] if len(top) >= limit else -1.0
+            for block in range(len(block_tf)):
+                if weights[0] * impact(block_tf[block], block_len[block]) + rest_bound <= threshold:
+                    continue
+                start = block * _BLOCK
+                for i in range(start, min(start + _BLOCK, len(first_docs))):
+                    doc = first_docs[i]
+                    length = lengths[doc]
+                    tf = first_tfs[i]
+                    score = first_weight * tf / (tf + base + per_len * length)
+                    if score + rest_bound <= threshold:
+                        continue
+                    for j, (weight, docs, tfs) in enumerate(rest):
+                        k = bisect.bisect_left(docs, doc, cursors[j])
+                        cursors[j] = k
+                        if k == len(docs) or docs[k] != doc:
+                            break
+                        tf = tfs[k]
+                        score += weight * tf / (tf + base + per_len * length)
+                    else:
+                        if score > threshold and accept(doc):
+                            offer(score, segment, doc)
+                            if len(top) >= limit:
+                                threshold = top[0][0]
+
+        return [
+            {
+                'score': round(score, 4),
+                'kind': KINDS[segment.kind[doc]],
+                'key': segment.keys[doc],
+                'bvid': segment.bvids[doc],
+                'mid': segment.mid[doc],
+                'ts': segment.ts[doc],
+                'text': segment.text(doc),
+            }
+            for score, _, segment, doc in sorted(top, key=lambda c: (-c[0], c[1]))
+        ]
+
+
+def main(argv: list = None):
+    from utils import timestamp_to_datetime
+
+    parser = argparse.ArgumentParser(description='查询本地全文索引')
+    parser.add_argument('query', help='关键词')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--kind', choices=KINDS, default=None)
+    parser.add_argument('--bvid', default=None)
+    parser.add_argument('--mid', type=int, default=None)
+    parser.add_argument('--index', default=None, help='索引目录')
+    args = parser.parse_args(argv)
+
+    index = SearchIndex(args.index)
+    for hit in index.search(args.query, limit=args.limit, kind=args.kind, bvid=args.bvid, mid=args.mid):
+        when = timestamp_to_datetime(hit['ts']) if hit['ts'] else ''
+        text = hit['text'].replace('\n', ' ')[:60]
+        print(f"{hit['score']:7.3f}  [{hit['kind']}] {hit['bvid']} {when}  {text}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,431 @@
+'''
+常驻爬虫服务
+
+启动后保持会话、cookie、WBI密钥和结果缓存常驻内存, 通过本地HTTP/JSON接口提供查询,
+避免每次调用都重新启动进程、加载cookie和请求WBI密钥
+
+接口:
+    GET  /health                 服务状态(任务数、缓存命中、流量统计)
+    GET  /video/<bvid>           同步查询视频信息(?detail=1 包含标签)
+    GET  /user/<mid>             同步查询用户信息
+    POST /jobs                   提交任务 {"kind": "video|user|history", "params": {...}}
+    GET  /jobs                   任务列表
+    GET  /jobs/<id>              任务状态
+    GET  /jobs/<id>/result       任务结果
+
+用法:
+    python service.py --port 8765 --workers 4
+    curl -X POST localhost:8765/jobs -d '{"kind": "history", "params": {"days": 7}}'
+'''
+
+import argparse
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from config import load_cookies
+from crawler import BiliCrawler
+from history_video import HistoryVideo
+from singleflight import ResultCache
+from user_info import UserInfo
+from video_info import VideoInfo
+
+# 任务状态
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# 支持的任务类型
+KINDS = ('video', 'user', 'history')
+
+
+@dataclass(slots=True)
+class Job:
+    '''
+    一个后台任务
+    '''
+    id: int
+    kind: str
+    params: dict
+    status: str = PENDING
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self, include_result: bool = False) -> dict:
+        result = {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if include_result:
+            result['result'] = self.result
+        return result
+
+
+class CrawlService:
+    '''
+    常驻的爬虫实例和任务调度
+
+    所有任务共享同一组爬虫实例(会话、WBI密钥、结果缓存保持常驻);
+    每种任务有自己的等待队列和并发数(观看历史使用登录账号, 同时只执行一个),
+    有空闲的线程并且这种任务没有达到上限时才交给线程池, 慢的任务不会占住其他任务的线程;
+    同步查询也占用同一种任务的并发数
+    '''
+    # 每种任务的最大并发数
+    KIND_LIMITS = {'video': 4, 'user': 4, 'history': 1}
+
+    def __init__(self, cookies: dict = None, workers: int = 4, max_jobs: int = 1000,
+                 memo_ttl: float = 600.0, key_ttl: float = 3600.0):
+        '''
+        :param cookies: 使用的cookie, 默认从COOKIE_FILE加载
+        :param workers: 后台任务线程数
+        :param max_jobs: 最多保留的任务数, 超过时删除最早完成的任务
+        :param memo_ttl: 结果缓存有效期(秒)
+        :param key_ttl: WBI密钥有效期(秒), 过期后重新获取
+        '''
+        self.cookies = cookies if cookies is not None else load_cookies()
+        self.video_info = VideoInfo(cookies=self.cookies)
+        self.user_info = UserInfo(cookies=self.cookies)
+        self.history = HistoryVideo(cookies=self.cookies)
+        # 常驻服务中缓存需要过期, 否则统计数据不会更新; 使用服务自己的缓存, 不修改所有爬虫共享的缓存
+        self.memo = ResultCache(maxsize=4096, ttl=memo_ttl)
+        for crawler in self.crawlers:
+            crawler._memo = self.memo
+        self.key_ttl = key_ttl
+        # 上次获取WBI密钥的时间
+        self._keys_at = None
+
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # 每种任务的等待队列和正在执行的数量(包括同步查询), 由 _slots 保护
+        self._slots = threading.Condition()
+        self._queues = {kind: deque() for kind in KINDS}
+        self._running = dict.fromkeys(KINDS, 0)
+        # 已经交给线程池的任务数
+        self._dispatched = 0
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.started_at = time.time()
+
+    @property
+    def crawlers(self) -> tuple:
+        return self.video_info, self.user_info, self.history, self.history.video_info
+
+    def warm_up(self):
+        '''
+        预先获取WBI密钥, 超过 key_ttl 后重新获取
+        '''
+        if self._keys_at is not None and time.monotonic() - self._keys_at < self.key_ttl:
+            return
+        for crawler in self.crawlers:
+            crawler._img_key = crawler._sub_key = None
+        img_key, sub_key = self.user_info._get_wbi_keys()
+        for crawler in self.crawlers:
+            crawler._img_key, crawler._sub_key = img_key, sub_key
+        if img_key:
+            self._keys_at = time.monotonic()
+
+    # ---------- 同步查询 ----------
+
+    def call(self, kind: str, func, *args, **kwargs):
+        '''
+        占用一个 kind 的并发数执行同步查询, 达到上限时等待
+
+        :param kind: 任务类型
+        :param func: 查询函数, 如 lookup_video
+        :return: func 的返回值
+        '''
+        with self._slots:
+            self._slots.wait_for(lambda: self._running[kind] < self.KIND_LIMITS[kind])
+            self._running[kind] += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._release(kind)
+
+    def lookup_video(self, bvid: str, detail: bool = False) -> Optional[dict]:
+        '''
+        查询视频信息
+
+        :param bvid: BV号
+        :param detail: 是否包含标签
+        :return: 视频信息, 失败返回None
+        '''
+        if detail:
+            # 只需要标签, 不获取评论(评论接口慢且限制严格)
+            video = self.video_info.get_full_video_details(bvid=bvid, include_comments=False)
+        else:
+            video = self.video_info.get_video_info(bvid=bvid)
+        return video.to_dict() if video else None
+
+    def lookup_user(self, mid: int) -> Optional[dict]:
+        '''
+        查询用户信息
+
+        :param mid: 用户MID
+        :return: 用户信息, 失败返回None
+        '''
+        self.warm_up()
+        user = self.user_info.get_full_user_info(mid=mid)
+        return user.to_dict() if user else None
+
+    def lookup_history(self, days: float = 7, start_ts: int = None, end_ts: int = None,
+                       business: str = 'archive', include_detail: bool = False,
+                       limit: int = None) -> list:
+        '''
+        获取时间范围内的观看历史
+
+        :param days: 没有指定start_ts时, 获取最近几天的记录
+        :param start_ts: 起始时间戳
+        :param end_ts: 结束时间戳
+        :param business: 业务类型
+        :param include_detail: 是否获取视频详情
+        :param limit: 最多返回的条数
+        :return: 历史记录列表
+        '''
+        if start_ts is None:
+            start_ts = int(time.time() - days * 86400)
+        records = self.history.iter_records(start_ts=start_ts, end_ts=end_ts, business=business,
+                                            include_detail=include_detail)
+        return [record.to_dict() for record in itertools.islice(records, limit)]
+
+    # ---------- 后台任务 ----------
+
+    def submit(self, kind: str, params: dict = None) -> Job:
+        '''
+        提交后台任务
+
+        :param kind: 任务类型 video/user/history
+        :param params: 任务参数, video: {bvid, detail}, user: {mid}, history: 同 lookup_history
+        :return: Job
+        :raises ValueError: 不支持的任务类型或缺少参数
+        '''
+        params = dict(params or {})
+        if kind not in KINDS:
+            raise ValueError(f'不支持的任务类型: {kind}')
+        if kind == 'video' and not params.get('bvid'):
+            raise ValueError('缺少参数: bvid')
+        if kind == 'user' and not params.get('mid'):
+            raise ValueError('缺少参数: mid')
+
+        with self._lock:
+            job = Job(id=next(self._ids), kind=kind, params=params)
+            self._jobs[job.id] = job
+            self._evict()
+        with self._slots:
+            self._queues[kind].append(job)
+            self._dispatch()
+        return job
+
+    def _dispatch(self):
+        '''
+        把可以执行的任务交给线程池, 调用时需要持有 _slots
+
+        每次取出最早提交、并且这种任务没有达到并发上限的任务
+        '''
+        while self._dispatched < self.workers:
+            ready = [queue for kind, queue in self._queues.items()
+                     if queue and self._running[kind] < self.KIND_LIMITS[kind]]
+            if not ready:
+                return
+            job = min(ready, key=lambda queue: queue[0].id).popleft()
+            self._running[job.kind] += 1
+            self._dispatched += 1
+            self._executor.submit(self._run, job)
+
+    def _release(self, kind: str, dispatched: bool = False):
+        with self._slots:
+            self._running[kind] -= 1
+            if dispatched:
+                self._dispatched -= 1
+            self._dispatch()
+            self._slots.notify_all()
+
+    def _evict(self):
+        # 只删除已经结束的任务
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.status in (DONE, FAILED)][:excess]:
+            del self._jobs[job_id]
+
+    def _run(self, job: Job):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            if job.kind == 'video':
+                job.result = self.lookup_video(job.params['bvid'], bool(job.params.get('detail')))
+            elif job.kind == 'user':
+                job.result = self.lookup_user(int(job.params['mid']))
+            else:
+                job.result = self.lookup_history(**job.params)
+            if job.result is None:
+                job.error = '获取失败'
+            job.status = FAILED if job.result is None else DONE
+        except Exception as e:
+            job.error = f'{type(e).__name__}: {e}'
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            self._release(job.kind, dispatched=True)
+
+    def get_job(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> list:
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def health(self) -> dict:
+        '''
+        服务状态
+        '''
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        memo = self.memo
+        requests_count, wire, body = BiliCrawler.transfer_stats.totals()
+        return {
+            'uptime': round(time.time() - self.started_at, 1),
+            'logged_in': bool(self.cookies.get('SESSDATA')),
+            'wbi_key_age': round(time.monotonic() - self._keys_at, 1) if self._keys_at is not None else None,
+            'jobs': counts,
+            'memo': {'size': len(memo), 'hits': memo.hits, 'misses': memo.misses},
+            'shared_requests': BiliCrawler._flight.shared,
+            'transfer': {'requests': requests_count, 'wire_bytes': wire, 'body_bytes': body},
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    '''
+    HTTP请求处理, service 由 make_server 设置
+    '''
+    service: CrawlService = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # 不输出每个请求的访问日志
+        pass
+
+    def _reply(self, status: int, data: Any):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str):
+        self._reply(status, {'error': message})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        service = self.service
+
+        if parts == ['health']:
+            return self._reply(200, service.health())
+        if parts == ['jobs']:
+            return self._reply(200, service.list_jobs())
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = service.get_job(int(parts[1])) if parts[1].isdigit() else None
+            if job is None:
+                return self._error(404, '任务不存在')
+            if len(parts) == 2:
+                return self._reply(200, job.to_dict())
+            if parts[2] != 'result':
+                return self._error(404, '接口不存在')
+            if job.status in (PENDING, RUNNING):
+                return self._reply(202, job.to_dict())
+            return self._reply(200 if job.status == DONE else 502, job.to_dict(include_result=True))
+        if len(parts) == 2 and parts[0] == 'video':
+            result = service.call('video', service.lookup_video, parts[1],
+                                  detail=query.get('detail') in ('1', 'true'))
+            return self._reply(200, result) if result else self._error(502, '获取视频信息失败')
+        if len(parts) == 2 and parts[0] == 'user':
+            if not parts[1].isdigit():
+                return self._error(400, 'mid必须是数字')
+            result = service.call('user', service.lookup_user, int(parts[1]))
+            return self._reply(200, result) if result else self._error(502, '获取用户信息失败')
+        self._error(404, '接口不存在')
+
+    def do_POST(self):
+        if urlsplit(self.path).path.rstrip('/') != '/jobs':
+            return self._error(404, '接口不存在')
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            job = self.service.submit(payload.get('kind'), payload.get('params'))
+        except (ValueError, AttributeError, TypeError) as e:
+            return self._error(400, str(e))
+        self._reply(202, job.to_dict())
+
+
+def make_server(service: CrawlService, host: str = '127.0.0.1', port: int = 8765) -> ThreadingHTTPServer:
+    '''
+    创建HTTP服务(不启动)
+
+    :param service: 爬虫服务
+    :param host: 监听地址, 默认只监听本机
+    :param port: 端口, 0表示随机端口
+    '''
+    handler = type('Handler', (_Handler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='常驻爬虫服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='端口')
+    parser.add_argument('--workers', type=int, default=4, help='后台任务线程数')
+    parser.add_argument('--memo-ttl', type=float, default=600.0, help='结果缓存有效期(秒)')
+    parser.add_argument('--refresh', action='store_true', help='开启cookie自动刷新')
+    args = parser.parse_args(argv)
+
+    service = CrawlService(workers=args.workers, memo_ttl=args.memo_ttl)
+    if args.refresh:
+        # 所有爬虫共享同一份cookie, 只需要一个刷新器
+        health = service.video_info.enable_session_refresh()
+        for crawler in service.crawlers:
+            crawler.session_health = health
+    service.warm_up()
+
+    server = make_server(service, args.host, args.port)
+    print(f"服务已启动: http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
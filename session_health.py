@@ -0,0 +1,259 @@
+'''
+登录状态维护: 跟踪cookie有效期, 在过期前通过网页端的cookie刷新流程续期
+
+刷新流程:
+1. cookie/info 查询是否需要刷新, 得到服务端时间戳
+2. 用公钥对 "refresh_{时间戳}" 做 RSA-OAEP 加密, 访问 correspond 页面得到 refresh_csrf
+3. cookie/refresh 用 refresh_token 换取新cookie和新的 refresh_token
+4. confirm/refresh 让旧的 refresh_token 失效
+
+refresh_token 在扫码登录时保存在cookie文件的 ac_time_value 中;
+RSA加密需要 cryptography(可选依赖), 未安装时只跟踪有效期, 不能刷新
+'''
+
+import re
+import threading
+import time
+import urllib.parse
+from typing import Optional
+
+import requests
+
+from config import BiliAPI, load_cookies, save_cookies
+
+try:
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+except ImportError:
+    serialization = None
+
+# correspond 路径加密使用的公钥
+PUBLIC_KEY = b'''-----BEGIN PUBLIC KEY-----
+MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQDLgd2OAkcGVtoE3ThUREbio0Eg
+Uc/prcajMKXvkCKFCWhJYJcLkcM2DKKcSeFpD/j6Boy538YXnR6VhcuUJOhH2x71
+nzPjfdTcqMz7djHum0qSZA0AyCBDABUqCrfNgCiJ00Ra7GmRj+YCK1NJEuewlb40
+JNrRuoEUXpabUzGB8QIDAQAB
+-----END PUBLIC KEY-----'''
+
+# 未登录的业务code
+NOT_LOGIN_CODE = -101
+
+
+def sessdata_expires(sessdata: str) -> Optional[int]:
+    '''
+    从SESSDATA中解析过期时间
+
+    SESSDATA 格式为 "xxx,过期时间戳,xxx"(通常是url编码的)
+
+    :param sessdata: SESSDATA的值
+    :return: 过期时间戳, 无法解析时返回None
+    '''
+    if not sessdata:
+        return None
+    parts = urllib.parse.unquote(sessdata).split(',')
+    if len(parts) < 2 or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+def correspond_path(timestamp: int) -> str:
+    '''
+    生成 correspond 页面的路径
+
+    :param timestamp: cookie/info 返回的时间戳(毫秒)
+    :return: 加密后的十六进制字符串
+    '''
+    key = serialization.load_pem_public_key(PUBLIC_KEY)
+    encrypted = key.encrypt(
+        f'refresh_{timestamp}'.encode(),
+        padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                     algorithm=hashes.SHA256(), label=None),
+    )
+    return encrypted.hex()
+
+
+class SessionHealth:
+    '''
+    单个账号的登录状态维护
+
+    直接修改传入的cookies字典, 使用同一个字典的爬虫在刷新后自动使用新cookie
+    '''
+
+    def __init__(self, cookies: dict, cookie_file: str = None,
+                 refresh_before: float = 3 * 86400, check_interval: float = 6 * 3600):
+        '''
+        :param cookies: 账号的cookie(会被原地更新)
+        :param cookie_file: 刷新后cookie的保存路径, 默认为COOKIE_FILE
+        :param refresh_before: 距离过期多久时主动刷新(秒)
+        :param check_interval: 多久向服务端确认一次是否需要刷新(秒), 刷新失败后同样等待这么久再重试
+        '''
+        self.cookies = cookies
+        self.cookie_file = cookie_file
+        self.refresh_before = refresh_before
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        # 上一次刷新失败的时间(time.monotonic), 冷却期内不再尝试
+        self._failed_at = None
+        # 刷新成功的次数, 用来判断失败的请求是否发生在刷新之前
+        self.generation = 0
+        self.refreshed_at = None
+
+    @staticmethod
+    def is_logged_out(resp: dict) -> bool:
+        '''
+        响应是否表示未登录(cookie已失效)
+        '''
+        return resp.get('code') == NOT_LOGIN_CODE
+
+    @property
+    def can_refresh(self) -> bool:
+        return serialization is not None and bool(self.cookies.get('ac_time_value'))
+
+    def expires_at(self) -> Optional[int]:
+        '''
+        SESSDATA的过期时间戳
+        '''
+        return sessdata_expires(self.cookies.get('SESSDATA'))
+
+    def remaining(self) -> Optional[float]:
+        '''
+        距离过期还有多久(秒), 无法解析时返回None
+        '''
+        expires = self.expires_at()
+        if expires is None:
+            return None
+        return expires - time.time()
+
+    def ensure_fresh(self, session: requests.Session) -> bool:
+        '''
+        快要过期或者服务端要求刷新时刷新cookie
+
+        本地只比较过期时间, 每隔 check_interval 才请求一次 cookie/info
+
+        :param session: 发送请求使用的会话
+        :return: 是否进行了刷新
+        '''
+        if not self.can_refresh or self._cooling_down():
+            return False
+        remaining = self.remaining()
+        expiring = remaining is not None and remaining < self.refresh_before
+        if not expiring and time.monotonic() - self._last_check < self.check_interval:
+            return False
+        return self.refresh(session, force=expiring)
+
+    def refresh_after_failure(self, session: requests.Session, generation: int) -> bool:
+        '''
+        请求返回未登录后刷新cookie
+
+        多个线程同时失败时只刷新一次, 其余线程直接使用新cookie重试
+
+        :param session: 发送请求使用的会话
+        :param generation: 发出失败请求时的 generation
+        :return: 是否可以用新cookie重试
+        '''
+        if not self.can_refresh:
+            return False
+        with self._lock:
+            if self.generation != generation:
+                return True
+        if self._cooling_down():
+            return False
+        return self.refresh(session, force=True)
+
+    def _cooling_down(self) -> bool:
+        # 刷新失败后(refresh_token失效、网络错误等)等待 check_interval, 避免每个请求都重新走一遍刷新流程
+        failed_at = self._failed_at
+        return failed_at is not None and time.monotonic() - failed_at < self.check_interval
+
+    def refresh(self, session: requests.Session, force: bool = False) -> bool:
+        '''
+        执行cookie刷新流程
+
+        :param session: 发送请求使用的会话
+        :param force: 服务端认为不需要刷新时也刷新
+        :return: 是否刷新成功
+        '''
+        with self._lock:
+            self._last_check = time.monotonic()
+            if self._reload_saved():
+                self._failed_at = None
+                return True
+            try:
+                refreshed = self._refresh(session, force)
+            except (requests.RequestException, ValueError, KeyError) as e:
+                print(f"刷新cookie失败: {e}")
+                refreshed = False
+            # 不强制刷新时返回False可能只是服务端认为不需要刷新
+            if refreshed:
+                self._failed_at = None
+            elif force:
+                self._failed_at = time.monotonic()
+            return refreshed
+
+    def _reload_saved(self) -> bool:
+        '''
+        使用同一个cookie文件的其他进程已经刷新过时(文件中的refresh_token不同), 直接使用文件中的新cookie;
+        旧的refresh_token已经失效, 不能再用它刷新
+        '''
+        saved = load_cookies(self.cookie_file)
+        token = saved.get('ac_time_value')
+        if not token or token == self.cookies.get('ac_time_value'):
+            return False
+        self.cookies.update(saved)
+        self.generation += 1
+        self.refreshed_at = time.time()
+        print("✓ 已使用其他进程刷新后的cookie")
+        return True
+
+    def _refresh(self, session: requests.Session, force: bool) -> bool:
+        csrf = self.cookies.get('bili_jct')
+        refresh_token = self.cookies.get('ac_time_value')
+
+        resp = session.get(BiliAPI.COOKIE_INFO, params={'csrf': csrf},
+                           cookies=self.cookies, timeout=10).json()
+        if resp.get('code') != 0:
+            print(f"查询cookie状态失败: {resp.get('message')}")
+            return False
+        data = resp['data']
+        if not data.get('refresh') and not force:
+            return False
+
+        # 获取 refresh_csrf
+        page = session.get(f"{BiliAPI.CORRESPOND}/{correspond_path(data['timestamp'])}",
+                           cookies=self.cookies, timeout=10)
+        match = re.search(r'<div id="1-name">(.+?)</div>', page.text)
+        if not match:
+            print("刷新cookie失败: 没有获取到refresh_csrf")
+            return False
+
+        # 用 refresh_token 换取新cookie
+        response = session.post(BiliAPI.COOKIE_REFRESH, data={
+            'csrf': csrf,
+            'refresh_csrf': match.group(1),
+            'source': 'main_web',
+            'refresh_token': refresh_token,
+        }, cookies=self.cookies, timeout=10)
+        resp = response.json()
+        if resp.get('code') != 0:
+            print(f"刷新cookie失败: {resp.get('message')}")
+            return False
+
+        cookies = dict(self.cookies)
+        cookies.update(requests.utils.dict_from_cookiejar(response.cookies))
+        cookies['ac_time_value'] = resp['data']['refresh_token']
+
+        # 确认刷新, 让旧的 refresh_token 失效
+        resp = session.post(BiliAPI.CONFIRM_REFRESH, data={
+            'csrf': cookies.get('bili_jct'),
+            'refresh_token': refresh_token,
+        }, cookies=cookies, timeout=10).json()
+        if resp.get('code') != 0:
+            print(f"确认刷新失败: {resp.get('message')}")
+
+        self.cookies.update(cookies)
+        save_cookies(self.cookies, self.cookie_file)
+        self.generation += 1
+        self.refreshed_at = time.time()
+        print("✓ cookie已刷新")
+        return True
@@ -0,0 +1,231 @@
+'''
+多进程分片爬取
+
+把BV号/MID列表放入共享的SQLite工作队列, 每个进程使用自己的账号和爬虫实例领取任务,
+进程崩溃后租约过期的任务会被其他进程重新领取, 最后合并各进程的输出
+
+用法:
+    python shard_runner.py bvids.txt --accounts a.json b.json --rate 2
+    cat mids.txt | python shard_runner.py - --kind user --workers 4
+'''
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+
+from config import DATA_DIR, load_cookies
+from ratelimit import TokenBucket
+from utils import read_keys, write_rows
+from work_queue import WorkQueue
+
+
+# 支持的爬取类型
+KINDS = ('video', 'user')
+
+
+def _make_crawler(kind: str, cookies: dict):
+    '''
+    创建对应类型的爬虫和获取单条记录的函数
+    '''
+    if kind == 'video':
+        from video_info import VideoInfo
+        crawler = VideoInfo(cookies=cookies)
+        return crawler, lambda key: crawler.get_video_info(bvid=key)
+
+    from user_info import UserInfo
+    crawler = UserInfo(cookies=cookies)
+    return crawler, lambda key: crawler.get_user_info(mid=int(key))
+
+
+def _heads(kind: str) -> tuple:
+    '''
+    :return: (表头, 去重列下标)
+    '''
+    from records import UserRecord, VideoRecord
+    if kind == 'video':
+        return VideoRecord.HEADS, 1
+    return UserRecord.HEADS, 0
+
+
+def run_worker(index: int, kind: str, cookie_file: str, queue_path: str, part_path: str,
+               rate: float, batch: int, lease_seconds: float, max_attempts: int):
+    '''
+    工作进程: 循环领取任务并把结果追加到自己的分片文件
+
+    每条结果写入并刷新后才 ack, 崩溃时最多重复一条, 合并时会去重
+    '''
+    cookies = load_cookies(cookie_file)
+    crawler, fetch = _make_crawler(kind, cookies)
+    if cookies.get('ac_time_value'):
+        # 有refresh_token时自动续期; 同一账号的多个进程中先刷新的写回文件, 其余进程读取文件中的新cookie
+        crawler.enable_session_refresh(cookie_file)
+    crawler.rate_limiter = TokenBucket(rate, burst=max(1, int(rate)))
+    owner = f'worker-{index}-{os.getpid()}'
+
+    with WorkQueue(queue_path) as queue, \
+            open(part_path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        while True:
+            items = queue.lease(owner, limit=batch, lease_seconds=lease_seconds)
+            if not items:
+                # 其他进程还有未完成的任务, 等待它们完成或租约过期
+                if queue.remaining() == 0:
+                    break
+                time.sleep(1)
+                continue
+
+            for item_id, key in items:
+                try:
+                    record = fetch(key)
+                except Exception as e:
+                    queue.fail(item_id, error=repr(e), max_attempts=max_attempts)
+                    continue
+
+                if record is None:
+                    queue.fail(item_id, error='请求失败', max_attempts=max_attempts)
+                    continue
+
+                writer.writerow(record.to_row())
+                f.flush()
+                queue.ack(item_id)
+
+
+def merge_parts(part_paths: list, out_path: str, heads: list, key_column: int) -> int:
+    '''
+    合并各进程的分片文件, 按key去重
+
+    :param part_paths: 分片文件列表
+    :param out_path: 输出CSV
+    :param heads: 表头
+    :param key_column: 去重列下标
+    :return: 写入的行数
+    '''
+    def rows():
+        seen = set()
+        for part_path in part_paths:
+            if not os.path.exists(part_path):
+                continue
+            with open(part_path, 'r', newline='', encoding='utf-8') as f:
+                for row in csv.reader(f):
+                    if len(row) <= key_column or row[key_column] in seen:
+                        continue
+                    seen.add(row[key_column])
+                    yield row
+
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    return write_rows(out_path, rows(), heads=heads)
+
+
+def run(keys: list, kind: str = 'video', accounts: list = None, workers: int = None,
+        rate: float = 2.0, queue_path: str = None, out_path: str = None, batch: int = 10,
+        lease_seconds: float = 300.0, max_attempts: int = 3, retry_failed: bool = False) -> dict:
+    '''
+    运行分片爬取
+
+    :param keys: BV号/MID列表
+    :param kind: 'video' 或 'user'
+    :param accounts: 各账号的cookie文件, 不传入就使用默认账号
+    :param workers: 进程数, 默认为账号数(只有默认账号时为CPU核数)
+    :param rate: 每个账号每秒请求数, 由使用同一账号的进程平分
+    :param queue_path: 队列文件, 相同队列文件可以断点续爬
+    :param out_path: 合并后的输出CSV
+    :param batch: 每次领取的任务数
+    :param lease_seconds: 租约时长
+    :param max_attempts: 单个任务最大尝试次数
+    :param retry_failed: 是否重试之前失败的任务
+    :return: 各状态的任务数
+    '''
+    accounts = accounts or [None]
+    workers = workers or (len(accounts) if accounts != [None] else os.cpu_count() or 1)
+    queue_path = queue_path or os.path.join(DATA_DIR, f'{kind}_queue.sqlite3')
+    out_path = out_path or os.path.join(DATA_DIR, f'{kind}_shards.csv')
+    parts_dir = out_path + '.parts'
+    os.makedirs(parts_dir, exist_ok=True)
+
+    with WorkQueue(queue_path) as queue:
+        added = queue.add(keys)
+        if retry_failed:
+            queue.retry_failed()
+        total = sum(queue.counts().values())
+    print(f"新增 {added} 个任务, 队列共 {total} 个, 启动 {workers} 个进程")
+
+    part_paths = [os.path.join(parts_dir, f'part-{i}.csv') for i in range(workers)]
+    # 进程按 i % 账号数 分配账号, 同一账号的请求速率不随进程数增加
+    shares = [len(range(j, workers, len(accounts))) for j in range(len(accounts))]
+
+    def start(i):
+        proc = multiprocessing.Process(
+            target=run_worker,
+            args=(i, kind, accounts[i % len(accounts)], queue_path, part_paths[i],
+                  rate / shares[i % len(accounts)], batch, lease_seconds, max_attempts),
+            daemon=True,
+        )
+        proc.start()
+        return proc
+
+    procs = [start(i) for i in range(workers)]
+    # 崩溃的进程重启次数上限
+    restarts = workers * 3
+    started_at = time.time()
+
+    with WorkQueue(queue_path) as queue:
+        while any(p.is_alive() for p in procs) or (queue.remaining() and restarts > 0):
+            for i, proc in enumerate(procs):
+                if not proc.is_alive() and proc.exitcode not in (0, None) and restarts > 0:
+                    print(f"\n进程 {i} 异常退出(exitcode={proc.exitcode}), 重启")
+                    restarts -= 1
+                    procs[i] = start(i)
+
+            counts = queue.counts()
+            elapsed = max(time.time() - started_at, 1e-6)
+            print(f"\r完成 {counts['done']}/{total}  失败 {counts['failed']}  "
+                  f"进行中 {counts['leased']}  {counts['done'] / elapsed:.1f}/s", end='', flush=True)
+            if not any(p.is_alive() for p in procs) and not queue.remaining():
+                break
+            time.sleep(2)
+        counts = queue.counts()
+    print()
+
+    heads, key_column = _heads(kind)
+    merged = merge_parts(part_paths, out_path, heads, key_column)
+    print(f"✓ 已合并 {merged} 条结果到: {out_path}")
+    return counts
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='多进程分片爬取视频/用户信息')
+    parser.add_argument('input', help="BV号/MID列表文件, '-' 表示标准输入")
+    parser.add_argument('--kind', choices=KINDS, default='video', help='爬取类型')
+    parser.add_argument('--accounts', nargs='*', default=None, help='各账号的cookie文件')
+    parser.add_argument('--workers', type=int, default=None, help='进程数')
+    parser.add_argument('--rate', type=float, default=2.0, help='每个账号每秒请求数(由使用同一账号的进程平分)')
+    parser.add_argument('--queue', default=None, help='队列文件')
+    parser.add_argument('--out', default=None, help='输出CSV')
+    parser.add_argument('--batch', type=int, default=10, help='每次领取的任务数')
+    parser.add_argument('--lease', type=float, default=300.0, help='租约时长(秒)')
+    parser.add_argument('--max-attempts', type=int, default=3, help='单个任务最大尝试次数')
+    parser.add_argument('--retry-failed', action='store_true', help='重试之前失败的任务')
+    args = parser.parse_args(argv)
+
+    counts = run(
+        read_keys(args.input),
+        kind=args.kind,
+        accounts=args.accounts,
+        workers=args.workers,
+        rate=args.rate,
+        queue_path=args.queue,
+        out_path=args.out,
+        batch=args.batch,
+        lease_seconds=args.lease,
+        max_attempts=args.max_attempts,
+        retry_failed=args.retry_failed,
+    )
+    return 0 if not counts['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
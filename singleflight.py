@@ -0,0 +1,115 @@
+'''
+请求合并与结果缓存
+
+SingleFlight: 相同的请求同时只发出一次, 并发的调用方共享同一个结果
+ResultCache: 一次运行内的结果缓存(LRU), 避免重复请求相同的数据
+'''
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class _Call:
+    '''
+    进行中的一次调用
+    '''
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    '''
+    合并相同key的并发调用
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # 被合并(没有实际执行)的调用次数
+        self.shared = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        '''
+        执行func, 如果相同key的调用正在进行, 就等待并返回它的结果
+
+        :param key: 调用的唯一标识
+        :param func: 实际执行的函数
+        :return: func的返回值
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class ResultCache:
+    '''
+    线程安全的LRU结果缓存
+    '''
+
+    def __init__(self, maxsize: int = 4096, ttl: float = None):
+        '''
+        :param maxsize: 最多缓存的条数
+        :param ttl: 缓存有效期(秒), None表示一直有效(常驻服务中需要设置, 否则数据不会更新)
+        '''
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default=None) -> Any:
+        with self._lock:
+            if key in self._data:
+                expires, value = self._data[key]
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
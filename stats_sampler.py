@@ -0,0 +1,354 @@
+'''
+视频数据(播放/点赞/投币/收藏等)时间序列采样
+
+StatsStore: 追加写入的时间序列文件, 样本按视频做差分编码(varint), 定期写入关键帧, 支持按视频和时间范围查询
+StatsSampler: 按固定间隔采样一批视频, 请求在间隔内均匀分布, 避免同时发出
+
+用法:
+    python stats_sampler.py watchlist.txt --interval 600
+'''
+
+import argparse
+import bisect
+import os
+import sys
+import threading
+import time
+from array import array
+from typing import Optional
+
+from config import DATA_DIR
+from records import VideoStat
+from utils import read_keys, read_varint, write_varint
+from video_info import VideoInfo
+
+
+# 单帧最多 1 + 1 + 7 个varint, 每个最多10字节
+_MAX_FRAME = 90
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) if value >= 0 else ((-value << 1) - 1)
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+
+class StatsStore:
+    '''
+    追加写入的视频数据时间序列文件
+
+    帧格式(均为varint):
+        header = (视频序号 << 1) | 是否关键帧
+        时间戳(关键帧为绝对值, 否则为与上一个样本的差)
+        7个统计值(zigzag编码, 关键帧为绝对值, 否则为差值)
+    视频序号对应的BV号保存在同名的 .ids 文件中(每行一个)
+    内存中只索引关键帧, 查询时从范围前最近的关键帧开始读取, 样本按时间顺序追加
+    '''
+    # 每个视频每隔多少个样本写一次关键帧, 内存中的索引只有样本数的 1/KEY_INTERVAL
+    KEY_INTERVAL = 64
+
+    def __init__(self, path: str):
+        dir_path = os.path.dirname(path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+
+        self.path = path
+        self.ids_path = path + '.ids'
+        self._lock = threading.Lock()
+        self._ids = {}  # bvid -> 序号
+        self._bvids = []  # 序号 -> bvid
+        # 序号 -> (关键帧时间戳数组, 关键帧偏移量数组)
+        self._keys = []
+        # 序号 -> (时间戳, 统计值元组, 距上一个关键帧的样本数)
+        self._last = []
+
+        self._load()
+        self._file = open(self.path, 'ab')
+        self._ids_file = open(self.ids_path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def _iter_frames(f, offset: int = 0, chunk_size: int = 1 << 20):
+        '''
+        从offset开始逐帧解码, 分块读取文件, 不把整个文件读入内存
+
+        :param f: 以二进制模式打开的文件
+        :param offset: 起始偏移量(必须是帧的开头)
+        :param chunk_size: 每次读取的字节数
+        :return: 迭代 (偏移量, 视频序号, 是否关键帧, 时间戳或时间差, 统计值或差值, 帧结束的偏移量),
+                 末尾不完整的帧不输出
+        '''
+        f.seek(offset)
+        data = b''
+        pos = 0
+        eof = False
+        while True:
+            while not eof and len(data) - pos < _MAX_FRAME:
+                chunk = f.read(chunk_size)
+                eof = len(chunk) < chunk_size
+                offset += pos
+                data = data[pos:] + chunk
+                pos = 0
+            if pos >= len(data):
+                return
+            start = pos
+            try:
+                header, pos = read_varint(data, pos)
+                ts, pos = read_varint(data, pos)
+                values = []
+                for _ in VideoStat.FIELDS:
+                    value, pos = read_varint(data, pos)
+                    values.append(_unzigzag(value))
+            except IndexError:
+                return
+            yield offset + start, header >> 1, header & 1, ts, values, offset + pos
+
+    def _load(self):
+        '''
+        读取已有数据, 恢复每个视频的最新样本; 末尾不完整的帧(写入时崩溃)会被截掉
+        '''
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._register(line.rstrip('\n'))
+
+        if not os.path.exists(self.path):
+            return
+
+        good = 0
+        with open(self.path, 'rb') as f:
+            for offset, sid, is_key, ts, values, end in self._iter_frames(f):
+                if sid >= len(self._bvids):
+                    break
+                if is_key:
+                    stat = tuple(values)
+                    since_key = 0
+                else:
+                    last_ts, last_stat, since_key = self._last[sid]
+                    ts += last_ts
+                    stat = tuple(a + b for a, b in zip(last_stat, values))
+                    since_key += 1
+                if is_key:
+                    self._keys[sid][0].append(ts)
+                    self._keys[sid][1].append(offset)
+                self._last[sid] = (ts, stat, since_key)
+                good = end
+
+        if good < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)
+
+    def _register(self, bvid: str) -> int:
+        sid = len(self._bvids)
+        self._ids[bvid] = sid
+        self._bvids.append(bvid)
+        self._keys.append((array('q'), array('q')))
+        self._last.append(None)
+        return sid
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._ids_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, bvid: str, ts: int, stat: VideoStat):
+        '''
+        追加一个样本
+
+        :param bvid: 视频BV号
+        :param ts: 采样时间戳(秒)
+        :param stat: 统计数据
+        '''
+        values = stat.to_tuple()
+        with self._lock:
+            sid = self._ids.get(bvid)
+            if sid is None:
+                sid = self._register(bvid)
+                self._ids_file.write(bvid + '\n')
+                self._ids_file.flush()
+
+            last = self._last[sid]
+            is_key = last is None or last[2] + 1 >= self.KEY_INTERVAL or ts < last[0]
+            buf = bytearray()
+            write_varint(buf, (sid << 1) | is_key)
+            if is_key:
+                write_varint(buf, ts)
+                for value in values:
+                    write_varint(buf, _zigzag(value))
+                since_key = 0
+            else:
+                write_varint(buf, ts - last[0])
+                for value, prev in zip(values, last[1]):
+                    write_varint(buf, _zigzag(value - prev))
+                since_key = last[2] + 1
+
+            offset = self._file.tell()
+            self._file.write(buf)
+            self._file.flush()
+            if is_key:
+                self._keys[sid][0].append(ts)
+                self._keys[sid][1].append(offset)
+            self._last[sid] = (ts, values, since_key)
+
+    def bvids(self) -> list:
+        '''
+        已记录的所有视频
+        '''
+        return list(self._bvids)
+
+    def latest(self, bvid: str) -> Optional[tuple]:
+        '''
+        视频的最新样本
+
+        :return: (时间戳, VideoStat), 没有样本时返回None
+        '''
+        sid = self._ids.get(bvid)
+        if sid is None or self._last[sid] is None:
+            return None
+        ts, values, _ = self._last[sid]
+        return ts, VideoStat(*values)
+
+    def query(self, bvid: str, start_ts: int = 0, end_ts: int = None) -> list:
+        '''
+        查询视频在 [start_ts, end_ts) 内的样本
+
+        从范围前最近的关键帧开始流式读取文件, 只累加这个视频的帧, 超出范围后停止
+
+        :param bvid: 视频BV号
+        :param start_ts: 起始时间戳
+        :param end_ts: 结束时间戳, None表示不限制
+        :return: [(时间戳, VideoStat), ...]
+        '''
+        sid = self._ids.get(bvid)
+        if sid is None:
+            return []
+
+        with self._lock:
+            self._file.flush()
+            key_times, key_offsets = self._keys[sid]
+            count = len(key_times)
+            size = self._file.tell()
+        if not count:
+            return []
+
+        key = max(bisect.bisect_right(key_times, start_ts, 0, count) - 1, 0)
+        results = []
+        ts = 0
+        stat = ()
+        with open(self.path, 'rb') as f:
+            for _, frame_sid, is_key, value, values, end in self._iter_frames(f, key_offsets[key]):
+                if end > size:
+                    break
+                if frame_sid != sid:
+                    continue
+                if is_key:
+                    ts, stat = value, tuple(values)
+                else:
+                    ts += value
+                    stat = tuple(a + b for a, b in zip(stat, values))
+                if end_ts is not None and ts >= end_ts:
+                    break
+                if ts >= start_ts:
+                    results.append((ts, VideoStat(*stat)))
+        return results
+
+
+class StatsSampler:
+    '''
+    定时采样一批视频的统计数据
+    '''
+
+    def __init__(self, bvids: list, store: StatsStore, interval: float = 600.0,
+                 workers: int = 4, cookies: dict = None):
+        '''
+        :param bvids: 要采样的视频
+        :param store: 时间序列存储
+        :param interval: 采样间隔(秒), 每个视频每个间隔采样一次
+        :param workers: 并发请求数
+        :param cookies: 使用的cookie
+        '''
+        self.bvids = list(dict.fromkeys(bvids))
+        self.store = store
+        self.interval = interval
+        self.workers = workers
+        self.video_info = VideoInfo(cookies=cookies)
+        # 采样需要最新数据, 不能使用运行内缓存
+        self.video_info.use_memo = False
+        # 采样在线程池中执行, 失败计数需要加锁
+        self._lock = threading.Lock()
+        self.failed = 0
+
+    def sample(self, bvid: str) -> Optional[VideoStat]:
+        '''
+        采样单个视频并写入存储
+        '''
+        stat = self.video_info.get_video_stat(bvid)
+        if stat is None:
+            with self._lock:
+                self.failed += 1
+            return None
+        self.store.append(bvid, int(time.time()), stat)
+        return stat
+
+    def run_round(self):
+        '''
+        采样一轮: 第i个视频在 开始时间 + i * (间隔 / 视频数) 发出请求
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+
+        if not self.bvids:
+            return
+        slot = self.interval / len(self.bvids)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for i, bvid in enumerate(self.bvids):
+                delay = start + i * slot - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.sample, bvid)
+
+        # 等待本轮间隔结束
+        remaining = start + self.interval - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def run(self, rounds: int = None):
+        '''
+        持续采样
+
+        :param rounds: 采样轮数, None表示一直运行(Ctrl-C停止)
+        '''
+        print(f"开始采样 {len(self.bvids)} 个视频, 间隔 {self.interval:.0f} 秒")
+        done = 0
+        try:
+            while rounds is None or done < rounds:
+                self.run_round()
+                done += 1
+                print(f"  第 {done} 轮完成, 累计失败 {self.failed} 次")
+        except KeyboardInterrupt:
+            print("\n已停止采样")
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='定时采样视频统计数据')
+    parser.add_argument('watchlist', help='BV号列表文件, 每行一个, - 表示标准输入')
+    parser.add_argument('--interval', type=float, default=600.0, help='采样间隔(秒)')
+    parser.add_argument('--workers', type=int, default=4, help='并发请求数')
+    parser.add_argument('--rounds', type=int, default=None, help='采样轮数')
+    parser.add_argument('--store', default=os.path.join(DATA_DIR, 'video_stats.bin'), help='时间序列文件')
+    args = parser.parse_args(argv)
+
+    bvids = read_keys(args.watchlist)
+    with StatsStore(args.store) as store:
+        StatsSampler(bvids, store, interval=args.interval, workers=args.workers).run(args.rounds)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+'''
+代理池测试: 用本地 http.server 充当代理, 检查打分和隔离
+
+运行: python -m unittest discover -s tests
+'''
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler import BiliCrawler
+from proxy_pool import ProxyPool
+from retry import OK, RetryPolicy
+
+
+class StandInProxy:
+    '''
+    本地的代理替身: 收到的请求(绝对URL)不转发, 按设定的延迟和状态码直接返回
+    '''
+
+    def __init__(self, delay: float = 0.0, status: int = 200):
+        self.delay = delay
+        self.status = status
+        self.hits = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.hits += 1
+                time.sleep(stand_in.delay)
+                body = json.dumps({'code': 0 if stand_in.status == 200 else -1,
+                                   'data': {'path': self.path}}).encode()
+                self.send_response(stand_in.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ProxyPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stand_ins = []
+        self.crawler = BiliCrawler(cookies={})
+        self.crawler.retry_policy = RetryPolicy(base_delay=0.01, max_delay=0.05, budget=None)
+
+    def tearDown(self):
+        for stand_in in self.stand_ins:
+            stand_in.close()
+
+    def stand_in(self, **kwargs) -> StandInProxy:
+        stand_in = StandInProxy(**kwargs)
+        self.stand_ins.append(stand_in)
+        return stand_in
+
+    def send(self, pool: ProxyPool, path: str, times: int) -> list:
+        self.crawler.proxy_pool = pool
+        # 每个测试使用不同的url, 不共用熔断器
+        return [self.crawler._send(f'http://api.test/{path}') for _ in range(times)]
+
+    def test_prefers_faster_proxy(self):
+        fast = self.stand_in(delay=0.01)
+        slow = self.stand_in(delay=0.15)
+        # 慢的代理排在前面, 先通过两个代理各发一次请求得到延迟
+        pool = ProxyPool([slow.url, fast.url], rate=100, burst=100)
+        self.crawler.proxy_pool = pool
+        for proxy in pool.proxies:
+            start = time.monotonic()
+            proxy.session.get('http://api.test/warm-up')
+            pool.record(proxy, time.monotonic() - start, OK)
+
+        results = self.send(pool, 'score', 12)
+
+        self.assertTrue(all(r['code'] == 0 for r in results))
+        slow_stats, fast_stats = pool.snapshot()
+        self.assertLess(fast_stats['score'], slow_stats['score'])
+        self.assertLess(fast_stats['latency'], slow_stats['latency'])
+        self.assertEqual(slow.hits, 1)
+        self.assertEqual(fast.hits, 13)
+
+    def test_blocked_proxy_is_quarantined(self):
+        good = self.stand_in(delay=0.05)
+        blocked = self.stand_in(status=412)
+        # 被拦截的代理延迟更低, 会先被选中
+        pool = ProxyPool([good.url, blocked.url], rate=100, burst=100, quarantine=60)
+        pool.proxies[1].latency = 0.001
+
+        results = self.send(pool, 'block', 5)
+
+        self.assertTrue(all(r['code'] == 0 for r in results))
+        self.assertEqual(blocked.hits, 1)
+        self.assertEqual(good.hits, 5)
+        self.assertTrue(pool.proxies[1].is_quarantined())
+        self.assertEqual(pool.healthy_count(), 1)
+
+    def test_consecutive_failures_quarantine_then_probe(self):
+        failing = self.stand_in(status=503)
+        pool = ProxyPool([failing.url], rate=100, burst=100, quarantine=0.2, failure_threshold=3)
+        proxy = pool.proxies[0]
+
+        self.crawler.proxy_pool = pool
+        result = self.crawler._send('http://api.test/fail', max_attempts=3)
+
+        self.assertNotEqual(result['code'], 0)
+        self.assertEqual(failing.hits, 3)
+        self.assertTrue(proxy.is_quarantined())
+        self.assertEqual(proxy.quarantines, 1)
+        # 全部代理被隔离时等待隔离结束, 再把它作为探测请求发出
+        start = time.monotonic()
+        self.assertIs(pool.acquire(), proxy)
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_use_proxies_from_file(self):
+        stand_in = self.stand_in()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'proxies.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f'# 本地代理\n{stand_in.url} 50\n')
+            loaded = BiliCrawler._proxies_loaded, BiliCrawler._shared_proxy_pool
+            try:
+                pool = BiliCrawler.use_proxies(path)
+                crawler = BiliCrawler(cookies={})
+            finally:
+                BiliCrawler._proxies_loaded, BiliCrawler._shared_proxy_pool = loaded
+
+        self.assertIs(crawler.proxy_pool, pool)
+        self.assertEqual(len(pool.proxies), 1)
+        self.assertEqual(pool.proxies[0].bucket.rate, 50)
+        crawler.retry_policy = self.crawler.retry_policy
+        self.assertEqual(crawler._send('http://api.test/file')['code'], 0)
+        self.assertEqual(stand_in.hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
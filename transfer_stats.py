@@ -0,0 +1,89 @@
+'''
+按接口统计传输字节数
+
+压缩后(实际传输)和解压后的字节数分别统计, 用来确认压缩是否生效以及各接口的流量占比
+'''
+
+import threading
+from collections import Counter
+
+import requests
+
+
+class TransferStats:
+    '''
+    传输字节数统计(线程安全)
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 接口 -> [请求数, 传输字节数, 解压后字节数]
+        self._endpoints = {}
+        # 响应使用的压缩格式 -> 次数
+        self.encodings = Counter()
+
+    def record(self, url: str, response: requests.Response):
+        '''
+        记录一个已经读取完响应体的响应
+
+        :param url: 接口url(不含参数)
+        :param response: 响应
+        '''
+        body = len(response.content)
+        try:
+            # urllib3 记录的是从连接中读取的原始(压缩)字节数
+            wire = response.raw.tell()
+        except (AttributeError, OSError):
+            wire = body
+        encoding = response.headers.get('Content-Encoding') or 'identity'
+
+        with self._lock:
+            entry = self._endpoints.setdefault(url, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += wire
+            entry[2] += body
+            self.encodings[encoding] += 1
+
+    def snapshot(self) -> dict:
+        '''
+        :return: {接口: {'requests', 'wire_bytes', 'body_bytes'}}
+        '''
+        with self._lock:
+            return {
+                url: {'requests': n, 'wire_bytes': wire, 'body_bytes': body}
+                for url, (n, wire, body) in self._endpoints.items()
+            }
+
+    def totals(self) -> tuple:
+        '''
+        :return: (请求数, 传输字节数, 解压后字节数)
+        '''
+        with self._lock:
+            values = list(self._endpoints.values())
+        return tuple(sum(v[i] for v in values) for i in range(3))
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self.encodings.clear()
+
+    def report(self):
+        '''
+        输出各接口的流量统计
+        '''
+        def size(n: int) -> str:
+            for unit in ('B', 'KB', 'MB'):
+                if n < 1024:
+                    return f'{n:.0f}{unit}' if unit == 'B' else f'{n:.1f}{unit}'
+                n /= 1024
+            return f'{n:.1f}GB'
+
+        stats = sorted(self.snapshot().items(), key=lambda kv: -kv[1]['wire_bytes'])
+        print("接口流量统计(传输 / 解压后):")
+        for url, s in stats:
+            ratio = s['wire_bytes'] / s['body_bytes'] if s['body_bytes'] else 1.0
+            print(f"  {url.split('//', 1)[-1]}: {s['requests']} 次, "
+                  f"{size(s['wire_bytes'])} / {size(s['body_bytes'])} ({ratio:.0%})")
+        n, wire, body = self.totals()
+        print(f"  合计: {n} 次, {size(wire)} / {size(body)}")
+        print(f"  压缩格式: {dict(self.encodings)}")
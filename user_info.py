@@ -5,9 +5,11 @@
 import os
 import json
 from typing import Optional
+import schemas
 from utils import format_number
 from crawler import BiliCrawler
 from config import BiliAPI, DATA_DIR
+from records import UserRecord
 
 
 class UserInfo(BiliCrawler):
@@ -15,8 +17,8 @@ class UserInfo(BiliCrawler):
     用户信息爬取类
     '''
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, cookies: dict = None):
+        super().__init__(cookies=cookies)
         self.data_file = os.path.join(DATA_DIR, 'user_info.json')
     
     def get_nav_info(self) -> Optional[dict]:
@@ -33,13 +35,13 @@ class UserInfo(BiliCrawler):
         
         return resp['data']
     
-    def get_user_info(self, mid: int = None) -> Optional[dict]:
+    def get_user_info(self, mid: int = None) -> Optional[UserRecord]:
         '''
         获取用户空间的详细信息
         
         :param mid: 用户的mid, 如果是None就表示获取当前登录用户信息
         
-        :return: dict: 用户信息
+        :return: UserRecord: 用户信息
         '''
 
         if mid is None:
@@ -49,37 +51,13 @@ class UserInfo(BiliCrawler):
                 return None
         
         params = {'mid': mid}
-        resp = self._request_wbi(BiliAPI.USER_INFO, params=params)
+        resp = self._request_wbi(BiliAPI.USER_INFO, params=params, schema=schemas.USER_INFO)
 
         if resp.get('code') != 0:
             print(f"获取用户信息失败: {resp.get('message')}")
             return None
     
-        data = resp['data']
-
-        user_info = {
-            'mid': data.get('mid'),
-            'name': data.get('name'),
-            'sex': data.get('sex'),
-            'face': data.get('face'),  # 头像
-            'sign': data.get('sign'),  # 签名
-            'level': data.get('level'),  # 等级
-            'silence': data.get('silence'),  # 是否被封禁
-            'vip': {
-                'type': data.get('vip', {}).get('type'),  # 0=无 1=月度 2=年度
-                'status': data.get('vip', {}).get('status'),  # 0=无 1=有
-                'label': data.get('vip', {}).get('label', {}).get('text', ''),
-            },
-            'official': {
-                'role': data.get('official', {}).get('role'),
-                'title': data.get('official', {}).get('title'),
-            },
-            'birthday': data.get('birthday'),
-            'school': data.get('school', {}).get('name', '') if data.get('school') else '',
-            'profession': data.get('profession', {}).get('name', '') if data.get('profession') else '',
-        }
-
-        return user_info
+        return UserRecord.from_api(resp['data'])
 
     def get_user_stat(self, mid: int = None) -> Optional[dict]:
         '''
@@ -137,7 +115,7 @@ class UserInfo(BiliCrawler):
 
         return up_stat
     
-    def get_full_user_info(self, mid: int=None) -> Optional[dict]:
+    def get_full_user_info(self, mid: int=None) -> Optional[UserRecord]:
         '''
         获取用户的完整信息(包含基本信息、统计等)
         
@@ -155,16 +133,16 @@ class UserInfo(BiliCrawler):
         # 获取关系统计
         stat = self.get_user_stat(mid=mid)
         if stat:
-            user_info['stat'] = stat
+            user_info.stat = stat
 
         # 获取up主统计
         up_stat = self.get_up_stat(mid=mid)
         if up_stat:
-            user_info['up_stat'] = up_stat
+            user_info.up_stat = up_stat
 
         return user_info
     
-    def save_user_info(self, user_info: dict = None) -> bool:
+    def save_user_info(self, user_info: UserRecord = None) -> bool:
         '''
         保存用户信息到文件
         
@@ -179,12 +157,12 @@ class UserInfo(BiliCrawler):
             return False
 
         with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(user_info, f, ensure_ascii=False, indent=2)
+            json.dump(user_info.to_dict(), f, ensure_ascii=False, indent=2)
         
         print(f"用户信息已保存到: {self.data_file}")
         return True
     
-    def print_user_info(self, user_info: dict = None):
+    def print_user_info(self, user_info: UserRecord = None):
         '''
         打印用户信息
         
@@ -199,30 +177,30 @@ class UserInfo(BiliCrawler):
         print("\n" + "=" * 50)
         print("用户基本信息")
         print("=" * 50)
-        print(f"昵称: {user_info.get('name')}")
-        print(f"UID: {user_info.get('mid')}")
-        print(f"性别: {user_info.get('sex')}")
-        print(f"等级: LV{user_info.get('level')}")
-        print(f"签名: {user_info.get('sign', '')[:50]}...")
+        print(f"昵称: {user_info.name}")
+        print(f"UID: {user_info.mid}")
+        print(f"性别: {user_info.sex}")
+        print(f"等级: LV{user_info.level}")
+        print(f"签名: {(user_info.sign or '')[:50]}...")
 
-        if user_info.get('vip', {}).get('status'):
-            print(f"会员: {user_info['vip'].get('label', '大会员')}")
+        if user_info.vip_status:
+            print(f"会员: {user_info.vip_label or '大会员'}")
         
-        if user_info.get('official', {}).get('title'):
-            print(f"认证:{user_info['official']['title']}")
+        if user_info.official_title:
+            print(f"认证:{user_info.official_title}")
 
-        if user_info.get('stat'):
+        if user_info.stat:
             print("\n" + '-' * 30)
             print("关系统计: \n")
-            print(f"    关注: {format_number(user_info['stat'].get('following', 0))}")
-            print(f"    粉丝: {format_number(user_info['stat'].get('follower', 0))}")
+            print(f"    关注: {format_number(user_info.stat.get('following', 0))}")
+            print(f"    粉丝: {format_number(user_info.stat.get('follower', 0))}")
 
-        if user_info.get('up_stat'):
+        if user_info.up_stat:
             print("\n" + "-" * 30)
             print("  UP主统计:")
-            print(f"    播放量: {format_number(user_info['up_stat'].get('archive_view', 0))}")
-            print(f"    阅读量: {format_number(user_info['up_stat'].get('article_view', 0))}")
-            print(f"    获赞数: {format_number(user_info['up_stat'].get('likes', 0))}")
+            print(f"    播放量: {format_number(user_info.up_stat.get('archive_view', 0))}")
+            print(f"    阅读量: {format_number(user_info.up_stat.get('article_view', 0))}")
+            print(f"    获赞数: {format_number(user_info.up_stat.get('likes', 0))}")
         
         print("=" * 50)
 
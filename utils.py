@@ -1,6 +1,9 @@
 
 import csv
 import os
+import sys
+
+from profiler import span
 
 def format_number(num: int) -> str:
     '''
@@ -16,6 +19,20 @@ def format_number(num: int) -> str:
     return str(num)
 
 
+def format_duration(seconds: int) -> str:
+    '''
+    格式化时长(65 -> 01:05, 3661 -> 1:01:01)
+
+    :param seconds: 秒数
+    :return: str: 格式化之后的时长
+    '''
+    minutes, secs = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours > 0:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
 def timestamp_to_datetime(timestamp:int) -> str:
     """
     时间戳转换为日期时间字符串
@@ -63,4 +80,90 @@ def write2csv(file: str, row: list):
     
     with open(file, mode='a', newline='', encoding='utf-8-sig') as csvfile:
         writer = csv.writer(csvfile)
-        writer.writerow(row)
\ No newline at end of file
+        writer.writerow(row)
+
+def write_rows(file: str, rows, heads: list = None) -> int:
+    """
+    向CSV文件批量追加多行数据(只打开一次文件, 适合流式写入大量记录)
+    Args:
+        file: CSV文件路径
+        rows: 可迭代的行数据
+        heads: 表头列表(文件不存在时写入)
+    Returns:
+        int: 写入的行数
+    """
+    if heads is not None:
+        write_head(file, heads)
+    else:
+        dir_path = os.path.dirname(file)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+
+    count = 0
+    with open(file, mode='a', newline='', encoding='utf-8-sig') as csvfile:
+        writer = csv.writer(csvfile)
+        for row in rows:
+            # 只统计写入的时间, 不包括生成行(爬取)的时间
+            with span('write'):
+                writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_varint(buf: bytearray, value: int):
+    """
+    向缓冲区追加一个无符号varint(每字节7位, 最高位表示后面还有字节)
+    Args:
+        buf: 缓冲区
+        value: 非负整数
+    """
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def read_varint(data, pos: int) -> tuple:
+    """
+    从pos处读取一个无符号varint
+    Args:
+        data: bytes/bytearray/memoryview
+        pos: 起始位置
+    Returns:
+        tuple: (值, 下一个位置)
+    Raises:
+        IndexError: 数据不完整
+    """
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def read_keys(source: str) -> list:
+    '''
+    读取输入列表, 每行一个BV号/MID, 忽略空行和#开头的注释
+
+    :param source: 文件路径, '-' 表示标准输入
+    :return: key列表(保持顺序并去重)
+    '''
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+
+    keys = []
+    seen = set()
+    for line in lines:
+        key = line.strip()
+        if not key or key.startswith('#') or key in seen:
+            continue
+        seen.add(key)
+        keys.append(key)
+    return keys
@@ -2,20 +2,41 @@
 获取一个视频的基本信息: 时长、点赞投币、评论、简介、tag
 '''
 
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
-from config import BiliAPI
+import schemas
+from breaker import CIRCUIT_OPEN_CODE
+from config import BiliAPI, DATA_DIR
 from crawler import BiliCrawler
+from dedup_index import COMMENTS, REPLY, VIDEO
+from profiler import span
+from records import CommentRecord, VideoRecord, VideoStat
+from work_queue import TaskQueue
 
 
 class VideoInfo(BiliCrawler):
     '''
     视频信息爬取类
     '''
-    def __init__(self):
-        super().__init__()
+    def __init__(self, cookies: dict = None):
+        super().__init__(cookies=cookies)
+        # 评论接口熔断时被跳过的视频(BV号或AV号), 可以稍后用 crawl_comments 补爬
+        self.deferred_comments = []
+        # 变化检测: 每个视频的指纹和上次获取的标签/简介/评论
+        self.fingerprint_file = os.path.join(DATA_DIR, 'video_fingerprints.json')
+        self._fingerprints = None
+        self._fingerprint_lock = threading.Lock()
+        # 因指纹未变化而跳过的请求数
+        self.skipped = {'tags': 0, 'desc': 0, 'comments': 0}
+        # 跨运行去重索引(见 dedup_index.py), 设置后已经处理过的视频/评论在请求之前跳过
+        self.dedup = None
 
-    def get_video_info(self, bvid:str=None, aid:int=None) -> Optional[dict]:
+    def get_video_info(self, bvid:str=None, aid:int=None) -> Optional[VideoRecord]:
         '''
         获取视频的详细信息
         
@@ -24,7 +45,7 @@ class VideoInfo(BiliCrawler):
         :param 
             aid: int: 视频的AV号
         :return: 
-            dict | None: 视频信息
+            VideoRecord | None: 视频信息
         '''
         # 设置参数有bv号或者av号
         params = {}
@@ -36,7 +57,7 @@ class VideoInfo(BiliCrawler):
             print("请提供bvid或者aid")
             return None
 
-        resp = self._request(BiliAPI.VIDEO_INFO, params=params)
+        resp = self._request(BiliAPI.VIDEO_INFO, params=params, schema=schemas.VIDEO_INFO)
 
         # 如果resp返回的code不是0, 请求就是失败的
         if resp.get('code') != 0:
@@ -45,36 +66,20 @@ class VideoInfo(BiliCrawler):
             return None
         
         # 获取数据
-        data = resp['data']
-
-        video_info = {
-            'bvid': data.get('bvid'),
-            'aid': data.get('aid'),
-            'title': data.get('title'),
-            'desc': data.get('desc', ''),
-            'duration': data.get('duration', 0),  # 秒
-            'duration_str': self.format_duration(data.get('duration', 0)),
-            'pubdate': data.get('pubdate'),
-            'ctime': data.get('ctime'),
-            'owner': {
-                'mid': data.get('owner', {}).get('mid'),
-                'name': data.get('owner', {}).get('name'),
-                'face': data.get('owner', {}).get('face'),
-            },
-            'stat': {
-                'view': data.get('stat', {}).get('view', 0),  # 播放
-                'danmaku': data.get('stat', {}).get('danmaku', 0),  # 弹幕
-                'reply': data.get('stat', {}).get('reply', 0),  # 评论
-                'favorite': data.get('stat', {}).get('favorite', 0),  # 收藏
-                'coin': data.get('stat', {}).get('coin', 0),  # 投币
-                'share': data.get('stat', {}).get('share', 0),  # 分享
-                'like': data.get('stat', {}).get('like', 0),  # 点赞
-            },
-            'pic': data.get('pic'),  # 封面
-            'tname': data.get('tname'),  # 分区名
-        }
+        return VideoRecord.from_api(resp['data'])
 
-        return video_info
+    def get_video_stat(self, bvid: str) -> Optional[VideoStat]:
+        '''
+        只获取视频的统计数据(播放、点赞、投币等), 只解码响应中的stat部分
+
+        :param bvid: 视频的BV号
+        :return: VideoStat | None: 统计数据, 失败返回None
+        '''
+        resp = self._request(BiliAPI.VIDEO_INFO, params={'bvid': bvid}, schema=schemas.VIDEO_STAT)
+        if resp.get('code') != 0:
+            print(f"获取视频数据失败({bvid}): {resp.get('message')}")
+            return None
+        return VideoStat.from_api(resp['data'].get('stat'))
     
     def get_video_tags(self, bvid:str=None, aid:int=None) -> list:
         """
@@ -96,7 +101,7 @@ class VideoInfo(BiliCrawler):
             return []
         
         # 请求一下视频的tags
-        resp = self._request(BiliAPI.VIDEO_TAGS, params=params)
+        resp = self._request(BiliAPI.VIDEO_TAGS, params=params, schema=schemas.VIDEO_TAGS)
 
         # code为0才有效
         if resp.get('code') != 0:
@@ -111,6 +116,30 @@ class VideoInfo(BiliCrawler):
         
         return tags
     
+    def get_video_desc(self, bvid:str=None, aid:int=None) -> Optional[str]:
+        """
+        获取视频完整简介(视频详情中的简介可能被截断)
+        Args:
+            bvid: 视频BV号
+            aid: 视频AV号
+        Returns:
+            str: 简介, 失败返回None
+        """
+        params = {}
+        if bvid:
+            params['bvid'] = bvid
+        elif aid:
+            params['aid'] = aid
+        else:
+            return None
+
+        resp = self._request(BiliAPI.VIDEO_DESC, params=params)
+        if resp.get('code') != 0:
+            print(f"获取视频简介失败: {resp.get('message')}")
+            return None
+
+        return resp.get('data') or ''
+
     def get_video_comments(self, bvid:str=None, aid:int=None, sort:int=1, count:int=10) -> list:
         """
         获取视频热门评论
@@ -120,14 +149,14 @@ class VideoInfo(BiliCrawler):
             sort: 排序方式 0=时间 1=点赞数(热度) 2=回复数
             count: 获取数量
         Returns:
-            list: 评论列表
+            list: 评论列表(CommentRecord)
         """
         # 如果只有bvid需要先获取aid
         original_bvid = bvid
         if bvid and not aid:
             video_info = self.get_video_info(bvid=bvid)
             if video_info:
-                aid = video_info['aid']
+                aid = video_info.aid
             else:
                 return []
             
@@ -140,32 +169,87 @@ class VideoInfo(BiliCrawler):
         }
 
         # 使用专门的评论请求方法，带重试和反爬处理
-        resp = self._request_reply(BiliAPI.REPLY_MAIN, params=params, bvid=original_bvid)
+        resp = self._request_reply(BiliAPI.REPLY_MAIN, params=params, bvid=original_bvid,
+                                   schema=schemas.REPLY_MAIN)
 
         if resp.get('code') != 0:
+            if resp.get('code') == CIRCUIT_OPEN_CODE:
+                self.deferred_comments.append(original_bvid or aid)
             print(f"获取评论失败: {resp.get('message')}")
             return []
         
-        comments = []
         replies = resp.get('data', {}).get('replies', []) or []
 
-        for reply in replies[:count]:
-            comments.append({
-                'rpid': reply.get('rpid'),
-                'content': reply.get('content', {}).get('message', ''),
-                'member': {
-                    'mid': reply.get('member', {}).get('mid'),
-                    'uname': reply.get('member', {}).get('uname'),
-                },
-                'like': reply.get('like', 0),
-                'rcount': reply.get('rcount', 0),  # 回复数
-                'ctime': reply.get('ctime'),
-            })
+        comments = [CommentRecord.from_api(reply, oid=aid) for reply in replies[:count]]
         
         return comments
     
+    def crawl_comments(self, bvids: list, sort: int = 1, count: int = 20,
+                       checkpoint_file: str = None, retry_failed: bool = False,
+                       index=None) -> dict:
+        """
+        带检查点批量获取视频评论, 中断后重新运行只获取未完成/失败的视频
+        Args:
+            bvids: 视频BV号列表
+            sort: 排序方式 0=时间 1=点赞数(热度) 2=回复数
+            count: 每个视频获取的评论数量
+            checkpoint_file: 检查点文件, 默认为 data/checkpoint.sqlite3
+            retry_failed: 是否重试上次失败的视频
+            index: 全文索引(SearchIndex), 传入时获取到的评论同时加入索引
+        Returns:
+            dict: {bvid: 评论列表(CommentRecord)}, 失败的视频不包含在内;
+                  设置了 dedup 时不包含之前运行已经获取过评论的视频, 评论也只包含新的;
+                  视频本身由调用方在保存评论之后记录(dedup.add(COMMENTS, bvid))
+        """
+        dedup = self.dedup
+        if dedup is not None:
+            todo = dedup.filter_new(COMMENTS, bvids)
+            if len(todo) < len(bvids):
+                print(f"  {len(bvids) - len(todo)} 个视频的评论已经获取过, 跳过")
+            bvids = todo
+        checkpoint_file = checkpoint_file or os.path.join(DATA_DIR, 'checkpoint.sqlite3')
+        with TaskQueue(checkpoint_file, f'comments:{sort}:{count}') as checkpoint:
+            if retry_failed:
+                checkpoint.retry_failed()
+            with checkpoint.transaction():
+                for bvid in bvids:
+                    checkpoint.add(bvid, endpoint=BiliAPI.REPLY_MAIN, params={'bvid': bvid})
+
+            def fetch(task):
+                video_info = self.get_video_info(bvid=task.key)
+                if not video_info:
+                    return None
+                comments = self.get_video_comments(bvid=task.key, aid=video_info.aid,
+                                                   sort=sort, count=count)
+                # 获取失败和没有评论都返回空列表, 有评论的视频才算失败
+                if not comments and video_info.stat.reply:
+                    return None
+                if dedup is not None:
+                    comments = [c for c in comments if dedup.add(REPLY, c.rpid)]
+                if index is not None:
+                    index.add_comments(comments, bvid=task.key, owner_mid=video_info.owner_mid)
+                return [c.to_dict() for c in comments]
+
+            counts = checkpoint.run(fetch)
+            if index is not None:
+                index.flush()
+            if dedup is not None:
+                dedup.flush()
+            print(f"评论获取完成: 成功 {counts['done']}, 失败 {counts['failed']}")
+
+            wanted = set(bvids)
+            comments = {
+                task.key: [CommentRecord.from_dict(c) for c in result]
+                for task, result in checkpoint.results()
+                if result is not None and task.key in wanted
+            }
+            # 检查点只用于中断后续爬, 结果返回后删除已完成的视频, 下一次运行重新获取
+            checkpoint.clear_done()
+            return comments
+
     def get_full_video_details(self, bvid:str=None, aid:str=None,
-                               include_comments:bool=True, comment_count:int=10) -> Optional[dict]:
+                               include_comments:bool=True, comment_count:int=10,
+                               include_desc:bool=False, incremental:bool=False) -> Optional[VideoRecord]:
         """
         获取视频完整详情（包含基本信息、标签、评论）
         Args:
@@ -173,28 +257,159 @@ class VideoInfo(BiliCrawler):
             aid: 视频AV号
             include_comments: 是否包含评论
             comment_count: 评论数量
+            include_desc: 是否单独获取完整简介
+            incremental: 指纹未变化时使用上次获取的标签/简介/评论, 不再请求
+                (结果需要调用 save_fingerprints 保存)
         Returns:
-            dict: 完整视频信息
+            VideoRecord: 完整视频信息
         """
         # 获取基本信息
         video_info = self.get_video_info(bvid=bvid, aid=aid)
         if not video_info:
             return None
+
+        entry = {}
+        meta = None
+        if incremental:
+            entry = dict(self._load_fingerprints().get(video_info.bvid) or {})
+            meta = self._meta_fingerprint(video_info)
+            # 标题/简介/时长等没变时, 标签和完整简介也认为没变
+            if entry.get('meta') != meta:
+                entry.pop('tags', None)
+                entry.pop('desc', None)
+                entry['meta'] = meta
         
         # 获取tags
-        tags = self.get_video_tags(bvid=video_info['bvid'])
-        video_info['tags'] = tags
+        if 'tags' in entry:
+            video_info.tags = entry['tags']
+            self._count_skip('tags')
+        else:
+            tags = self.get_video_tags(bvid=video_info.bvid)
+            video_info.tags = [t['tag_name'] for t in tags]
+            entry['tags'] = video_info.tags
+
+        # 获取完整简介
+        if include_desc:
+            if entry.get('desc') is not None:
+                video_info.desc = entry['desc']
+                self._count_skip('desc')
+            else:
+                desc = self.get_video_desc(bvid=video_info.bvid)
+                if desc is not None:
+                    video_info.desc = desc
+                    entry['desc'] = desc
 
         # 获取热门评论
         if include_comments:
-            comments = self.get_video_comments(
-                aid = video_info['aid'],
-                sort=1,
-                count=comment_count
-            )
-            video_info['top_comments'] = comments
+            # 评论数没变并且上次获取的数量足够时, 使用上次的评论
+            if entry.get('reply') == video_info.stat.reply and \
+                    entry.get('comment_count', -1) >= comment_count:
+                video_info.top_comments = [
+                    CommentRecord.from_dict(c) for c in entry['comments'][:comment_count]
+                ]
+                self._count_skip('comments')
+            else:
+                comments = self.get_video_comments(
+                    bvid = video_info.bvid,
+                    aid = video_info.aid,
+                    sort=1,
+                    count=comment_count
+                )
+                video_info.top_comments = comments
+                # 有评论却没获取到(失败)时不记录, 下次重新获取
+                if comments or not video_info.stat.reply:
+                    entry['reply'] = video_info.stat.reply
+                    entry['comment_count'] = comment_count
+                    entry['comments'] = [c.to_dict() for c in comments]
+
+        if incremental:
+            with self._fingerprint_lock:
+                self._fingerprints[video_info.bvid] = entry
         
         return video_info
+
+    @staticmethod
+    def _meta_fingerprint(video_info: VideoRecord) -> str:
+        '''
+        视频元数据的指纹: 标题、简介、时长、发布时间, 稿件修改后会变化
+        '''
+        raw = json.dumps([video_info.title, video_info.desc, video_info.duration,
+                          video_info.pubdate, video_info.ctime], ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _count_skip(self, name: str):
+        with self._fingerprint_lock:
+            self.skipped[name] += 1
+
+    def _load_fingerprints(self) -> dict:
+        if self._fingerprints is None:
+            with self._fingerprint_lock:
+                if self._fingerprints is None:
+                    fingerprints = {}
+                    if os.path.exists(self.fingerprint_file):
+                        with open(self.fingerprint_file, 'r', encoding='utf-8') as f:
+                            fingerprints = json.load(f)
+                    self._fingerprints = fingerprints
+        return self._fingerprints
+
+    def save_fingerprints(self):
+        '''
+        保存视频指纹(先写临时文件再替换)
+        '''
+        if self._fingerprints is None:
+            return
+        dir_path = os.path.dirname(self.fingerprint_file)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        with self._fingerprint_lock:
+            tmp_file = self.fingerprint_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._fingerprints, f, ensure_ascii=False)
+            os.replace(tmp_file, self.fingerprint_file)
+
+    def enrich_videos(self, bvids: list, workers: int = 4, include_desc: bool = False,
+                      incremental: bool = False) -> dict:
+        """
+        并发获取一批视频的完整详情(不含评论)
+
+        相同视频的请求会被合并/缓存(见 BiliCrawler._coalesce), 重复的BV号不会重复请求
+        Args:
+            bvids: 视频BV号列表
+            workers: 并发数
+            include_desc: 是否单独获取完整简介
+            incremental: 指纹未变化的视频不再请求标签/简介, 结束后保存指纹
+        Returns:
+            dict: {bvid: VideoRecord}, 获取失败的视频不包含在内;
+                  设置了 dedup 时也不包含之前运行已经获取过的视频
+        """
+        unique = list(dict.fromkeys(b for b in bvids if b))
+        if self.dedup is not None:
+            todo = self.dedup.filter_new(VIDEO, unique)
+            if len(todo) < len(unique):
+                print(f"  {len(unique) - len(todo)} 个视频已经获取过, 跳过")
+            unique = todo
+        details = {}
+        before = dict(self.skipped)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            def enrich(bvid):
+                with span('enrich'):
+                    return self.get_full_video_details(bvid=bvid, include_comments=False,
+                                                       include_desc=include_desc,
+                                                       incremental=incremental)
+
+            for bvid, detail in zip(unique, executor.map(enrich, unique)):
+                if detail:
+                    details[bvid] = detail
+                    if self.dedup is not None:
+                        self.dedup.add(VIDEO, bvid)
+
+        if self.dedup is not None:
+            self.dedup.flush()
+        if incremental:
+            self.save_fingerprints()
+            skipped = {k: self.skipped[k] - before[k] for k in self.skipped}
+            print(f"  未变化跳过: 标签 {skipped['tags']} 次, 简介 {skipped['desc']} 次")
+        return details
     
 if __name__ == '__main__':
     video = VideoInfo()
@@ -202,11 +417,11 @@ if __name__ == '__main__':
     # 测试获取视频信息
     info = video.get_full_video_details(bvid='BV1mnvxBqEvj')
     if info:
-        print(f"标题: {info['title']}")
-        print(f"时长: {info['duration_str']}")
-        print(f"播放: {info['stat']['view']}")
-        print(f"点赞: {info['stat']['like']}")
-        print(f"投币: {info['stat']['coin']}")
-        print(f"收藏: {info['stat']['favorite']}")
-        print(f"标签: {[t['tag_name'] for t in info['tags']]}")
-        print(f"评论数: {len(info.get('top_comments', []))}")
\ No newline at end of file
+        print(f"标题: {info.title}")
+        print(f"时长: {info.duration_str}")
+        print(f"播放: {info.stat.view}")
+        print(f"点赞: {info.stat.like}")
+        print(f"投币: {info.stat.coin}")
+        print(f"收藏: {info.stat.favorite}")
+        print(f"标签: {info.tags}")
+        print(f"评论数: {len(info.top_comments or [])}")
\ No newline at end of file
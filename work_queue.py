@@ -0,0 +1,520 @@
+'''
+基于SQLite的工作队列
+
+WorkQueue: 多个进程共享同一个队列文件, 通过租约(lease)领取任务:
+    领取后在 lease_until 之前归领取者所有, 完成后 ack
+    进程崩溃时租约过期, 任务会被其他进程重新领取
+TaskQueue: 单个爬虫的持久化检查点, 中断后从停下的位置继续, 只重新执行未完成/失败的任务
+'''
+
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+# 任务状态
+PENDING = 'pending'
+LEASED = 'leased'  # WorkQueue: 已被某个进程领取
+RUNNING = 'running'  # TaskQueue: 正在执行
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WorkQueue:
+    '''
+    带租约的工作队列
+    '''
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        '''
+        :param path: 队列数据库文件路径
+        :param timeout: 数据库被锁时的等待时间(秒)
+        '''
+        dir_path = os.path.dirname(path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_until REAL,
+                error TEXT,
+                updated_at REAL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_items_status ON items(status, lease_until)')
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, keys: Iterable[str]) -> int:
+        '''
+        批量添加任务, 已存在的key会被忽略
+
+        :param keys: 任务key(如BV号)
+        :return: 新增的任务数
+        '''
+        now = time.time()
+        before = self.conn.total_changes
+        self.conn.execute('BEGIN')
+        try:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO items (key, updated_at) VALUES (?, ?)',
+                ((key, now) for key in keys),
+            )
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return self.conn.total_changes - before
+
+    def lease(self, owner: str, limit: int = 1, lease_seconds: float = 300.0) -> list:
+        '''
+        领取任务(包括租约已过期的任务)
+
+        :param owner: 领取者标识
+        :param limit: 最多领取数量
+        :param lease_seconds: 租约时长
+        :return: [(id, key), ...]
+        '''
+        now = time.time()
+        # IMMEDIATE 事务保证多个进程不会领取到同一个任务
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = self.conn.execute(
+                '''
+                SELECT id, key FROM items
+                WHERE status = ? OR (status = ? AND lease_until < ?)
+                ORDER BY id LIMIT ?
+                ''',
+                (PENDING, LEASED, now, limit),
+            ).fetchall()
+            self.conn.executemany(
+                '''
+                UPDATE items SET status = ?, owner = ?, lease_until = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE id = ?
+                ''',
+                ((LEASED, owner, now + lease_seconds, now, row[0]) for row in rows),
+            )
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return rows
+
+    def ack(self, item_id: int):
+        '''
+        标记任务完成
+        '''
+        self.conn.execute(
+            'UPDATE items SET status = ?, owner = NULL, lease_until = NULL, error = NULL, updated_at = ? WHERE id = ?',
+            (DONE, time.time(), item_id),
+        )
+
+    def fail(self, item_id: int, error: str = '', max_attempts: int = 3):
+        '''
+        标记任务失败, 未超过最大次数时重新放回队列
+
+        :param item_id: 任务ID
+        :param error: 失败原因
+        :param max_attempts: 最大尝试次数
+        '''
+        self.conn.execute(
+            '''
+            UPDATE items SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                owner = NULL, lease_until = NULL, error = ?, updated_at = ?
+            WHERE id = ?
+            ''',
+            (max_attempts, FAILED, PENDING, error, time.time(), item_id),
+        )
+
+    def retry_failed(self) -> int:
+        '''
+        把失败的任务重新放回队列
+
+        :return: 重置的任务数
+        '''
+        cursor = self.conn.execute(
+            'UPDATE items SET status = ?, attempts = 0, updated_at = ? WHERE status = ?',
+            (PENDING, time.time(), FAILED),
+        )
+        return cursor.rowcount
+
+    def counts(self) -> dict:
+        '''
+        各状态的任务数
+
+        :return: {状态: 数量}
+        '''
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        for status, count in self.conn.execute('SELECT status, COUNT(*) FROM items GROUP BY status'):
+            counts[status] = count
+        return counts
+
+    def remaining(self) -> int:
+        '''
+        未完成(等待中或已领取)的任务数
+        '''
+        counts = self.counts()
+        return counts[PENDING] + counts[LEASED]
+
+    def get(self, key: str) -> Optional[dict]:
+        '''
+        查询单个任务
+
+        :param key: 任务key
+        :return: 任务信息, 不存在返回None
+        '''
+        row = self.conn.execute(
+            'SELECT id, key, status, attempts, owner, lease_until, error FROM items WHERE key = ?',
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        names = ('id', 'key', 'status', 'attempts', 'owner', 'lease_until', 'error')
+        return dict(zip(names, row))
+
+
+class Task:
+    '''
+    检查点中的单个任务
+    '''
+    __slots__ = ('id', 'key', 'endpoint', 'params', 'payload', 'status', 'attempts', 'error')
+
+    def __init__(self, id, key, endpoint, params, payload, status, attempts, error):
+        self.id = id
+        self.key = key
+        self.endpoint = endpoint
+        self.params = json.loads(params) if params else {}
+        self.payload = json.loads(payload) if payload else None
+        self.status = status
+        self.attempts = attempts
+        self.error = error
+
+    def __repr__(self) -> str:
+        return f'Task({self.key!r}, status={self.status!r}, attempts={self.attempts})'
+
+
+class TaskQueue:
+    '''
+    持久化的任务队列(检查点)
+
+    每个任务记录要请求的接口和参数、状态、尝试次数和结果指针(results表的行号),
+    程序中断后使用相同的文件和job名重新运行, 已完成的任务直接读取结果, 只重新执行未完成/失败的任务
+    '''
+
+    _TASK_COLUMNS = 'id, key, endpoint, params, payload, status, attempts, error'
+
+    def __init__(self, path: str, job: str, timeout: float = 30.0):
+        '''
+        :param path: 检查点数据库文件路径
+        :param job: 任务组名, 同一个文件可以保存多个任务组
+        :param timeout: 数据库被锁时的等待时间(秒)
+        '''
+        dir_path = os.path.dirname(path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+
+        self.path = path
+        self.job = job
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY,
+                job TEXT NOT NULL,
+                key TEXT NOT NULL,
+                endpoint TEXT,
+                params TEXT,
+                payload TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result_id INTEGER,
+                error TEXT,
+                updated_at REAL,
+                UNIQUE (job, key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(job, status);
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_state (
+                job TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value TEXT,
+                PRIMARY KEY (job, name)
+            );
+        ''')
+        # 上次运行被中断时仍在执行的任务, 重新放回队列
+        self.conn.execute(
+            'UPDATE tasks SET status = ? WHERE job = ? AND status = ?',
+            (PENDING, job, RUNNING),
+        )
+        self._depth = 0
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        '''
+        把多次写入合并为一个事务(可嵌套), 保证检查点的一致性
+        '''
+        if self._depth:
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+
+        self.conn.execute('BEGIN IMMEDIATE')
+        self._depth = 1
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        else:
+            self.conn.execute('COMMIT')
+        finally:
+            self._depth = 0
+
+    def add(self, key: str, endpoint: str = None, params: dict = None, payload=None) -> bool:
+        '''
+        添加任务, 已存在的key会被忽略
+
+        :param key: 任务的唯一标识
+        :param endpoint: 要请求的接口
+        :param params: 请求参数
+        :param payload: 任务附带的数据(可JSON序列化)
+        :return: 是否新增
+        '''
+        cursor = self.conn.execute(
+            '''
+            INSERT OR IGNORE INTO tasks (job, key, endpoint, params, payload, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''',
+            (
+                self.job, key, endpoint,
+                json.dumps(params, ensure_ascii=False) if params else None,
+                json.dumps(payload, ensure_ascii=False) if payload is not None else None,
+                time.time(),
+            ),
+        )
+        return cursor.rowcount > 0
+
+    def get_state(self, name: str, default=None):
+        '''
+        读取任务组的状态(如翻页游标)
+        '''
+        row = self.conn.execute(
+            'SELECT value FROM job_state WHERE job = ? AND name = ?',
+            (self.job, name),
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_state(self, name: str, value):
+        '''
+        保存任务组的状态
+        '''
+        self.conn.execute(
+            'INSERT OR REPLACE INTO job_state (job, name, value) VALUES (?, ?, ?)',
+            (self.job, name, json.dumps(value, ensure_ascii=False)),
+        )
+
+    def pending(self, include_failed: bool = False, batch: int = 100) -> Iterator[Task]:
+        '''
+        迭代需要执行的任务(按添加顺序)
+
+        :param include_failed: 是否包括已失败的任务
+        :param batch: 每次从数据库读取的数量
+        :yields: Task
+        '''
+        statuses = (PENDING, FAILED) if include_failed else (PENDING, PENDING)
+        last_id = 0
+        while True:
+            rows = self.conn.execute(
+                f'''
+                SELECT {self._TASK_COLUMNS} FROM tasks
+                WHERE job = ? AND status IN (?, ?) AND id > ?
+                ORDER BY id LIMIT ?
+                ''',
+                (self.job, *statuses, last_id, batch),
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                last_id = row[0]
+                yield Task(*row)
+
+    def start(self, task: Task):
+        '''
+        标记任务开始执行
+        '''
+        self.conn.execute(
+            'UPDATE tasks SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?',
+            (RUNNING, time.time(), task.id),
+        )
+        task.status = RUNNING
+        task.attempts += 1
+
+    def complete(self, task: Task, result=None):
+        '''
+        标记任务完成并保存结果
+
+        :param task: 任务
+        :param result: 结果(可JSON序列化), 保存到results表, 任务中只记录行号
+        '''
+        with self.transaction():
+            result_id = None
+            if result is not None:
+                result_id = self.conn.execute(
+                    'INSERT INTO results (data) VALUES (?)',
+                    (json.dumps(result, ensure_ascii=False),),
+                ).lastrowid
+            self.conn.execute(
+                'UPDATE tasks SET status = ?, result_id = ?, error = NULL, updated_at = ? WHERE id = ?',
+                (DONE, result_id, time.time(), task.id),
+            )
+        task.status = DONE
+
+    def fail(self, task: Task, error: str = '', max_attempts: int = 3):
+        '''
+        标记任务失败, 未超过最大次数时保持等待状态(同一次运行中可以再次执行)
+
+        :param task: 任务
+        :param error: 失败原因
+        :param max_attempts: 最大尝试次数
+        '''
+        status = FAILED if task.attempts >= max_attempts else PENDING
+        self.conn.execute(
+            'UPDATE tasks SET status = ?, error = ?, updated_at = ? WHERE id = ?',
+            (status, error, time.time(), task.id),
+        )
+        task.status = status
+        task.error = error
+
+    def reset(self):
+        '''
+        删除任务组的所有任务、结果和状态, 重新开始
+        '''
+        with self.transaction():
+            self.conn.execute(
+                'DELETE FROM results WHERE id IN (SELECT result_id FROM tasks WHERE job = ?)',
+                (self.job,),
+            )
+            self.conn.execute('DELETE FROM tasks WHERE job = ?', (self.job,))
+            self.conn.execute('DELETE FROM job_state WHERE job = ?', (self.job,))
+
+    def clear_done(self) -> int:
+        '''
+        删除已完成的任务和结果(保留等待中和失败的任务), 之后再加入相同的key会重新执行
+
+        :return: 删除的任务数
+        '''
+        with self.transaction():
+            self.conn.execute(
+                'DELETE FROM results WHERE id IN (SELECT result_id FROM tasks WHERE job = ? AND status = ?)',
+                (self.job, DONE),
+            )
+            cursor = self.conn.execute('DELETE FROM tasks WHERE job = ? AND status = ?', (self.job, DONE))
+        return cursor.rowcount
+
+    def retry_failed(self) -> int:
+        '''
+        把失败的任务重新放回队列
+
+        :return: 重置的任务数
+        '''
+        cursor = self.conn.execute(
+            'UPDATE tasks SET status = ?, attempts = 0, updated_at = ? WHERE job = ? AND status = ?',
+            (PENDING, time.time(), self.job, FAILED),
+        )
+        return cursor.rowcount
+
+    def run(self, handler: Callable[[Task], Any], max_attempts: int = 3,
+            include_failed: bool = False) -> dict:
+        '''
+        依次执行等待中的任务
+
+        handler 返回结果表示成功(返回值作为结果保存), 返回None或抛出异常表示失败
+        KeyboardInterrupt 会原样抛出, 已完成的任务不受影响
+
+        :param handler: 任务处理函数
+        :param max_attempts: 最大尝试次数
+        :param include_failed: 是否重新执行已失败的任务
+        :return: 各状态的任务数
+        '''
+        # 失败后放回等待状态的任务在游标之前, 需要再遍历一轮, 直到没有等待中的任务
+        while True:
+            executed = 0
+            for task in self.pending(include_failed=include_failed):
+                executed += 1
+                self.start(task)
+                try:
+                    result = handler(task)
+                except Exception as e:
+                    self.fail(task, error=repr(e), max_attempts=max_attempts)
+                    continue
+                if result is None:
+                    self.fail(task, error='请求失败', max_attempts=max_attempts)
+                else:
+                    self.complete(task, result)
+            # 只在第一轮重新执行已失败的任务
+            include_failed = False
+            if not executed or not self.counts()[PENDING]:
+                return self.counts()
+
+    def results(self) -> Iterator[tuple]:
+        '''
+        按添加顺序迭代任务和结果
+
+        :yields: (Task, 结果), 未完成的任务结果为None
+        '''
+        cursor = self.conn.execute(
+            '''
+            SELECT t.id, t.key, t.endpoint, t.params, t.payload, t.status, t.attempts, t.error, r.data
+            FROM tasks t LEFT JOIN results r ON r.id = t.result_id
+            WHERE t.job = ? ORDER BY t.id
+            ''',
+            (self.job,),
+        )
+        for row in cursor:
+            yield Task(*row[:-1]), (json.loads(row[-1]) if row[-1] else None)
+
+    def counts(self) -> dict:
+        '''
+        各状态的任务数
+
+        :return: {状态: 数量}
+        '''
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for status, count in self.conn.execute(
+                'SELECT status, COUNT(*) FROM tasks WHERE job = ? GROUP BY status', (self.job,)):
+            counts[status] = count
+        return counts